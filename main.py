@@ -5,29 +5,62 @@ import time
 import signal
 import os
 import sys
+import socket
 from datetime import datetime, timedelta
 import okx.MarketData as MarketData
 import okx.TradingData as TradingData_api
+import okx.PublicData as PublicData
 import okx.Account as Account  # 新增Account模块导入
 from okx.websocket.WsPublicAsync import WsPublicAsync
-from aiohttp import web
+from aiohttp import web, WSCloseCode
 import aiohttp_cors
 import threading
+import multiprocessing
 import copy
+import functools
+import bisect
+import heapq
+import itertools
+import zlib
+import gzip
+import random
 import gc
 import traceback
 from typing import Optional
-from collections import deque
+from collections import deque, OrderedDict
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 
+try:
+    import brotli  # 可选依赖，未安装时只提供gzip
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack  # 可选依赖，未安装时/ws只提供JSON格式
+except ImportError:
+    msgpack = None
+
 # 全局变量
 flag = "0"
 price_changes = {}
 running = True
 clients = set()  # 存储连接的WebSocket客户端
+client_views = {}  # 每个客户端订阅的视图（周期、过滤、自选、榜单大小、排序），见normalize_view
+client_wire_formats = {}  # 每个客户端连接时协商的消息格式: json / msgpack
+client_stream_positions = {}  # 每个客户端最后收到的广播位置 (通道ID, 序号)，停在上一节拍的客户端只收增量
+client_interest = {}  # 每个客户端榜单之外关注的产品（搜索、自选），用于按需订阅
 main_event_loop = None  # 存储主事件循环
+okx_event_loop = None  # OKX WebSocket线程的事件循环（订阅操作需要在该循环中执行）
+state_bus_server = None  # 多进程模式下采集进程的状态总线
+state_bus_client = None  # 多进程模式下Web工作进程订阅的状态总线，单进程模式为None
+cluster_node = None  # 集群模式下本节点的成员与选举状态
+okx_handler_task = None  # OKX线程中的总处理任务，集群节点让出领导权时取消
+listen_socket = None  # 单进程模式的HTTP监听套接字，平滑重启时交给新进程
+handoff_server = None  # 等待新进程接管的交接服务
+handoff_connection = None  # 新进程与旧进程的交接连接，OKX订阅就绪后通知旧进程退出
+handoff_state = None  # 从旧进程接管的内存状态，首次连接OKX时据此跳过REST初始化
 total_products = 0  # 初始获取的产品总数
 inst_ids = []  # 所有产品ID列表
 last_received_time = {}  # 记录每个产品最后收到数据的时间
@@ -52,13 +85,140 @@ DATA_CLEANUP_INTERVAL = 300  # 数据清理间隔（秒）
 # 重连配置
 RECONNECT_DELAY = 5  # 重连延迟（秒）
 MAX_RECONNECT_ATTEMPTS = 10  # 最大重连尝试次数
+
+# 热备冗余配置 - 每个数据源保持两条连接订阅相同频道，按消息去重，谁先到用谁
+REDUNDANT_FEEDS_ENABLED = False  # 是否启用热备冗余模式
+DEDUP_CACHE_SIZE = 20000  # 去重缓存的消息键数量
+FEED_STALL_SECONDS = 2  # 当前主用连接静默超过该时间后切换到另一条连接
+
+# 心跳保活配置 - OKX要求30秒内无消息时发送文本ping，服务端回复pong
+PING_IDLE_INTERVAL = 5  # 连续N秒未收到任何消息则发送ping
+PONG_TIMEOUT = 3  # 发送ping后等待pong的超时时间（秒），超时即判定连接失效
 reconnect_attempts = 0  # 当前重连尝试次数
 oi_reconnect_attempts = 0  # 持仓量重连尝试次数
+kline_gap_start = None  # K线断线时最后收到数据的时间，用于重连后补数据
+oi_gap_start = None  # 持仓量断线时最后收到数据的时间
 
 # API请求频率控制 - 优化为0.3秒一次，避免连接被终止
 API_RATE_LIMIT_DELAY = 0.3  # API请求间隔（秒），0.3秒=约3.3次/秒
 API_BATCH_SIZE = 1  # 每次只更新一个产品，实现连续更新
 
+# 产品选择配置
+UNIVERSE_SELECTION_MODE = "main_pairs"  # main_pairs: 主流币优先; liquidity: 按24h成交额排名
+UNIVERSE_RERANK_INTERVAL = 1800  # 成交额排名重新计算间隔（秒）
+UNIVERSE_ROTATION_MARGIN = 0.2  # 候选产品成交额需超过榜内最弱产品20%才替换，避免边缘来回切换
+UNIVERSE_MAX_ROTATIONS = 10  # 每次重新排名最多替换的产品数
+
+# 多周期K线聚合配置 - 只订阅一个细粒度K线频道，本地聚合为多个粗周期
+BASE_CANDLE_CHANNEL = "candle1m"  # 基础订阅频道
+BASE_CANDLE_BAR = "1m"  # 基础K线周期（REST补数据时使用）
+AGG_TIMEFRAMES = ["5m", "15m", "1H", "4H"]  # 本地聚合的周期
+REBUILD_LIVE_LIMIT = 30  # 用历史K线重建聚合期间每个产品最多记录的实时基础K线根数
+KLINE_GAP_MAX_PAGES = 5  # 断线补K线最多向前翻页次数（每页300根；K线接口只提供最近1440根）
+PRIMARY_TIMEFRAME = "1H"  # 主周期，对应原有的涨跌幅/1h成交量列
+
+# 按需订阅配置 - 只为客户端正在查看的产品保留高频WebSocket频道，其余降级为低频批量REST刷新
+DEMAND_DRIVEN_SUBSCRIPTIONS = False  # 是否启用按需订阅模式
+DEMAND_TOP_N = 50  # 每个客户端周期的涨/跌幅榜前N名视为正在查看
+DEMAND_RECONCILE_INTERVAL = 10  # 重新计算需求集合并调整订阅的间隔（秒）
+DEMAND_LINGER_SECONDS = 120  # 产品离开需求集合后继续保留高频订阅的时间，避免边缘来回订阅
+DEMAND_COLD_REFRESH_INTERVAL = 30  # 降级产品的批量REST刷新间隔（秒）
+
+# 客户端视图配置 - 服务端按客户端订阅的过滤/自选/排序计算榜单，相同视图共享计算结果
+VIEW_SORT_KEYS = ["change_rate", "volume_24h", "volume_1h", "oi_ccy", "oi_change_rate", "close_price"]
+DEFAULT_TABLE_SIZE = 50  # 默认每个榜单的行数
+MAX_TABLE_SIZE = 300  # 客户端可请求的最大行数
+MAX_WATCHLIST_SIZE = 100  # 自选列表最大产品数
+
+# /api/data响应缓存配置 - 同一数据节拍内的相同请求共用一份已编码的响应
+RESPONSE_CACHE_TICK = 1  # 数据节拍长度（秒），节拍内的多次数据修改共用一个版本
+RESPONSE_CACHE_SIZE = 64  # 缓存的视图响应数量
+
+# 传输压缩配置 - 用CPU换带宽，可按部署环境调整
+WS_COMPRESSION = True  # /ws协商permessage-deflate（客户端不支持时自动回退为不压缩）
+HTTP_COMPRESSION = True  # /api/data按Accept-Encoding返回br/gzip
+HTTP_GZIP_LEVEL = 6  # /api/data的gzip级别（1最快，9压缩率最高）
+HTTP_BROTLI_QUALITY = 5  # /api/data的brotli质量（0-11）
+HTTP_COMPRESS_MIN_BYTES = 512  # 小于该大小的响应不压缩
+STATIC_MAX_AGE = 300  # 首页HTML的浏览器缓存时间（秒），配合ETag重新验证
+
+# /ws二进制格式配置 - 客户端通过WebSocket子协议协商，未协商的连接仍使用JSON
+WS_MSGPACK_ENABLED = True  # 是否提供MessagePack格式（需要安装msgpack）
+WS_MSGPACK_PROTOCOL = "okx-monitor.msgpack.v1"  # 子协议名，格式变化时升级版本号
+# full_update行数据的固定列顺序，数值列传原始数字，格式化字符串由前端生成
+MSGPACK_ROW_COLUMNS = [
+    "inst_id", "display_id", "inst_type", "change_rate", "close_price", "volume_24h", "volume_1h",
+    "volume_freshness", "oi_ccy", "oi_change_rate", "oi_history_ccy", "timestamp", "tf_change_rates"
+]
+MSGPACK_STATS_FIELDS = ["total", "collected", "avg_change", "up_count", "down_count", "avg_oi_change"]
+
+# 广播通道配置 - 每个视图每个广播节拍只构建和编码一次，/ws和/api/stream共用
+BROADCAST_REPLAY_SIZE = 120  # 每个视图保留的增量条数（每秒一条），断线重连在此范围内只补发增量
+BROADCAST_CHANNEL_TTL = 60  # 视图无订阅者后继续构建增量的时间（秒），便于短暂断线后续传
+STREAM_QUEUE_SIZE = 32  # 每个SSE订阅者的待发送事件数，积压超出时丢弃积压并重发快照
+STREAM_HEARTBEAT = 15  # SSE空闲时发送注释行的间隔（秒），防止代理断开
+STREAM_RETRY_MS = 3000  # 建议EventSource断线后的重连间隔（毫秒）
+
+# 多进程模式配置 - 一个采集进程连接OKX并计算，多个Web工作进程共享端口服务客户端
+WEB_WORKERS = 0  # Web工作进程数，0为单进程模式（命令行 --workers N 覆盖）
+WEB_PORT = 8080
+STATE_BUS_PATH = "/tmp/okx-monitor-state.sock"  # 采集进程与Web工作进程之间的Unix套接字
+STATE_BUS_INTERVAL = 0.25  # 采集进程发布存储增量的间隔（秒）
+STATE_BUS_MAX_FRAME = 64 * 1024 * 1024  # 单个总线消息的最大字节数
+STATE_BUS_MAX_BUFFER = 8 * 1024 * 1024  # 工作进程积压超过该字节数时断开，重连后重新发送快照
+STATE_BUS_RECONNECT_DELAY = 1  # 工作进程与总线断开后的重连间隔（秒）
+STATE_BUS_COMMANDS = ("clear", "update_volumes", "update_oi_history", "restart")  # 工作进程转发给采集进程的命令
+
+# 集群配置 - 多台服务器各运行一个节点，只有当选的领导者节点连接OKX并发布存储增量，其他节点维护副本
+CLUSTER_ENABLED = False  # 命令行 --cluster [HOST:PORT] 开启
+CLUSTER_TRANSPORT = "tcp"  # 节点间的发布/订阅传输，可选值见CLUSTER_TRANSPORTS
+CLUSTER_BROKER_ADDRESS = "127.0.0.1:7600"  # 消息代理地址（python main.py --cluster-broker [PORT] 启动）
+CLUSTER_NODE_ID = None  # 节点ID，None时为"主机名-端口"；无存活领导者时ID最小的节点当选
+CLUSTER_HEARTBEAT_INTERVAL = 1  # 节点心跳间隔（秒）
+CLUSTER_LEADER_TIMEOUT = 5  # 超过该时间未收到领导者心跳即重新选举（秒）
+CLUSTER_PUBLISH_INTERVAL = 0.5  # 领导者发布存储增量的间隔（秒）
+CLUSTER_RECONNECT_DELAY = 2  # 与消息代理断开后的重连间隔（秒）
+
+# 平滑重启配置 - 新版本以 --takeover 启动，从运行中的进程接管监听端口和内存状态（单进程模式）
+HANDOFF_ENABLED = True  # 运行中的进程监听交接套接字，等待新进程接管
+HANDOFF_TAKEOVER = False  # 命令行 --takeover：启动时从运行中的进程接管，而不是重新连接和回填
+HANDOFF_PATH = "/tmp/okx-monitor-handoff.sock"
+HANDOFF_DRAIN_SECONDS = 10  # 旧进程在该时间内分批关闭现有客户端连接，避免所有客户端同时重连
+HANDOFF_RECEIVE_TIMEOUT = 30  # 新进程等待旧进程发来监听套接字和状态的最长时间（秒）
+
+# 告警规则配置 - price_store更新时只对发生变化的字段增量计算，触发的告警通过/ws推送
+ALERTS_ENABLED = True
+ALERT_HISTORY_SIZE = 500  # 保留的最近告警条数
+ALERT_HISTORY_SEND = 50  # 新连接收到的最近告警条数
+ALERT_DEFAULT_COOLDOWN = 600  # 同一规则对同一产品两次告警的最小间隔（秒）
+ALERT_RATE_SAMPLE_INTERVAL = 1  # 变化速度条件的采样间隔（秒），同一秒内的多次推送只保留最新值
+ALERT_DISPATCH_INTERVAL = 0.5  # 推送新告警的间隔（秒）
+ALERT_RULES_FILE = None  # JSON规则文件路径，格式同ALERT_RULES，设置后追加加载
+# 每条规则的所有条件同时满足时触发。条件字段: change_rate（主周期）、change_rate:5m 等周期涨跌幅，以及 VIEW_SORT_KEYS 中的字段
+#   above / below: 阈值，回落超过hysteresis后才重新生效
+#   cross_up / cross_down: 穿越阈值的那一次推送才算满足，回落超过hysteresis后才能再次穿越
+#   rise / fall: window秒内的变化量，relative为True时按百分比计算
+ALERT_RULES = [
+    {'id': 'pump_with_oi', 'name': '1小时涨超5%且持仓量增10%', 'cooldown': 1800, 'conditions': [
+        {'field': 'change_rate', 'op': 'above', 'value': 5, 'hysteresis': 0.5},
+        {'field': 'oi_change_rate', 'op': 'above', 'value': 10, 'hysteresis': 1}]},
+    {'id': 'dump_with_oi', 'name': '1小时跌超5%且持仓量增10%', 'cooldown': 1800, 'conditions': [
+        {'field': 'change_rate', 'op': 'below', 'value': -5, 'hysteresis': 0.5},
+        {'field': 'oi_change_rate', 'op': 'above', 'value': 10, 'hysteresis': 1}]},
+    {'id': 'spike_5m', 'name': '5分钟内急涨2%', 'conditions': [
+        {'field': 'close_price', 'op': 'rise', 'value': 2, 'window': 300, 'relative': True, 'hysteresis': 0.5}]},
+    {'id': 'drop_5m', 'name': '5分钟内急跌2%', 'conditions': [
+        {'field': 'close_price', 'op': 'fall', 'value': 2, 'window': 300, 'relative': True, 'hysteresis': 0.5}]},
+]
+
+# 产品搜索配置
+SEARCH_DEFAULT_LIMIT = 20  # 默认返回的搜索结果数
+SEARCH_MAX_LIMIT = 100  # 单次搜索最多返回的结果数
+SEARCH_FUZZY_MIN_SCORE = 0.3  # 模糊匹配的最低三元组重合度
+
+# 启动回填配置 - 并发REST获取当前K线，整表就绪前暂缓首次广播
+STARTUP_BACKFILL_TIMEOUT = 60  # 回填未完成时最多暂缓首次广播的时间（秒）
+
 # 高效数据结构
 update_lock = threading.Lock()
 broadcast_queue = asyncio.Queue(maxsize=100)  # 限制队列大小
@@ -67,6 +227,17 @@ broadcast_queue = asyncio.Queue(maxsize=100)  # 限制队列大小
 volume_update_queue = deque()  # 用于存储待更新成交量的产品ID
 volume_update_in_progress = False  # 成交量更新是否正在进行中
 
+# 启动回填状态，time_to_complete_table为进程启动到整表就绪的耗时
+startup_backfill = {
+    'process_start': time.time(),
+    'completed_at': None,
+    'instruments': 0,
+    'loaded': 0,
+    'failed': 0,
+    'fetch_seconds': None,
+    'time_to_complete_table': None
+}
+
 class ConnectionManager:
     """连接管理器"""
     
@@ -76,18 +247,27 @@ class ConnectionManager:
         self.reconnecting = False
         self.last_heartbeat = time.time()
         self.subscription_args = []
+        self.callback = None  # 最近一次订阅使用的回调，增量订阅时复用
         self.market_api = None  # 不在这里初始化，使用时再创建
         self.trading_data_api = None  # 添加TradingDataAPI
         self.account_api = None  # 添加AccountAPI
+        self.public_api = None  # 添加PublicAPI
         self.last_api_call = 0  # 上次API调用时间
         self.api_request_count = 0  # API请求计数器
         self.api_request_reset_time = time.time()  # 重置计数器的时间
         self.session = None  # 添加session用于API请求
         self.url = url  # WebSocket URL
         self.heartbeat_task = None  # 添加心跳任务
-        self.last_ping_time = 0
-        self.ping_interval = 20  # 每20秒检查一次连接
-        self.ping_timeout = 10   # 等待pong超时时间
+        self.last_ping_time = 0  # 最近一次发送ping的时间，0表示没有等待中的ping
+        self.ping_interval = PING_IDLE_INTERVAL  # 静默多久后发送ping
+        self.ping_timeout = PONG_TIMEOUT   # 等待pong超时时间
+        # 往返延迟统计
+        self.last_rtt = None
+        self.avg_rtt = None
+        self.min_rtt = None
+        self.max_rtt = None
+        self.ping_count = 0
+        self.pong_timeout_count = 0
         
     def _get_session(self):
         """创建并配置requests session"""
@@ -115,10 +295,10 @@ class ConnectionManager:
             await self.ws.start()
             self.connected = True
             self.last_heartbeat = time.time()
-            self.last_ping_time = time.time()
+            self.last_ping_time = 0
             
             # 启动心跳任务
-            if self.heartbeat_task is None:
+            if self.heartbeat_task is None or self.heartbeat_task.done():
                 self.heartbeat_task = asyncio.create_task(self._heartbeat_loop())
             
             print(f"OKX WebSocket连接成功: {self.url}")
@@ -168,38 +348,84 @@ class ConnectionManager:
             self.connected = False
     
     async def _heartbeat_loop(self):
-        """心跳保活循环"""
+        """心跳保活循环：静默超过ping_interval秒发送ping，ping_timeout秒内未收到pong或其他任何消息判定连接失效"""
         print(f"启动心跳保活循环: {self.url}")
         
         while self.connected and running:
             try:
                 current_time = time.time()
                 
-                # 检查是否需要发送ping
-                if current_time - self.last_ping_time >= self.ping_interval:
-                    # 检查连接是否仍然活跃
-                    if current_time - self.last_heartbeat > self.ping_interval + self.ping_timeout:
-                        print(f"心跳超时: {self.url}，最后心跳时间 {current_time - self.last_heartbeat:.1f}秒前")
+                if self.last_ping_time:
+                    # 等待pong中
+                    if current_time - self.last_ping_time > self.ping_timeout:
+                        self.pong_timeout_count += 1
+                        print(f"pong超时: {self.url}，{self.ping_timeout}秒内未收到响应，判定连接失效")
                         # 标记连接为断开，外层循环会重新连接
                         self.connected = False
                         break
-                    
-                    # 更新ping时间
-                    self.last_ping_time = current_time
-                    print(f"心跳检查: {self.url}，连接正常")
+                elif current_time - self.last_heartbeat >= self.ping_interval:
+                    await self._send_ping()
                 
-                await asyncio.sleep(300)  # 每300秒检查一次
+                await asyncio.sleep(1)
                 
             except asyncio.CancelledError:
                 print(f"心跳循环被取消: {self.url}")
                 break
             except Exception as e:
                 print(f"心跳循环出错: {self.url}, 错误: {e}")
-                traceback.print_exc()
-                await asyncio.sleep(5)
+                self.connected = False
+                break
         
         print(f"心跳保活循环结束: {self.url}")
     
+    async def _send_ping(self):
+        """发送OKX文本ping"""
+        if self.ws and getattr(self.ws, 'websocket', None):
+            self.last_ping_time = time.time()
+            self.ping_count += 1
+            await self.ws.websocket.send('ping')
+    
+    def on_message(self, message):
+        """记录消息到达时间并处理控制消息，返回True表示消息已处理、无需继续解析"""
+        current_time = time.time()
+        self.last_heartbeat = current_time
+        
+        if message == 'pong':
+            if self.last_ping_time:
+                rtt = current_time - self.last_ping_time
+                self.last_rtt = rtt
+                self.avg_rtt = rtt if self.avg_rtt is None else self.avg_rtt * 0.8 + rtt * 0.2
+                self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+                self.max_rtt = rtt if self.max_rtt is None else max(self.max_rtt, rtt)
+                self.last_ping_time = 0
+            return True
+        
+        if isinstance(message, str) and '"ConnClosed"' in message:
+            # WsPublicAsync在连接被关闭时会推送该事件
+            print(f"连接被服务端关闭: {self.url}")
+            self.connected = False
+            return True
+        
+        # 任何入站消息都说明连接仍然存活，繁忙连接上pong排在数据之后晚到时不应判定超时
+        self.last_ping_time = 0
+        return False
+    
+    def get_liveness_stats(self):
+        """返回心跳和往返延迟统计（毫秒）"""
+        def to_ms(value):
+            return round(value * 1000, 1) if value is not None else None
+        
+        return {
+            'connected': self.is_connected(),
+            'idle_seconds': round(time.time() - self.last_heartbeat, 1),
+            'rtt_ms': to_ms(self.last_rtt),
+            'avg_rtt_ms': to_ms(self.avg_rtt),
+            'min_rtt_ms': to_ms(self.min_rtt),
+            'max_rtt_ms': to_ms(self.max_rtt),
+            'ping_count': self.ping_count,
+            'pong_timeout_count': self.pong_timeout_count
+        }
+    
     async def subscribe(self, args, callback):
         """订阅数据"""
         try:
@@ -207,6 +433,7 @@ class ConnectionManager:
                 return False
             
             self.subscription_args = args
+            self.callback = callback
             await self.ws.subscribe(args, callback=callback)
             print(f"订阅成功，共 {len(args)} 个产品, URL: {self.url}")
             return True
@@ -215,6 +442,19 @@ class ConnectionManager:
             traceback.print_exc()
             return False
     
+    async def unsubscribe(self, args):
+        """取消订阅指定频道，不影响其他订阅"""
+        try:
+            if not self.connected or not self.ws:
+                return False
+            
+            await self.ws.unsubscribe(args, callback=self.callback)
+            print(f"取消订阅成功，共 {len(args)} 个频道, URL: {self.url}")
+            return True
+        except Exception as e:
+            print(f"取消订阅失败 {self.url}: {e}")
+            return False
+    
     def is_connected(self):
         """检查连接状态"""
         return self.connected and self.ws is not None
@@ -231,6 +471,12 @@ class ConnectionManager:
             self.trading_data_api = TradingData_api.TradingDataAPI(flag=flag, debug=False)
         return self.trading_data_api
     
+    def get_public_api(self):
+        """获取PublicAPI实例（延迟创建）"""
+        if self.public_api is None:
+            self.public_api = PublicData.PublicAPI(flag=flag, debug=False)
+        return self.public_api
+    
     def get_account_api(self):
         """获取AccountAPI实例（延迟创建）"""
         if self.account_api is None:
@@ -300,22 +546,309 @@ class ConnectionManager:
             print(f"获取 {inst_id} ticker数据时出错: {e}")
             return None
 
+class AsyncRateLimiter:
+    """异步滑动窗口限速器：period秒内最多max_calls次REST请求，并限制并发数
+
+    OKX SDK是同步调用，call()会在线程池中执行请求，使多个请求可以在限速范围内并发。
+    """
+    
+    def __init__(self, max_calls, period, max_concurrency=8):
+        self.max_calls = max_calls
+        self.period = period
+        self.max_concurrency = max_concurrency
+        self.calls = deque()
+        self.lock = None
+        self.semaphore = None
+    
+    async def acquire(self):
+        # 延迟创建，确保绑定到实际使用的事件循环
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= self.period:
+                    self.calls.popleft()
+                if len(self.calls) < self.max_calls:
+                    self.calls.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self.calls[0]))
+    
+    async def call(self, func, *args, **kwargs):
+        """在限速范围内执行同步REST调用"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async with self.semaphore:
+            await self.acquire()
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+# REST并发限速器 - K线接口限制为40次/2秒，留出余量给其他请求
+rest_limiter = AsyncRateLimiter(max_calls=18, period=2)
+
 # 创建连接管理器实例 - K线数据
 connection_manager_kline = ConnectionManager(url="wss://ws.okx.com:8443/ws/v5/business")
 
 # 创建连接管理器实例 - 持仓量数据
 connection_manager_oi = ConnectionManager(url="wss://ws.okx.com:8443/ws/v5/public")
 
+# 热备连接（仅在冗余模式下连接）
+connection_manager_kline_standby = ConnectionManager(url="wss://ws.okx.com:8443/ws/v5/business")
+connection_manager_oi_standby = ConnectionManager(url="wss://ws.okx.com:8443/ws/v5/public")
+
+class RedundantFeed:
+    """热备冗余数据源
+
+    主连接由原有处理器管理，热备连接由本类在后台维护并订阅相同频道。
+    两条连接的消息按 (instId, channel, ts) 去重，先到的被处理，
+    因此主连接卡顿时数据会无缝地由热备连接提供。
+    """
+    
+    def __init__(self, name, primary, standby):
+        self.name = name
+        self.legs = [primary, standby]
+        self.seen = OrderedDict()  # 去重缓存
+        self.first_counts = [0, 0]  # 每条连接率先送达的消息数
+        self.duplicate_counts = [0, 0]  # 每条连接送达的重复消息数
+        self.last_first_time = [0, 0]
+        self.active_leg = 0
+        self.switch_count = 0
+        self.batches = []
+        self.standby_callback = None
+        self.standby_task = None
+    
+    def _message_key(self, data):
+        arg = data.get('arg', {})
+        rows = data.get('data') or []
+        if not rows:
+            return None
+        row = rows[0]
+        channel = arg.get('channel')
+        if isinstance(row, dict):
+            if 'ts' not in row:
+                return None  # 不带时间戳的推送（如instruments）不去重
+            return (row.get('instId', arg.get('instId')), channel, row['ts'])
+        # K线的ts是K线起始时间，同一根K线会多次推送，用整行内容区分每次更新
+        return (arg.get('instId'), channel, tuple(row))
+    
+    def accept(self, manager, data):
+        """判断消息是否首次到达，重复消息返回False"""
+        key = self._message_key(data)
+        if key is None:
+            return True
+        
+        leg = 0 if manager is self.legs[0] else 1
+        if key in self.seen:
+            self.duplicate_counts[leg] += 1
+            return False
+        
+        self.seen[key] = leg
+        if len(self.seen) > DEDUP_CACHE_SIZE:
+            self.seen.popitem(last=False)
+        
+        now = time.time()
+        self.first_counts[leg] += 1
+        if leg != self.active_leg and now - self.last_first_time[self.active_leg] > FEED_STALL_SECONDS:
+            print(f"{self.name} 主用连接静默超过 {FEED_STALL_SECONDS} 秒，切换到{'热备' if leg else '主'}连接")
+            self.active_leg = leg
+            self.switch_count += 1
+        self.last_first_time[leg] = now
+        return True
+    
+    def standby_alive(self):
+        standby = self.legs[1]
+        return standby.is_connected() and time.time() - standby.last_heartbeat < PING_IDLE_INTERVAL + PONG_TIMEOUT
+    
+    def ensure_standby(self, batches, callback):
+        """启动热备连接，订阅列表变化时让热备连接按新列表重连（在OKX事件循环中调用）"""
+        changed = batches != self.batches
+        self.batches = batches
+        self.standby_callback = callback
+        
+        if self.standby_task is None or self.standby_task.done():
+            self.standby_task = asyncio.create_task(self._standby_loop())
+        elif changed and self.legs[1].is_connected():
+            self.legs[1].connected = False
+    
+    async def _standby_loop(self):
+        standby = self.legs[1]
+        print(f"{self.name} 热备连接启动")
+        
+        while running:
+            try:
+                if await standby.connect():
+                    for args in self.batches:
+                        if not await standby.subscribe(args, self.standby_callback):
+                            break
+                        await asyncio.sleep(0.5)
+                    print(f"{self.name} 热备连接订阅完成")
+                    
+                    while running and standby.is_connected():
+                        await asyncio.sleep(1)
+                
+                await standby.disconnect()
+                if running:
+                    print(f"{self.name} 热备连接断开，{RECONNECT_DELAY} 秒后重连")
+                    await asyncio.sleep(RECONNECT_DELAY)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"{self.name} 热备连接出错: {e}")
+                traceback.print_exc()
+                await asyncio.sleep(RECONNECT_DELAY)
+        
+        print(f"{self.name} 热备连接停止")
+    
+    async def add_args(self, args):
+        """增量订阅：记录到订阅列表，热备连接在线时同步订阅"""
+        self.batches = self.batches + [args]
+        standby = self.legs[1]
+        if self.standby_task and standby.is_connected():
+            await standby.subscribe(args, self.standby_callback)
+    
+    async def remove_args(self, args):
+        """增量取消订阅"""
+        self.batches = [
+            remaining for remaining in ([a for a in batch if a not in args] for batch in self.batches)
+            if remaining
+        ]
+        standby = self.legs[1]
+        if self.standby_task and standby.is_connected():
+            await standby.unsubscribe(args)
+    
+    async def stop(self):
+        if self.standby_task:
+            self.standby_task.cancel()
+            try:
+                await self.standby_task
+            except asyncio.CancelledError:
+                pass
+            self.standby_task = None
+        await self.legs[1].disconnect()
+    
+    def get_stats(self):
+        total_first = sum(self.first_counts) or 1
+        return {
+            'active_leg': 'standby' if self.active_leg else 'primary',
+            'switch_count': self.switch_count,
+            'legs': [
+                {
+                    'role': 'standby' if i else 'primary',
+                    'connected': leg.is_connected(),
+                    'first_count': self.first_counts[i],
+                    'first_ratio': round(self.first_counts[i] / total_first, 3),
+                    'duplicate_count': self.duplicate_counts[i],
+                    'avg_rtt_ms': leg.get_liveness_stats()['avg_rtt_ms']
+                }
+                for i, leg in enumerate(self.legs)
+            ]
+        }
+
+kline_feed = RedundantFeed('K线', connection_manager_kline, connection_manager_kline_standby)
+oi_feed = RedundantFeed('持仓量', connection_manager_oi, connection_manager_oi_standby)
+
+class InstrumentTypeSpec:
+    """产品类型定义
+
+    描述一种产品类型（SWAP/SPOT/FUTURES）的产品筛选、订阅频道、解析和展示规则。
+    所有类型共用同一组WebSocket连接、REST限速器和广播流程。
+    """
+    
+    def __init__(self, name, label, max_products, has_open_interest, volume_in_quote=False,
+                 quote_ccy=None, main_pairs=(), trade_path=''):
+        self.name = name
+        self.label = label  # 页面展示的类型名
+        self.max_products = max_products  # 该类型最多监控的产品数
+        self.has_open_interest = has_open_interest  # 是否订阅持仓量频道
+        self.volume_in_quote = volume_in_quote  # ticker的volCcy24h是否已是计价货币成交额
+        self.quote_ccy = quote_ccy  # 只监控指定计价货币的产品（None表示不限）
+        self.main_pairs = list(main_pairs)  # 优先监控的主流产品
+        self.trade_path = trade_path  # OKX交易页面路径
+    
+    def accepts(self, instrument):
+        """筛选REST/instruments频道返回的产品"""
+        return instrument.get("state") == "live" and self.accepts_inst_id(instrument.get("instId", ""))
+
+    def accepts_inst_id(self, inst_id):
+        """按产品类型和计价货币筛选产品ID"""
+        if get_inst_type(inst_id) != self.name:
+            return False
+        if self.quote_ccy:
+            parts = inst_id.split("-")
+            return len(parts) > 1 and parts[1] == self.quote_ccy
+        return True
+    
+    def format_display(self, inst_id):
+        if self.name == "SWAP":
+            if inst_id.endswith('-USDT-SWAP'):
+                return inst_id.replace('-USDT-SWAP', '')
+            elif inst_id.endswith('-SWAP'):
+                return inst_id.replace('-SWAP', '')
+            return inst_id
+        if self.name == "SPOT":
+            return inst_id.replace('-USDT', '') + ' 现货'
+        if self.name == "FUTURES":
+            # BTC-USDT-250328 -> BTC 0328
+            parts = inst_id.split('-')
+            return f"{parts[0]} {parts[-1][2:]}" if len(parts) == 3 else inst_id
+        return inst_id
+    
+    def candle_args(self, inst_id):
+        return {"channel": BASE_CANDLE_CHANNEL, "instId": inst_id}
+    
+    def oi_args(self, inst_id):
+        return {"channel": "open-interest", "instId": inst_id} if self.has_open_interest else None
+
+INSTRUMENT_TYPE_SPECS = {
+    "SWAP": InstrumentTypeSpec(
+        "SWAP", "永续", MAX_PRODUCTS, has_open_interest=True, trade_path="trade-swap",
+        main_pairs=[
+            "BTC-USDT-SWAP", "ETH-USDT-SWAP", "SOL-USDT-SWAP",
+            "BNB-USDT-SWAP", "XRP-USDT-SWAP", "ADA-USDT-SWAP",
+            "DOGE-USDT-SWAP", "DOT-USDT-SWAP", "AVAX-USDT-SWAP",
+            "MATIC-USDT-SWAP", "LTC-USDT-SWAP", "LINK-USDT-SWAP",
+            "UNI-USDT-SWAP", "ATOM-USDT-SWAP", "FIL-USDT-SWAP",
+            "ETC-USDT-SWAP", "XLM-USDT-SWAP", "ALGO-USDT-SWAP"
+        ]
+    ),
+    "SPOT": InstrumentTypeSpec(
+        "SPOT", "现货", 100, has_open_interest=False, volume_in_quote=True,
+        quote_ccy="USDT", trade_path="trade-spot",
+        main_pairs=["BTC-USDT", "ETH-USDT", "SOL-USDT", "BNB-USDT", "XRP-USDT", "DOGE-USDT"]
+    ),
+    "FUTURES": InstrumentTypeSpec(
+        "FUTURES", "交割", 50, has_open_interest=True, trade_path="trade-futures"
+    ),
+}
+ENABLED_INSTRUMENT_TYPES = ["SWAP"]  # 启用的产品类型，例如 ["SWAP", "SPOT", "FUTURES"]
+
+def enabled_instrument_specs():
+    return [INSTRUMENT_TYPE_SPECS[name] for name in ENABLED_INSTRUMENT_TYPES]
+
+def get_inst_type(inst_id):
+    """根据产品ID解析产品类型：-SWAP结尾为永续，第三段为交割日期的为交割，其余为现货"""
+    if inst_id.endswith('-SWAP'):
+        return "SWAP"
+    parts = inst_id.split('-')
+    if len(parts) == 3 and parts[2].isdigit():
+        return "FUTURES"
+    return "SPOT"
+
+def get_inst_spec(inst_id):
+    return INSTRUMENT_TYPE_SPECS[get_inst_type(inst_id)]
+
+def total_max_products():
+    """所有启用类型的产品数上限之和"""
+    return sum(spec.max_products for spec in enabled_instrument_specs())
+
 def format_inst_id(inst_id):
-    """格式化产品ID，去掉-USDT-SWAP后缀"""
-    if inst_id.endswith('-USDT-SWAP'):
-        return inst_id.replace('-USDT-SWAP', '')
-    elif inst_id.endswith('-SWAP'):
-        return inst_id.replace('-SWAP', '')
-    return inst_id
+    """格式化产品ID（永续去掉-USDT-SWAP后缀，现货/交割附带类型标识）"""
+    return get_inst_spec(inst_id).format_display(inst_id)
 
 def calculate_24h_volume_usdt(ticker_data):
-    """计算24小时成交量（USDT）: ((open24h + last) / 2) * volCcy24h"""
+    """计算24小时成交量（USDT）: ((open24h + last) / 2) * volCcy24h，现货的volCcy24h已是USDT成交额"""
     try:
         open24h = float(ticker_data.get('open24h', 0))
         last = float(ticker_data.get('last', 0))
@@ -323,6 +856,9 @@ def calculate_24h_volume_usdt(ticker_data):
         
         if open24h == 0 or volCcy24h == 0:
             return 0
+        
+        if ticker_data.get('instId') and get_inst_spec(ticker_data['instId']).volume_in_quote:
+            return volCcy24h
             
         avg_price = (open24h + last) / 2
         volume_usdt = avg_price * volCcy24h
@@ -387,6 +923,23 @@ def calculate_oi_change_rate(current_oi, history_oi):
     except (ValueError, TypeError):
         return 0
 
+def apply_open_interest(inst_id, oi_ccy):
+    """写入实时持仓量，有历史持仓量时同步更新变化率，返回是否更新了数据存储"""
+    oi_data[inst_id] = {
+        'oi_ccy': oi_ccy,
+        'timestamp': time.time()
+    }
+    
+    if inst_id in oi_history_data:
+        history_oi = oi_history_data[inst_id].get('oi_ccy', 0)
+        if history_oi > 0:
+            price_store.update(inst_id, {
+                'oi_ccy': oi_ccy,
+                'oi_change_rate': calculate_oi_change_rate(oi_ccy, history_oi)
+            })
+            return True
+    return False
+
 async def update_single_volume(inst_id, retry_count=0):
     """更新单个产品的24h成交量数据"""
     try:
@@ -511,7 +1064,9 @@ async def batch_update_oi_history():
     success_count = 0
     fail_count = 0
     
-    for inst_id in inst_ids:
+    for inst_id in list(inst_ids):
+        if inst_id not in inst_ids or not get_inst_spec(inst_id).has_open_interest:
+            continue  # 更新期间已下线，或该产品类型没有持仓量
         result = await update_oi_history(inst_id)
         if result:
             success_count += 1
@@ -545,7 +1100,10 @@ async def continuous_volume_updater():
             # 更新这个产品的成交量数据
             success = await update_single_volume(inst_id)
             
-            if success:
+            if inst_id not in inst_ids:
+                # 产品已下线，不再放回队列
+                pass
+            elif success:
                 # 更新完成后，将这个产品放回队列末尾，以便下次更新
                 volume_update_queue.append(inst_id)
             else:
@@ -606,20 +1164,34 @@ async def batch_update_volumes():
     print(f"24h成交量批量更新完成: 成功 {success_count}, 失败 {fail_count}")
     return success_count
 
+def replica_source():
+    """本进程的数据来自其他进程或节点时返回对应的订阅端（Web工作进程、集群跟随者），否则为None"""
+    if state_bus_client is not None:
+        return state_bus_client
+    if cluster_node is not None and not cluster_node.is_leader:
+        return cluster_node
+    return None
+
+def build_volume_stats():
+    source = replica_source()
+    if source is not None:
+        stats = dict(source.status.get('volume') or {'updated': 0, 'total': 0})
+    else:
+        stats = {
+            'updated': len([v for v in volume_last_update.values() if time.time() - v < 300]),
+            'total': len(inst_ids)
+        }
+    return {'type': 'volume_update_stats', **stats, 'timestamp': datetime.now().isoformat()}
+
+def build_volume_stats_message():
+    return json.dumps(build_volume_stats())
+
 async def broadcast_volume_stats():
     """广播成交量更新状态"""
     if not clients:
         return
     
-    updated = len([v for v in volume_last_update.values() if time.time() - v < 300])
-    total = len(inst_ids)
-    
-    stats_msg = json.dumps({
-        'type': 'volume_update_stats',
-        'updated': updated,
-        'total': total,
-        'timestamp': datetime.now().isoformat()
-    })
+    stats_msg = build_volume_stats_message()
     
     disconnected_clients = []
     for ws in list(clients):
@@ -631,253 +1203,1998 @@ async def broadcast_volume_stats():
     for ws in disconnected_clients:
         clients.discard(ws)
 
-class MemoryOptimizedDataStore:
-    """内存优化的数据存储"""
-    
-    def __init__(self, max_items=100):
-        self.data = {}
-        self.max_items = max_items
-        self.lock = threading.Lock()
-    
-    def update(self, key, value):
-        """更新数据，如果超过最大限制，删除最旧的数据"""
-        with self.lock:
-            # 获取24h成交量数据（如果存在）
-            volume_24h_info = volume_24h_data.get(key, {})
-            
-            # 获取持仓量数据
-            oi_info = oi_data.get(key, {})
-            oi_history_info = oi_history_data.get(key, {})
-            
-            # 计算持仓量变化百分比
-            oi_change_rate = 0
-            if 'oi_ccy' in oi_info and 'oi_ccy' in oi_history_info:
-                oi_change_rate = calculate_oi_change_rate(
-                    oi_info['oi_ccy'], 
-                    oi_history_info['oi_ccy']
-                )
-            
-            # 检查数据新鲜度
-            volume_freshness = 0  # 0: 无数据, 1: 新鲜(5分钟内), -1: 过期
-            if key in volume_last_update:
-                last_update = volume_last_update[key]
-                if time.time() - last_update < 300:  # 5分钟内
-                    volume_freshness = 1
-                elif time.time() - last_update < 3600:  # 1小时内
-                    volume_freshness = 0
-                else:
-                    volume_freshness = -1
-            
-            if len(self.data) >= self.max_items and key not in self.data:
-                if self.data:
-                    oldest_key = min(self.data.keys(), 
-                                   key=lambda k: self.data[k].get('last_update', 0))
-                    del self.data[oldest_key]
-            
-            # 合并现有数据和新的数据
-            existing = self.data.get(key, {})
-            merged_data = {
-                'inst_id': key,
-                'change_rate': value.get('change_rate', existing.get('change_rate', 0)),
-                'close_price': value.get('close_price', existing.get('close_price', 0)),
-                'open_price': value.get('open_price', existing.get('open_price', 0)),
-                'volume_1h': value.get('volume_1h', existing.get('volume_1h', 0)),
-                'volume_1h_formatted': value.get('volume_1h_formatted', existing.get('volume_1h_formatted', '--')),
-                'volume_24h': volume_24h_info.get('volume_24h', existing.get('volume_24h', 0)),
-                'volume_24h_formatted': volume_24h_info.get('volume_24h_formatted', existing.get('volume_24h_formatted', '--')),
-                'volume_freshness': volume_freshness,
-                'oi_ccy': oi_info.get('oi_ccy', existing.get('oi_ccy', 0)),
-                'oi_ccy_formatted': format_volume_cn(oi_info.get('oi_ccy', 0)),
-                'oi_history_ccy': oi_history_info.get('oi_ccy', existing.get('oi_history_ccy', 0)),
-                'oi_history_ccy_formatted': format_volume_cn(oi_history_info.get('oi_ccy', 0)),
-                'oi_change_rate': oi_change_rate,
-                'oi_last_update': oi_info.get('timestamp', existing.get('oi_last_update', 0)),
-                'timestamp': value.get('timestamp', existing.get('timestamp', time.time())),
-                'last_update': time.time()
-            }
-            
-            self.data[key] = merged_data
-    
-    def get(self, key):
-        with self.lock:
-            return self.data.get(key)
-    
-    def get_all(self):
-        with self.lock:
-            return dict(self.data)
-    
-    def clear(self):
-        with self.lock:
-            self.data.clear()
-    
-    def count(self):
-        with self.lock:
-            return len(self.data)
-
-price_store = MemoryOptimizedDataStore(max_items=MAX_PRODUCTS)
-
-async def broadcast_connection_status():
-    if not clients:
+async def broadcast_alerts():
+    """推送告警引擎新触发的告警，每条告警一条消息"""
+    alerts = alert_engine.take_pending()
+    if not alerts or not clients:
         return
     
-    status_msg = json.dumps({
-        'type': 'okx_connection_status',
-        'status': 'connected' if connection_manager_kline.is_connected() else 'disconnected',
-        'oi_status': 'connected' if connection_manager_oi.is_connected() else 'disconnected',
-        'timestamp': datetime.now().isoformat(),
-        'reconnect_count': reconnect_attempts,
-        'oi_reconnect_count': oi_reconnect_attempts
-    })
+    messages = [json.dumps({'type': 'alert', 'alert': alert}) for alert in alerts]
     
     disconnected_clients = []
     for ws in list(clients):
         try:
-            await ws.send_str(status_msg)
+            for message in messages:
+                await ws.send_str(message)
         except:
             disconnected_clients.append(ws)
     
     for ws in disconnected_clients:
         clients.discard(ws)
 
-async def okx_kline_handler():
-    global main_event_loop, total_products, inst_ids, reconnect_attempts, ws_connection_active
-    
-    print("OKX K线WebSocket处理器启动...")
-    
-    main_pairs = [
-        "BTC-USDT-SWAP", "ETH-USDT-SWAP", "SOL-USDT-SWAP", 
-        "BNB-USDT-SWAP", "XRP-USDT-SWAP", "ADA-USDT-SWAP",
-        "DOGE-USDT-SWAP", "DOT-USDT-SWAP", "AVAX-USDT-SWAP",
-        "MATIC-USDT-SWAP", "LTC-USDT-SWAP", "LINK-USDT-SWAP",
-        "UNI-USDT-SWAP", "ATOM-USDT-SWAP", "FIL-USDT-SWAP",
-        "ETC-USDT-SWAP", "XLM-USDT-SWAP", "ALGO-USDT-SWAP"
-    ]
-    
-    def kline_callback(message):
+def build_alert_history_message():
+    return json.dumps({'type': 'alert_history', 'alerts': alert_engine.recent()})
+
+class JobScheduler:
+    """定时任务调度器
+
+    按交易所时间对齐的计时器调度周期任务和整点任务：
+    - 事件循环卡顿导致错过的执行会立即补跑一次（多次错过合并为一次）
+    - 同一任务上一次尚未结束时拒绝重叠执行
+    - 记录每个任务的上次执行时间、耗时和下次执行时间
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.clock_offset = 0  # 交易所时间 - 本地时间（秒）
+        self.public_api = None
+
+    def now(self):
+        """当前交易所时间（秒）"""
+        return time.time() + self.clock_offset
+
+    def sync_clock(self):
+        """根据OKX服务器时间校准时钟偏移（同步调用，在线程池中执行）"""
         try:
-            # 更新心跳时间
-            connection_manager_kline.last_heartbeat = time.time()
-            
-            if isinstance(message, str):
-                data = json.loads(message)
-            else:
-                data = message
-            
-            if "event" in data and data["event"] == "subscribe":
-                return
-            
-            if "data" in data and "arg" in data:
-                arg_data = data["arg"]
-                if "channel" in arg_data and arg_data["channel"] == "candle1H":
-                    inst_id = arg_data["instId"]
-                    kline_data = data["data"]
-                    
-                    if kline_data and len(kline_data) > 0:
-                        latest_kline = kline_data[0]
-                        
-                        if len(latest_kline) >= 8:  # 确保有足够的字段
-                            open_price = latest_kline[1]
-                            close_price = latest_kline[4]
-                            volume_1h = float(latest_kline[7]) if latest_kline[7] else 0  # volCcyQuote字段
-                            
-                            change_rate = calculate_change_rate(open_price, close_price)
-                            
-                            # 1小时成交量也使用中文单位格式化
-                            volume_1h_formatted = format_volume_cn(volume_1h)
-                            
-                            price_store.update(inst_id, {
-                                'change_rate': change_rate,
-                                'open_price': float(open_price),
-                                'close_price': float(close_price),
-                                'volume_1h': volume_1h,
-                                'volume_1h_formatted': volume_1h_formatted,
-                                'timestamp': time.time()
-                            })
-                            
-                            last_received_time[inst_id] = time.time()
-                            
-                            try:
-                                if main_event_loop and main_event_loop.is_running():
-                                    if broadcast_queue.qsize() < 50:
-                                        asyncio.run_coroutine_threadsafe(
-                                            broadcast_queue.put({
-                                                'type': 'data_update',
-                                                'inst_id': inst_id
-                                            }),
-                                            main_event_loop
-                                        )
-                            except:
-                                pass
-        
+            if self.public_api is None:
+                self.public_api = PublicData.PublicAPI(flag=flag, debug=False)
+            request_start = time.time()
+            result = self.public_api.get_system_time()
+            request_end = time.time()
+            if result and result.get("code") == "0" and result.get("data"):
+                server_time = int(result["data"][0]["ts"]) / 1000
+                # 以请求往返的中点作为服务器时间对应的本地时间
+                self.clock_offset = server_time - (request_start + request_end) / 2
+                print(f"交易所时钟偏移: {self.clock_offset * 1000:.1f}ms")
         except Exception as e:
-            print(f"处理K线消息时出错: {e}")
-    
-    async def connect_and_subscribe():
-        global reconnect_attempts, inst_ids, total_products, ws_connection_active
-        
+            print(f"校准交易所时间失败: {e}")
+
+    def add_interval_job(self, name, func, interval, run_immediately=False):
+        """添加周期任务，每interval秒执行一次"""
+        self._add_job(name, func, {'interval': interval}, run_immediately)
+
+    def add_hourly_job(self, name, func, minute=0, second=0, run_immediately=False):
+        """添加整点任务，每小时的minute分second秒执行"""
+        self._add_job(name, func, {'hourly_offset': minute * 60 + second}, run_immediately)
+
+    def remove_job(self, name):
+        """移除任务并取消其计时器，正在执行的一次不受影响"""
+        job = self.jobs.pop(name, None)
+        if job is not None and job['task']:
+            job['task'].cancel()
+
+    def _add_job(self, name, func, schedule, run_immediately):
+        job = {
+            'name': name,
+            'func': func,
+            'schedule': schedule,
+            'running': False,
+            'next_run': 0,
+            'last_run': None,
+            'last_duration': None,
+            'last_error': None,
+            'run_count': 0,
+            'error_count': 0,
+            'missed_count': 0,
+            'overlap_count': 0,
+            'task': None,
+            'run_task': None
+        }
+        job['next_run'] = self.now() if run_immediately else self._compute_next_run(job, self.now())
+        self.jobs[name] = job
+
+    def _compute_next_run(self, job, after):
+        schedule = job['schedule']
+        if 'interval' in schedule:
+            return after + schedule['interval']
+        hour_start = after - after % 3600
+        next_run = hour_start + schedule['hourly_offset']
+        if next_run <= after:
+            next_run += 3600
+        return next_run
+
+    def _period(self, job):
+        return job['schedule'].get('interval', 3600)
+
+    async def start(self):
+        """校准时钟并启动所有任务的计时器"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.sync_clock)
+        for job in self.jobs.values():
+            if job['task'] is None:
+                job['task'] = asyncio.create_task(self._job_loop(job))
+        print(f"任务调度器启动，共 {len(self.jobs)} 个任务")
+
+    async def stop(self):
+        for job in self.jobs.values():
+            if job['task']:
+                job['task'].cancel()
+                try:
+                    await job['task']
+                except asyncio.CancelledError:
+                    pass
+                job['task'] = None
+
+    async def _job_loop(self, job):
+        while running:
+            try:
+                delay = job['next_run'] - self.now()
+                if delay > 0:
+                    # 按交易所时间睡眠，醒来后重新计算以消除漂移
+                    await asyncio.sleep(min(delay, 60))
+                    continue
+
+                # 错过了多个周期时只补跑一次
+                missed = int(-delay // self._period(job))
+                if missed > 0:
+                    job['missed_count'] += missed
+                    print(f"任务 {job['name']} 错过 {missed} 次执行，立即补跑")
+
+                job['next_run'] = self._compute_next_run(job, self.now())
+
+                if job['running']:
+                    job['overlap_count'] += 1
+                    print(f"任务 {job['name']} 上次执行尚未结束，跳过本次")
+                    continue
+
+                job['run_task'] = asyncio.create_task(self._execute(job))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"任务调度出错 {job['name']}: {e}")
+                await asyncio.sleep(1)
+
+    async def _execute(self, job):
+        job['running'] = True
+        job['last_run'] = self.now()
+        start = time.time()
         try:
-            # 确保之前的连接已断开
-            await connection_manager_kline.disconnect()
-            
-            # 等待一小段时间
-            await asyncio.sleep(1)
-            
-            # 使用AccountAPI获取产品列表（修改这里）
-            accountAPI = connection_manager_kline.get_account_api()
-            result = accountAPI.get_instruments(instType="SWAP")
-            
-            if result and result.get("code") == "0":
-                # 只获取状态为live的产品
-                all_products = [item["instId"] for item in result["data"] if item.get("state") == "live"]
-                inst_ids = []
-                for pair in main_pairs:
-                    if pair in all_products:
-                        inst_ids.append(pair)
-                
-                remaining_slots = MAX_PRODUCTS - len(inst_ids)
-                for product in all_products:
-                    if product not in inst_ids and remaining_slots > 0:
-                        inst_ids.append(product)
-                        remaining_slots -= 1
+            if asyncio.iscoroutinefunction(job['func']):
+                await job['func']()
             else:
-                inst_ids = main_pairs[:MAX_PRODUCTS]
+                job['func']()
+            job['last_error'] = None
         except Exception as e:
-            print(f"获取产品列表失败: {e}")
-            inst_ids = main_pairs[:min(10, MAX_PRODUCTS)]
-        
-        total_products = len(inst_ids)
-        print(f"选择监控 {total_products} 个产品")
-        
-        if await connection_manager_kline.connect():
-            ws_connection_active = True
-            
-            # 启动连续成交量更新任务
-            if main_event_loop and main_event_loop.is_running():
-                asyncio.run_coroutine_threadsafe(
-                    continuous_volume_updater(),
-                    main_event_loop
-                )
-            
-            # 初始更新历史持仓量数据
-            if main_event_loop and main_event_loop.is_running():
-                asyncio.run_coroutine_threadsafe(
-                    batch_update_oi_history(),
-                    main_event_loop
-                )
-            
-            # 分批订阅K线数据
-            kline_batch_size = 10
-            for i in range(0, len(inst_ids), kline_batch_size):
-                batch = inst_ids[i:i+kline_batch_size]
-                args = [{"channel": "candle1H", "instId": inst_id} for inst_id in batch]
-                
-                if await connection_manager_kline.subscribe(args, kline_callback):
-                    await asyncio.sleep(0.5)
+            job['error_count'] += 1
+            job['last_error'] = str(e)
+            print(f"任务 {job['name']} 执行出错: {e}")
+            traceback.print_exc()
+        finally:
+            job['last_duration'] = time.time() - start
+            job['run_count'] += 1
+            job['running'] = False
+
+    def get_stats(self):
+        """返回每个任务的执行状态"""
+        def fmt(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+        return {
+            'clock_offset_ms': round(self.clock_offset * 1000, 1),
+            'jobs': {
+                name: {
+                    'running': job['running'],
+                    'last_run': fmt(job['last_run']),
+                    'last_duration': round(job['last_duration'], 3) if job['last_duration'] is not None else None,
+                    'next_run': fmt(job['next_run']),
+                    'run_count': job['run_count'],
+                    'error_count': job['error_count'],
+                    'missed_count': job['missed_count'],
+                    'overlap_count': job['overlap_count'],
+                    'last_error': job['last_error']
+                }
+                for name, job in self.jobs.items()
+            }
+        }
+
+scheduler = JobScheduler()
+
+def timeframe_to_ms(timeframe):
+    """将周期字符串（如 5m、1H、4H、1D）转换为毫秒"""
+    units = {'m': 60_000, 'H': 3_600_000, 'D': 86_400_000}
+    unit = timeframe[-1]
+    if unit not in units:
+        raise ValueError(f"不支持的周期: {timeframe}")
+    return int(timeframe[:-1]) * units[unit]
+
+def timeframe_bucket_start(ts_ms, timeframe):
+    """计算时间戳所属周期的起始时间（毫秒），日线按OKX的UTC+8对齐"""
+    tf_ms = timeframe_to_ms(timeframe)
+    offset = 8 * 3_600_000 if timeframe.endswith('D') else 0
+    return (ts_ms + offset) // tf_ms * tf_ms - offset
+
+class CandleAggregator:
+    """多周期K线聚合器
+
+    基础K线（如1m）会在同一根K线内多次推送，因此每个周期记录已收盘基础K线的
+    累计成交量，再加上当前基础K线的最新成交量，做到增量聚合。
+    """
+
+    def __init__(self, timeframes, base_bar=BASE_CANDLE_BAR):
+        self.timeframes = list(timeframes)
+        self.base_bar = base_bar
+        self.state = {}  # {inst_id: {timeframe: bucket}}
+        # 正在用REST历史K线重建的产品: {inst_id: {'base': 重建起点的周期状态或None, 'live': {ts: 实时基础K线}}}
+        self.rebuilding = {}
+        self.lock = threading.Lock()
+
+    def update(self, inst_id, candle):
+        """合并一根基础K线 [ts, o, h, l, c, vol, volCcy, volCcyQuote, ...]，返回各周期结果"""
+        with self.lock:
+            record = self.rebuilding.get(inst_id)
+            if record is not None:
+                # 重建期间的实时推送照常生效，同时记下来，历史K线合并完成后再重放一次
+                record['live'][int(candle[0])] = candle
+                if len(record['live']) > REBUILD_LIVE_LIMIT:
+                    del record['live'][min(record['live'])]
+            inst_state = self.state.setdefault(inst_id, {})
+            self._merge(inst_state, candle)
+            return self._snapshot(inst_state)
+
+    def _merge(self, inst_state, candle):
+        """把一根基础K线合并到单个产品的各周期状态，调用方负责加锁（或操作的是本地副本）"""
+        ts = int(candle[0])
+        open_price = float(candle[1])
+        high = float(candle[2])
+        low = float(candle[3])
+        close = float(candle[4])
+        volume = float(candle[7]) if len(candle) > 7 and candle[7] else 0
+
+        for timeframe in self.timeframes:
+            bucket_ts = timeframe_bucket_start(ts, timeframe)
+            bucket = inst_state.get(timeframe)
+
+            if bucket is None or bucket_ts > bucket['bucket_ts']:
+                # 新周期开始
+                inst_state[timeframe] = {
+                    'bucket_ts': bucket_ts,
+                    'open': open_price,
+                    'high': high,
+                    'low': low,
+                    'close': close,
+                    'closed_volume': 0,
+                    'base_ts': ts,
+                    'base_volume': volume,
+                    # 首根基础K线正好是周期起点时，开盘价才是完整周期的开盘价
+                    'complete': ts == bucket_ts
+                }
+                continue
+
+            if bucket_ts < bucket['bucket_ts'] or ts < bucket['base_ts']:
+                continue  # 过期数据
+
+            if ts != bucket['base_ts']:
+                # 上一根基础K线已收盘，累计其成交量
+                bucket['closed_volume'] += bucket['base_volume']
+                bucket['base_ts'] = ts
+            bucket['base_volume'] = volume
+            bucket['high'] = max(bucket['high'], high)
+            bucket['low'] = min(bucket['low'], low)
+            bucket['close'] = close
+
+    def update_price(self, inst_id, price, ts):
+        """用ticker最新价刷新各周期收盘价，不改动成交量和基础K线时间，用于降级的低频产品
+
+        周期已切换但没有K线时以当前价近似开盘价，标记为不完整，重新升级时再用历史K线重建。
+        """
+        with self.lock:
+            inst_state = self.state.get(inst_id)
+            if not inst_state:
+                return None
+            for timeframe, bucket in list(inst_state.items()):
+                bucket_ts = timeframe_bucket_start(ts, timeframe)
+                if bucket_ts > bucket['bucket_ts']:
+                    inst_state[timeframe] = {
+                        'bucket_ts': bucket_ts,
+                        'open': price,
+                        'high': price,
+                        'low': price,
+                        'close': price,
+                        'closed_volume': 0,
+                        'base_ts': bucket['base_ts'],
+                        'base_volume': 0,
+                        'complete': False
+                    }
+                elif bucket_ts == bucket['bucket_ts']:
+                    bucket['high'] = max(bucket['high'], price)
+                    bucket['low'] = min(bucket['low'], price)
+                    bucket['close'] = price
+            return self._snapshot(inst_state)
+
+    def begin_rebuild(self, inst_id):
+        """在请求历史K线之前调用：从此刻起记录实时推送，seed时在历史之后重放"""
+        with self.lock:
+            self.rebuilding.setdefault(inst_id, {'base': None, 'live': {}})
+
+    def begin_gap(self, inst_ids):
+        """断线时调用：保存各产品断线前的周期状态，重连后补取的K线在此基础上合并，再重放重连后的实时推送"""
+        with self.lock:
+            for inst_id in inst_ids:
+                if self.state.get(inst_id) and inst_id not in self.rebuilding:
+                    self.rebuilding[inst_id] = {'base': copy.deepcopy(self.state[inst_id]), 'live': {}}
+
+    def gap_base_ts(self, inst_id):
+        """断线前最后一根基础K线的时间戳（毫秒），没有待补的断线返回None"""
+        with self.lock:
+            record = self.rebuilding.get(inst_id)
+            if record is None or not record['base']:
+                return None
+            return max(bucket['base_ts'] for bucket in record['base'].values())
+
+    def cancel_rebuild(self, inst_id):
+        with self.lock:
+            self.rebuilding.pop(inst_id, None)
+
+    def seed(self, inst_id, candles):
+        """用REST获取的历史基础K线（OKX返回新到旧）重建聚合状态
+
+        历史K线先在本地副本中合并，再重放begin_rebuild之后收到的实时推送，最后一次加锁替换，
+        期间到达的实时K线不会让较早的历史K线被当作过期数据丢弃。
+        """
+        with self.lock:
+            record = self.rebuilding.get(inst_id)
+            inst_state = copy.deepcopy(record['base']) if record and record['base'] else {}
+        for candle in sorted(candles, key=lambda c: int(c[0])):
+            self._merge(inst_state, candle)
+        with self.lock:
+            record = self.rebuilding.pop(inst_id, None)
+            if record is not None:
+                for ts in sorted(record['live']):
+                    self._merge(inst_state, record['live'][ts])
+            if not inst_state:
+                return None
+            self.state[inst_id] = inst_state
+            return self._snapshot(inst_state)
+
+    def _snapshot(self, inst_state):
+        snapshot = {}
+        for timeframe, bucket in inst_state.items():
+            volume = bucket['closed_volume'] + bucket['base_volume']
+            snapshot[timeframe] = {
+                'open': bucket['open'],
+                'close': bucket['close'],
+                'high': bucket['high'],
+                'low': bucket['low'],
+                'volume': volume,
+                'change_rate': calculate_change_rate(bucket['open'], bucket['close']),
+                'bucket_ts': bucket['bucket_ts'],
+                'complete': bucket['complete']
+            }
+        return snapshot
+
+    def get(self, inst_id):
+        with self.lock:
+            return self._snapshot(self.state.get(inst_id, {}))
+
+    def has(self, inst_id):
+        with self.lock:
+            return bool(self.state.get(inst_id))
+
+    def last_base_ts(self, inst_id):
+        """最近一根已合并的基础K线时间戳（毫秒），没有数据返回None"""
+        with self.lock:
+            buckets = self.state.get(inst_id)
+            if not buckets:
+                return None
+            return max(bucket['base_ts'] for bucket in buckets.values())
+
+    def remove(self, inst_id):
+        with self.lock:
+            self.state.pop(inst_id, None)
+            self.rebuilding.pop(inst_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.state.clear()
+            self.rebuilding.clear()
+
+    def seed_limit(self):
+        """覆盖最长周期所需的基础K线数量（OKX单次最多300根）"""
+        longest = max(timeframe_to_ms(tf) for tf in self.timeframes)
+        return min(longest // timeframe_to_ms(self.base_bar), 300)
+
+def build_timeframe_update(aggregates):
+    """把聚合结果转换为price_store.update()使用的字段"""
+    update = {
+        'tf_change_rates': {tf: agg['change_rate'] for tf, agg in aggregates.items()},
+        'timestamp': time.time()
+    }
+    primary = aggregates.get(PRIMARY_TIMEFRAME)
+    if primary:
+        update.update({
+            'change_rate': primary['change_rate'],
+            'open_price': primary['open'],
+            'close_price': primary['close'],
+            'volume_1h': primary['volume'],
+            'volume_1h_formatted': format_volume_cn(primary['volume'])
+        })
+    return update
+
+async def fetch_seed_candles(inst_id, limit):
+    """通过限速器获取单个产品的历史基础K线（含当前未收盘K线）"""
+    api = connection_manager_kline.get_market_api()
+    result = await rest_limiter.call(
+        api.get_candlesticks, instId=inst_id, bar=BASE_CANDLE_BAR, limit=str(limit)
+    )
+    if not (result and result.get("code") == "0" and result.get("data")):
+        raise RuntimeError(result.get('msg') if result else 'No response')
+    return result["data"]
+
+async def seed_candle_aggregates():
+    """用REST历史基础K线并发补齐各周期的开盘价、当前价和成交量，批量写入price_store"""
+    if not inst_ids:
+        return
+
+    # 已有聚合状态的产品（如断线重连）由补数据流程处理
+    pending = [inst_id for inst_id in inst_ids if not candle_aggregator.has(inst_id)]
+    if not pending:
+        return
+
+    limit = candle_aggregator.seed_limit()
+    print(f"开始并发获取 {len(pending)} 个产品的 {BASE_CANDLE_BAR} K线，初始化多周期聚合...")
+    for inst_id in pending:
+        candle_aggregator.begin_rebuild(inst_id)
+
+    fetch_start = time.time()
+    results = await asyncio.gather(
+        *(fetch_seed_candles(inst_id, limit) for inst_id in pending),
+        return_exceptions=True
+    )
+    fetch_seconds = time.time() - fetch_start
+
+    updates = []
+    failed_count = 0
+    for inst_id, candles in zip(pending, results):
+        if isinstance(candles, Exception):
+            print(f"获取 {inst_id} 历史K线失败: {candles}")
+            candle_aggregator.cancel_rebuild(inst_id)
+            failed_count += 1
+            continue
+        if inst_id not in inst_ids:
+            candle_aggregator.cancel_rebuild(inst_id)
+            continue  # 请求期间已下线
+        aggregates = candle_aggregator.seed(inst_id, candles)
+        if aggregates:
+            updates.append((inst_id, build_timeframe_update(aggregates)))
+
+    # 整批写入，首次广播即可看到完整榜单
+    price_store.update_many(updates)
+    print(f"多周期聚合初始化完成: 成功 {len(updates)}/{len(pending)}, 失败 {failed_count}, 耗时 {fetch_seconds:.2f}秒")
+
+    if startup_backfill['completed_at'] is None:
+        now = time.time()
+        startup_backfill.update({
+            'completed_at': now,
+            'instruments': len(pending),
+            'loaded': len(updates),
+            'failed': failed_count,
+            'fetch_seconds': round(fetch_seconds, 2),
+            'time_to_complete_table': round(now - startup_backfill['process_start'], 2)
+        })
+        print(f"启动回填完成: 榜单包含 {price_store.count()} 个产品，"
+              f"启动后 {startup_backfill['time_to_complete_table']:.2f} 秒整表就绪")
+
+def startup_table_ready():
+    """启动回填完成，或等待超过STARTUP_BACKFILL_TIMEOUT后视为就绪"""
+    if startup_backfill['completed_at'] is not None:
+        return True
+    return time.time() - startup_backfill['process_start'] >= STARTUP_BACKFILL_TIMEOUT
+
+async def fill_candle_gap(inst_id):
+    """补取单个产品断线期间缺失的基础K线，返回补入的K线数量
+
+    从断线前最后一根（可能未收盘的）基础K线开始补到当前时间，在断线前的周期状态上合并后
+    重放重连后已收到的实时推送，缺失分钟的成交量、最高价和最低价都能并入。
+    """
+    last_ts = candle_aggregator.gap_base_ts(inst_id)
+    if last_ts is None:
+        return 0
+
+    # before参数返回比该时间更新的数据，after参数返回比该时间更早的数据；OKX单次最多300根，
+    # 从最新一页开始用after向前翻页，直到覆盖断线前最后一根K线
+    base_ms = timeframe_to_ms(BASE_CANDLE_BAR)
+    remaining = int((time.time() * 1000 - last_ts) // base_ms) + 2
+    api = connection_manager_kline.get_market_api()
+    candles = []
+    after = ''
+    for _ in range(KLINE_GAP_MAX_PAGES):
+        try:
+            result = await rest_limiter.call(
+                api.get_candlesticks,
+                instId=inst_id, bar=BASE_CANDLE_BAR, after=after, before=str(last_ts - 1),
+                limit=str(min(remaining, 300))
+            )
+        except Exception:
+            if not candles:
+                candle_aggregator.cancel_rebuild(inst_id)
+                raise
+            result = None
+        
+        if not (result and result.get("code") == "0" and result.get("data")):
+            if not candles:
+                print(f"补取 {inst_id} 缺失K线失败: {result.get('msg') if result else 'No response'}")
+                candle_aggregator.cancel_rebuild(inst_id)
+                return 0
+            print(f"补取 {inst_id} 缺失K线翻页失败，早于 {candles[-1][0]} 的部分未补入")
+            break
+        
+        page = result["data"]
+        candles.extend(page)
+        remaining -= len(page)
+        oldest = int(page[-1][0])
+        if oldest <= last_ts or remaining <= 0 or len(page) < 300:
+            break
+        after = str(oldest)
+    else:
+        print(f"{inst_id} 断线缺口超过 {KLINE_GAP_MAX_PAGES * 300} 根 {BASE_CANDLE_BAR} K线，"
+              f"只补入最近的部分，早于 {candles[-1][0]} 的K线缺失")
+
+    aggregates = candle_aggregator.seed(inst_id, candles)
+    if aggregates:
+        price_store.update(inst_id, build_timeframe_update(aggregates))
+    return len(candles)
+
+async def recover_kline_gap(gap_start, resume_time):
+    """K线断线重连后，为断线时保存了周期状态的产品并发补取缺失的K线（重连后立即开始，与订阅并行）"""
+    subscribed = set(demand_manager.subscribed_ids())
+    targets = []
+    for inst_id in list(candle_aggregator.rebuilding):
+        if candle_aggregator.gap_base_ts(inst_id) is None:
+            continue
+        if inst_id in subscribed:
+            targets.append(inst_id)
+        else:
+            candle_aggregator.cancel_rebuild(inst_id)
+    if not targets:
+        return
+
+    print(f"K线断线 {resume_time - gap_start:.1f} 秒，开始为 {len(targets)} 个产品补取缺失K线...")
+    start = time.time()
+    results = await asyncio.gather(
+        *(fill_candle_gap(inst_id) for inst_id in targets),
+        return_exceptions=True
+    )
+    filled = sum(r for r in results if isinstance(r, int))
+    failed = len([r for r in results if isinstance(r, Exception)])
+    print(f"K线补数据完成: 补入 {filled} 根K线, 失败 {failed}, 耗时 {time.time() - start:.2f}秒")
+
+async def recover_oi_gap(gap_start, resume_time):
+    """持仓量断线重连后，每种产品类型用一次批量REST请求补齐断线期间未更新的产品"""
+    targets = {
+        inst_id for inst_id in inst_ids
+        if get_inst_spec(inst_id).has_open_interest
+        and oi_data.get(inst_id, {}).get('timestamp', 0) < resume_time
+    }
+    if not targets:
+        return
+
+    print(f"持仓量断线 {resume_time - gap_start:.1f} 秒，开始补取 {len(targets)} 个产品的持仓量...")
+    api = connection_manager_oi.get_public_api()
+    # 每种产品类型一次批量请求
+    inst_types = {get_inst_type(inst_id) for inst_id in targets}
+    results = await asyncio.gather(
+        *(rest_limiter.call(api.get_open_interest, instType=inst_type) for inst_type in inst_types),
+        return_exceptions=True
+    )
+    items = []
+    for result in results:
+        if isinstance(result, dict) and result.get("code") == "0" and result.get("data"):
+            items.extend(result["data"])
+        else:
+            print(f"补取持仓量失败: {result.get('msg') if isinstance(result, dict) else result}")
+
+    filled = 0
+    for item in items:
+        inst_id = item.get("instId")
+        # 重连后已收到实时推送的产品不再覆盖
+        if inst_id in targets and oi_data.get(inst_id, {}).get('timestamp', 0) < resume_time:
+            apply_open_interest(inst_id, float(item.get("oiCcy", 0)))
+            filled += 1
+    print(f"持仓量补数据完成: 补入 {filled} 个产品")
+
+class SortedIndex:
+    """单字段有序索引，按(值, inst_id)升序保存，更新为O(log n)定位加一次列表插入"""
+    
+    def __init__(self):
+        self.keys = []  # [(value, inst_id)] 升序
+        self.values = {}  # {inst_id: value}
+    
+    def set(self, inst_id, value):
+        value = float(value or 0)
+        old = self.values.get(inst_id)
+        if old is not None:
+            if old == value:
+                return
+            del self.keys[bisect.bisect_left(self.keys, (old, inst_id))]
+        self.values[inst_id] = value
+        bisect.insort(self.keys, (value, inst_id))
+    
+    def discard(self, inst_id):
+        old = self.values.pop(inst_id, None)
+        if old is not None:
+            del self.keys[bisect.bisect_left(self.keys, (old, inst_id))]
+    
+    def clear(self):
+        self.keys.clear()
+        self.values.clear()
+    
+    def sign_bounds(self):
+        """返回(负值区间终点, 正值区间起点)：keys[:前者]均小于0，keys[后者:]均大于0"""
+        return (bisect.bisect_left(self.keys, (0.0, '')),
+                bisect.bisect_right(self.keys, (0.0, '\uffff')))
+    
+    def walk(self, start, stop, descending=False):
+        """按顺序逐个产出keys[start:stop]中的(值, inst_id)，不复制列表，调用方需持有存储锁"""
+        positions = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+        for position in positions:
+            yield self.keys[position]
+    
+    def __len__(self):
+        return len(self.keys)
+
+def index_name(sort_key, timeframe=None):
+    """排序字段对应的索引名，涨跌幅按周期分别建索引"""
+    if sort_key == 'change_rate':
+        return f"change_rate:{timeframe or PRIMARY_TIMEFRAME}"
+    return sort_key
+
+class MemoryOptimizedDataStore:
+    """内存优化的数据存储"""
+    
+    def __init__(self, max_items=100):
+        self.data = {}
+        self.partitions = {}  # 按产品类型分区: {inst_type: set(inst_id)}
+        # 每个产品类型分区、每个可排序字段一个有序索引: {inst_type: {索引名: SortedIndex}}，
+        # 分页直接在索引上按顺序取行，全部类型的视图按分区归并
+        self.indexes = {}
+        self.max_items = max_items
+        self.version = 0  # 每次修改递增，用于判断缓存的响应是否过期
+        self.lock = threading.Lock()
+        # 多进程/多节点模式下记录自上次发布以来变化的产品，供状态总线发布增量
+        self.track_changes = False
+        self.changed = set()
+        self.removed = set()
+        self.reset_pending = False
+        self.observers = []  # 更新回调 callback(inst_id, 旧数据, 新数据)，在锁外调用
+    
+    def add_observer(self, callback):
+        self.observers.append(callback)
+    
+    def _notify(self, changes):
+        for callback in self.observers:
+            for key, previous, item in changes:
+                callback(key, previous, item)
+    
+    def update(self, key, value):
+        """更新数据，如果超过最大限制，删除最旧的数据"""
+        with self.lock:
+            previous = self.data.get(key)
+            self._merge(key, value)
+            item = self.data.get(key)
+        self._notify([(key, previous, item)])
+    
+    def update_many(self, updates):
+        """批量更新，整批只加一次锁，用于启动回填等批量写入"""
+        changes = []
+        with self.lock:
+            for key, value in updates:
+                previous = self.data.get(key)
+                self._merge(key, value)
+                changes.append((key, previous, self.data.get(key)))
+        self._notify(changes)
+    
+    def _merge(self, key, value):
+        """合并单个产品的数据，调用方需持有锁"""
+        # 获取24h成交量数据（如果存在）
+        volume_24h_info = volume_24h_data.get(key, {})
+        
+        # 获取持仓量数据
+        oi_info = oi_data.get(key, {})
+        oi_history_info = oi_history_data.get(key, {})
+        
+        # 计算持仓量变化百分比
+        oi_change_rate = 0
+        if 'oi_ccy' in oi_info and 'oi_ccy' in oi_history_info:
+            oi_change_rate = calculate_oi_change_rate(
+                oi_info['oi_ccy'], 
+                oi_history_info['oi_ccy']
+            )
+        
+        # 检查数据新鲜度
+        volume_freshness = 0  # 0: 无数据, 1: 新鲜(5分钟内), -1: 过期
+        if key in volume_last_update:
+            last_update = volume_last_update[key]
+            if time.time() - last_update < 300:  # 5分钟内
+                volume_freshness = 1
+            elif time.time() - last_update < 3600:  # 1小时内
+                volume_freshness = 0
+            else:
+                volume_freshness = -1
+        
+        if len(self.data) >= self.max_items and key not in self.data:
+            if self.data:
+                oldest_key = min(self.data.keys(), 
+                               key=lambda k: self.data[k].get('last_update', 0))
+                self._drop(oldest_key)
+        
+        # 合并现有数据和新的数据
+        existing = self.data.get(key, {})
+        inst_type = existing.get('inst_type') or get_inst_type(key)
+        merged_data = {
+            'inst_id': key,
+            'inst_type': inst_type,
+            'change_rate': value.get('change_rate', existing.get('change_rate', 0)),
+            'close_price': value.get('close_price', existing.get('close_price', 0)),
+            'open_price': value.get('open_price', existing.get('open_price', 0)),
+            'volume_1h': value.get('volume_1h', existing.get('volume_1h', 0)),
+            'volume_1h_formatted': value.get('volume_1h_formatted', existing.get('volume_1h_formatted', '--')),
+            'volume_24h': volume_24h_info.get('volume_24h', existing.get('volume_24h', 0)),
+            'volume_24h_formatted': volume_24h_info.get('volume_24h_formatted', existing.get('volume_24h_formatted', '--')),
+            'volume_freshness': volume_freshness,
+            'oi_ccy': oi_info.get('oi_ccy', existing.get('oi_ccy', 0)),
+            'oi_ccy_formatted': format_volume_cn(oi_info.get('oi_ccy', 0)),
+            'oi_history_ccy': oi_history_info.get('oi_ccy', existing.get('oi_history_ccy', 0)),
+            'oi_history_ccy_formatted': format_volume_cn(oi_history_info.get('oi_ccy', 0)),
+            'oi_change_rate': oi_change_rate,
+            'tf_change_rates': {**existing.get('tf_change_rates', {}), **value.get('tf_change_rates', {})},
+            'oi_last_update': oi_info.get('timestamp', existing.get('oi_last_update', 0)),
+            'timestamp': value.get('timestamp', existing.get('timestamp', time.time())),
+            'last_update': time.time()
+        }
+        self._put(key, merged_data)
+    
+    def _put(self, key, item):
+        """写入完整的产品数据并更新索引，调用方需持有锁"""
+        inst_type = item.get('inst_type') or get_inst_type(key)
+        self.data[key] = item
+        self.partitions.setdefault(inst_type, set()).add(key)
+        self.version += 1
+        if self.track_changes:
+            self.changed.add(key)
+            self.removed.discard(key)
+        
+        indexes = self.indexes.get(inst_type)
+        if indexes is None:
+            indexes = self.indexes[inst_type] = {index_name('change_rate', tf): SortedIndex() for tf in AGG_TIMEFRAMES}
+            indexes.update({sort_key: SortedIndex() for sort_key in VIEW_SORT_KEYS if sort_key != 'change_rate'})
+        for timeframe in AGG_TIMEFRAMES:
+            indexes[index_name('change_rate', timeframe)].set(key, get_item_change_rate(item, timeframe))
+        for sort_key in VIEW_SORT_KEYS:
+            if sort_key != 'change_rate':
+                indexes[sort_key].set(key, item.get(sort_key))
+    
+    def _drop(self, key):
+        """删除单个产品及其分区和索引条目，调用方需持有锁"""
+        item = self.data.pop(key, None)
+        if item is not None:
+            self.version += 1
+            if self.track_changes:
+                self.changed.discard(key)
+                self.removed.add(key)
+        inst_type = (item or {}).get('inst_type') or get_inst_type(key)
+        self.partitions.get(inst_type, set()).discard(key)
+        for index in self.indexes.get(inst_type, {}).values():
+            index.discard(key)
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+    
+    def get_all(self, inst_type=None):
+        """获取全部数据，指定inst_type时只返回该类型分区"""
+        with self.lock:
+            if inst_type is None:
+                return dict(self.data)
+            return {key: self.data[key] for key in self.partitions.get(inst_type, ()) if key in self.data}
+    
+    def partition_counts(self):
+        with self.lock:
+            return {inst_type: len(keys) for inst_type, keys in self.partitions.items()}
+    
+    def remove(self, key):
+        with self.lock:
+            self._drop(key)
+    
+    def clear(self):
+        with self.lock:
+            self._clear()
+    
+    def _clear(self):
+        self.data.clear()
+        self.partitions.clear()
+        self.indexes.clear()
+        self.version += 1
+        if self.track_changes:
+            self.changed.clear()
+            self.removed.clear()
+            self.reset_pending = True
+    
+    def take_changes(self):
+        """取出并清空自上次调用以来的变化：(变化的产品数据, 删除的产品, 是否需要全量重发)"""
+        with self.lock:
+            items = {key: self.data[key] for key in self.changed if key in self.data}
+            removed = list(self.removed)
+            reset = self.reset_pending
+            self.changed.clear()
+            self.removed.clear()
+            self.reset_pending = False
+            return items, removed, reset
+    
+    def load_snapshot(self, items):
+        """副本：用发布方的全量数据替换本地数据"""
+        with self.lock:
+            self._clear()
+            for key, item in items.items():
+                self._put(key, item)
+    
+    def apply_changes(self, items, removed):
+        """副本：原样写入发布方的产品数据（不重新合并成交量和持仓量）"""
+        changes = []
+        with self.lock:
+            for key in removed:
+                self._drop(key)
+            for key, item in items.items():
+                changes.append((key, self.data.get(key), item))
+                self._put(key, item)
+        self._notify(changes)
+    
+    @staticmethod
+    def _with_sign(entries, change_values, sign):
+        """过滤出涨跌幅符号为sign的索引条目"""
+        for entry in entries:
+            change_rate = change_values[entry[1]]
+            if change_rate > 0 if sign > 0 else change_rate < 0:
+                yield entry
+    
+    def rank_page(self, change_name, sort_name, inst_type, sign, descending, offset, limit,
+                  matches=None, candidates=None):
+        """按sort_name索引顺序分页取出涨跌幅（change_name索引）为sign符号的产品
+
+        返回([(inst_id, 数据)], 总数)。无过滤条件时总数来自正/负值区间的二分边界，分页从索引上
+        顺序走到offset后取limit行即停止；matches为搜索过滤函数，candidates为自选产品列表，
+        有自选列表时只在其中排序。多个分区按(值, inst_id)归并，顺序与单个索引一致。
+        """
+        with self.lock:
+            if inst_type is None:
+                partitions = list(self.indexes.values())
+            else:
+                partitions = [self.indexes[inst_type]] if inst_type in self.indexes else []
+            
+            if candidates is not None:
+                ranked = []
+                for indexes in partitions:
+                    sort_values = indexes[sort_name].values
+                    change_values = indexes[change_name].values
+                    for inst_id in candidates:
+                        change_rate = change_values.get(inst_id)
+                        if (change_rate is not None and (change_rate > 0 if sign > 0 else change_rate < 0)
+                                and (matches is None or matches(inst_id))):
+                            ranked.append((sort_values[inst_id], inst_id))
+                ranked.sort(reverse=descending)
+                page = ranked[offset:offset + limit]
+                return [(inst_id, self.data[inst_id]) for _, inst_id in page], len(ranked)
+            
+            streams = []
+            total = 0
+            for indexes in partitions:
+                change_index = indexes[change_name]
+                negative_end, positive_start = change_index.sign_bounds()
+                start, stop = (positive_start, len(change_index)) if sign > 0 else (0, negative_end)
+                if matches is None:
+                    total += stop - start
+                else:
+                    total += sum(1 for _, inst_id in change_index.walk(start, stop) if matches(inst_id))
+                
+                if sort_name == change_name:
+                    streams.append(change_index.walk(start, stop, descending))
+                else:
+                    sort_entries = indexes[sort_name].walk(0, len(indexes[sort_name]), descending)
+                    streams.append(self._with_sign(sort_entries, change_index.values, sign))
+            
+            ordered = streams[0] if len(streams) == 1 else heapq.merge(*streams, reverse=descending)
+            if matches is not None:
+                ordered = (entry for entry in ordered if matches(entry[1]))
+            page = itertools.islice(ordered, offset, offset + limit)
+            return [(inst_id, self.data[inst_id]) for _, inst_id in page], total
+    
+    def count(self):
+        with self.lock:
+            return len(self.data)
+
+price_store = MemoryOptimizedDataStore(max_items=total_max_products())
+candle_aggregator = CandleAggregator(AGG_TIMEFRAMES)
+
+def alert_field_value(item, field):
+    """告警条件字段的取值，change_rate:5m 表示指定周期的涨跌幅"""
+    if field.startswith('change_rate:'):
+        return get_item_change_rate(item, field.split(':', 1)[1])
+    value = item.get(field)
+    return float(value) if value is not None else None
+
+class ThresholdIndex:
+    """按阈值升序保存的条件列表，值从a变到b时用二分查找取出阈值落在(a, b]内的条件"""
+    
+    def __init__(self):
+        self.thresholds = []
+        self.refs = []
+    
+    def add(self, threshold, ref):
+        position = bisect.bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(position, threshold)
+        self.refs.insert(position, ref)
+    
+    def remove(self, ref):
+        position = self.refs.index(ref)
+        del self.thresholds[position]
+        del self.refs[position]
+    
+    def between(self, low, high):
+        """阈值在(low, high]内的条件"""
+        return self.refs[bisect.bisect_right(self.thresholds, low):bisect.bisect_right(self.thresholds, high)]
+    
+    def up_to(self, high):
+        return self.refs[:bisect.bisect_right(self.thresholds, high)]
+    
+    def __len__(self):
+        return len(self.refs)
+
+class AlertEngine:
+    """增量告警规则引擎
+
+    每个条件都换算为"信号 >= 阈值"：信号是字段当前值，或rise/fall条件的window秒内变化量；
+    below/cross_down/fall把信号取反。每个(信号, 方向)用两个ThresholdIndex分别保存生效阈值和
+    回落阈值（阈值 - hysteresis），信号从a变到b时只二分取出状态翻转的条件，
+    所以一次更新的开销只与变化的字段和实际翻转的条件数有关，与规则总数无关。
+    规则的条件全部满足时触发（含cross条件的规则还要求本次推送发生了穿越），同一产品受cooldown限制。
+    首次看到的产品只建立条件状态，不触发告警，避免启动、清空或接管后集中告警。
+    """
+    
+    OPS = {'above': 1, 'cross_up': 1, 'rise': 1, 'below': -1, 'cross_down': -1, 'fall': -1}
+    EDGE_OPS = ('cross_up', 'cross_down')
+    RATE_OPS = ('rise', 'fall')
+    
+    def __init__(self):
+        self.rules = {}
+        self.indexes = {}  # {(信号, 方向): {'rise': ThresholdIndex, 'fall': ThresholdIndex}}
+        self.signals_by_field = {}  # {字段: set(信号)}，信号为(字段, 窗口秒数, 是否按百分比)
+        self.values = {}  # {inst_id: {信号: 最新信号值}}
+        self.samples = {}  # {inst_id: {(字段, 窗口): deque[(时间, 值)]}}，rise/fall条件的历史值
+        self.latched = {}  # {inst_id: set((规则ID, 条件序号))} 当前满足的条件
+        self.counts = {}  # {inst_id: {规则ID: 满足的条件数}}
+        self.last_fired = {}  # {(规则ID, inst_id): 上次触发时间}
+        self.history = deque(maxlen=ALERT_HISTORY_SIZE)
+        self.pending = deque(maxlen=ALERT_HISTORY_SIZE)  # 等待推送给客户端的告警
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.stats = {'updates': 0, 'signal_updates': 0, 'flips': 0, 'fired': 0, 'suppressed': 0}
+    
+    def add_rule(self, rule):
+        """添加或替换规则，已有产品按当前值建立条件状态（不触发）"""
+        conditions = rule.get('conditions') or []
+        if not rule.get('id') or not conditions:
+            raise ValueError("告警规则需要id和至少一个条件")
+        fields = set(VIEW_SORT_KEYS) | {f"change_rate:{timeframe}" for timeframe in AGG_TIMEFRAMES}
+        normalized = []
+        for condition in conditions:
+            op = condition.get('op')
+            if op not in self.OPS or condition.get('field') not in fields:
+                raise ValueError(f"规则 {rule['id']} 的条件无效: {condition}")
+            window = int(condition.get('window') or 0) if op in self.RATE_OPS else 0
+            if op in self.RATE_OPS and window <= 0:
+                raise ValueError(f"规则 {rule['id']} 的{op}条件需要window")
+            sign = self.OPS[op]
+            value = float(condition['value'])
+            normalized.append({
+                'field': condition['field'],
+                'op': op,
+                'value': value,
+                'signal': (condition['field'], window, bool(condition.get('relative')) and window > 0),
+                'sign': sign,
+                'threshold': abs(value) if op in self.RATE_OPS else sign * value,
+                'hysteresis': abs(float(condition.get('hysteresis') or 0))
+            })
+        
+        with self.lock:
+            if rule['id'] in self.rules:
+                self._remove_rule(rule['id'])
+            self.rules[rule['id']] = {
+                'id': rule['id'],
+                'name': rule.get('name') or rule['id'],
+                'conditions': normalized,
+                'edge': any(condition['op'] in self.EDGE_OPS for condition in normalized),
+                'cooldown': rule.get('cooldown', ALERT_DEFAULT_COOLDOWN),
+                'symbols': set(rule['symbols']) if rule.get('symbols') else None
+            }
+            for position, condition in enumerate(normalized):
+                ref = (rule['id'], position)
+                self.signals_by_field.setdefault(condition['field'], set()).add(condition['signal'])
+                index = self.indexes.setdefault((condition['signal'], condition['sign']),
+                                                {'rise': ThresholdIndex(), 'fall': ThresholdIndex()})
+                index['rise'].add(condition['threshold'], ref)
+                index['fall'].add(condition['threshold'] - condition['hysteresis'], ref)
+                for inst_id, values in self.values.items():
+                    value = values.get(condition['signal'])
+                    if value is not None and condition['sign'] * value >= condition['threshold']:
+                        self._latch(inst_id, ref, None)
+    
+    def remove_rule(self, rule_id):
+        with self.lock:
+            self._remove_rule(rule_id)
+    
+    def _remove_rule(self, rule_id):
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return
+        for position, condition in enumerate(rule['conditions']):
+            ref = (rule_id, position)
+            index = self.indexes[(condition['signal'], condition['sign'])]
+            index['rise'].remove(ref)
+            index['fall'].remove(ref)
+            for latched in self.latched.values():
+                latched.discard(ref)
+        for counts in self.counts.values():
+            counts.pop(rule_id, None)
+        self.last_fired = {key: value for key, value in self.last_fired.items() if key[0] != rule_id}
+    
+    def load_rules(self, rules):
+        for rule in rules:
+            try:
+                self.add_rule(rule)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"跳过无效的告警规则: {e}")
+    
+    def on_update(self, inst_id, previous, item):
+        """price_store的更新回调：只重新计算变化字段对应的信号"""
+        if item is None or not self.rules:
+            return
+        now = time.time()
+        with self.lock:
+            self.stats['updates'] += 1
+            values = self.values.get(inst_id)
+            first = values is None
+            if first:
+                values = self.values[inst_id] = {}
+            touched = {}  # {规则ID: 本次是否有cross条件发生穿越}
+            for field, signals in self.signals_by_field.items():
+                value = alert_field_value(item, field)
+                if value is None or (previous is not None and not first and
+                                     value == alert_field_value(previous, field)):
+                    continue
+                for signal_key in signals:
+                    new = self._signal_value(inst_id, signal_key, value, now)
+                    if new is None:
+                        continue
+                    old = values.get(signal_key)
+                    values[signal_key] = new
+                    self.stats['signal_updates'] += 1
+                    for sign in (1, -1):
+                        index = self.indexes.get((signal_key, sign))
+                        if index is None:
+                            continue
+                        if old is None:
+                            for ref in index['rise'].up_to(sign * new):
+                                self._latch(inst_id, ref, None)
+                        elif sign * new > sign * old:
+                            for ref in index['rise'].between(sign * old, sign * new):
+                                self._latch(inst_id, ref, touched)
+                        elif sign * new < sign * old:
+                            for ref in index['fall'].between(sign * new, sign * old):
+                                self._unlatch(inst_id, ref)
+            if not first:
+                for rule_id, crossed in touched.items():
+                    self._check_rule(rule_id, inst_id, item, crossed, now)
+    
+    def _signal_value(self, inst_id, signal, value, now):
+        field, window, relative = signal
+        if not window:
+            return value
+        samples = self.samples.setdefault(inst_id, {}).setdefault((field, window), deque())
+        if samples and now - samples[-1][0] < ALERT_RATE_SAMPLE_INTERVAL:
+            samples[-1] = (samples[-1][0], value)
+        else:
+            samples.append((now, value))
+        # 保留一个不晚于窗口起点的样本作为基准
+        while len(samples) > 1 and samples[1][0] <= now - window:
+            samples.popleft()
+        base_time, base = samples[0]
+        if base_time > now - window:
+            return None  # 历史不足一个窗口
+        if relative:
+            return (value - base) / abs(base) * 100 if base else None
+        return value - base
+    
+    def _latch(self, inst_id, ref, touched):
+        latched = self.latched.setdefault(inst_id, set())
+        if ref in latched:
+            return
+        latched.add(ref)
+        counts = self.counts.setdefault(inst_id, {})
+        counts[ref[0]] = counts.get(ref[0], 0) + 1
+        self.stats['flips'] += 1
+        if touched is not None:
+            edge = self.rules[ref[0]]['conditions'][ref[1]]['op'] in self.EDGE_OPS
+            touched[ref[0]] = touched.get(ref[0], False) or edge
+    
+    def _unlatch(self, inst_id, ref):
+        latched = self.latched.get(inst_id)
+        if latched is None or ref not in latched:
+            return
+        latched.discard(ref)
+        self.counts[inst_id][ref[0]] -= 1
+        self.stats['flips'] += 1
+    
+    def _check_rule(self, rule_id, inst_id, item, crossed, now):
+        rule = self.rules[rule_id]
+        if self.counts[inst_id].get(rule_id, 0) < len(rule['conditions']):
+            return
+        if rule['edge'] and not crossed:
+            return
+        if rule['symbols'] is not None and inst_id not in rule['symbols']:
+            return
+        key = (rule_id, inst_id)
+        if now - self.last_fired.get(key, 0) < rule['cooldown']:
+            self.stats['suppressed'] += 1
+            return
+        self.last_fired[key] = now
+        self.seq += 1
+        values = self.values[inst_id]
+        alert = {
+            'id': self.seq,
+            'rule_id': rule_id,
+            'rule': rule['name'],
+            'inst_id': inst_id,
+            'close_price': item.get('close_price'),
+            'values': {condition['field'] + (f"/{condition['signal'][1]}s" if condition['signal'][1] else ''):
+                       round(values.get(condition['signal'], 0), 4) for condition in rule['conditions']},
+            'timestamp': datetime.fromtimestamp(now).isoformat()
+        }
+        self.history.append(alert)
+        self.pending.append(alert)
+        self.stats['fired'] += 1
+    
+    def take_pending(self):
+        with self.lock:
+            alerts = list(self.pending)
+            self.pending.clear()
+            return alerts
+    
+    def recent(self, limit=ALERT_HISTORY_SEND):
+        with self.lock:
+            return list(self.history)[-limit:]
+    
+    def forget(self, inst_id):
+        """产品下线或存储清空时丢弃条件状态，下次看到时重新建立"""
+        with self.lock:
+            self._forget(inst_id)
+    
+    def _forget(self, inst_id):
+        self.values.pop(inst_id, None)
+        self.samples.pop(inst_id, None)
+        self.latched.pop(inst_id, None)
+        self.counts.pop(inst_id, None)
+    
+    def reset(self):
+        with self.lock:
+            for inst_id in list(self.values):
+                self._forget(inst_id)
+    
+    def get_stats(self):
+        with self.lock:
+            return {
+                'rules': len(self.rules),
+                'conditions': sum(len(index['rise']) for index in self.indexes.values()),
+                'instruments': len(self.values),
+                'latched': sum(len(latched) for latched in self.latched.values()),
+                'history': len(self.history),
+                **self.stats
+            }
+
+alert_engine = AlertEngine()
+if ALERTS_ENABLED:
+    alert_engine.load_rules(ALERT_RULES)
+    if ALERT_RULES_FILE:
+        with open(ALERT_RULES_FILE, encoding='utf-8') as rules_file:
+            alert_engine.load_rules(json.load(rules_file))
+    price_store.add_observer(alert_engine.on_update)
+
+def build_connection_status():
+    """OKX连接状态消息；Web工作进程和集群跟随者没有自己的OKX连接，使用发布方转来的状态"""
+    source = replica_source()
+    if source is not None:
+        status = dict(source.status.get('connection') or
+                      {'type': 'okx_connection_status', 'status': 'disconnected', 'oi_status': 'disconnected'})
+        status['timestamp'] = datetime.now().isoformat()
+        return status
+    return {
+        'type': 'okx_connection_status',
+        'status': 'connected' if connection_manager_kline.is_connected() else 'disconnected',
+        'oi_status': 'connected' if connection_manager_oi.is_connected() else 'disconnected',
+        'timestamp': datetime.now().isoformat(),
+        'reconnect_count': reconnect_attempts,
+        'oi_reconnect_count': oi_reconnect_attempts,
+        'kline_liveness': connection_manager_kline.get_liveness_stats(),
+        'oi_liveness': connection_manager_oi.get_liveness_stats(),
+        'kline_redundancy': kline_feed.get_stats() if REDUNDANT_FEEDS_ENABLED else None,
+        'oi_redundancy': oi_feed.get_stats() if REDUNDANT_FEEDS_ENABLED else None
+    }
+
+async def broadcast_connection_status():
+    if not clients:
+        return
+    
+    status_msg = json.dumps(build_connection_status())
+    
+    disconnected_clients = []
+    for ws in list(clients):
+        try:
+            await ws.send_str(status_msg)
+        except:
+            disconnected_clients.append(ws)
+    
+    for ws in disconnected_clients:
+        clients.discard(ws)
+
+def release_instrument(inst_id):
+    """释放下线产品占用的存储槽位和各类缓存"""
+    price_store.remove(inst_id)
+    candle_aggregator.remove(inst_id)
+    alert_engine.forget(inst_id)
+    demand_manager.discard(inst_id)
+    symbol_index.remove(inst_id)
+    for cache in (last_received_time, volume_24h_data, volume_last_update,
+                  oi_data, oi_history_data, oi_last_update):
+        cache.pop(inst_id, None)
+    try:
+        volume_update_queue.remove(inst_id)
+    except ValueError:
+        pass
+
+class SymbolSearchIndex:
+    """产品搜索索引
+
+    每个产品以产品ID、基础币种和显示名称作为搜索键。前缀匹配在有序键列表上二分查找，
+    作用相当于前缀树；模糊匹配使用三元组倒排索引，按与查询共有的三元组比例打分，
+    可容忍拼写错误和中间子串。
+    """
+
+    def __init__(self):
+        self.terms = {}  # {inst_id: 搜索键元组}
+        self.sorted_keys = []  # [(键, inst_id)] 升序，用于前缀查找
+        self.grams = {}  # {三元组: set(inst_id)}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        return str(text or '').strip().upper()
+
+    @staticmethod
+    def trigrams(text):
+        padded = f" {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _keys_for(self, inst_id):
+        display = self.normalize(format_inst_id(inst_id))
+        keys = {self.normalize(inst_id), inst_id.split('-')[0].upper(), display, display.replace(' ', '')}
+        return tuple(sorted(k for k in keys if k))
+
+    def add(self, new_ids):
+        with self.lock:
+            for inst_id in new_ids:
+                if inst_id in self.terms:
+                    continue
+                keys = self._keys_for(inst_id)
+                self.terms[inst_id] = keys
+                for key in keys:
+                    bisect.insort(self.sorted_keys, (key, inst_id))
+                    for gram in self.trigrams(key):
+                        self.grams.setdefault(gram, set()).add(inst_id)
+
+    def remove(self, inst_id):
+        with self.lock:
+            keys = self.terms.pop(inst_id, None)
+            if not keys:
+                return
+            for key in keys:
+                position = bisect.bisect_left(self.sorted_keys, (key, inst_id))
+                if position < len(self.sorted_keys) and self.sorted_keys[position] == (key, inst_id):
+                    del self.sorted_keys[position]
+                for gram in self.trigrams(key):
+                    members = self.grams.get(gram)
+                    if members is not None:
+                        members.discard(inst_id)
+                        if not members:
+                            del self.grams[gram]
+
+    def rebuild(self, all_ids):
+        with self.lock:
+            self.terms.clear()
+            self.sorted_keys.clear()
+            self.grams.clear()
+        self.add(all_ids)
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT):
+        """返回按匹配质量排序的[(inst_id, 匹配类型, 分数)]
+
+        匹配类型依次为exact（键完全相同）、prefix（键以查询开头）、fuzzy（三元组重合），
+        同一档内按24h成交额从高到低排列。
+        """
+        query = self.normalize(query)
+        if not query:
+            return []
+
+        matches = {}  # {inst_id: (档位, 分数)}
+        with self.lock:
+            start = bisect.bisect_left(self.sorted_keys, (query, ''))
+            for key, inst_id in self.sorted_keys[start:]:
+                if not key.startswith(query):
+                    break
+                tier = 0 if key == query else 1
+                if inst_id not in matches or tier < matches[inst_id][0]:
+                    matches[inst_id] = (tier, 1.0)
+
+            query_grams = self.trigrams(query)
+            counts = {}
+            for gram in query_grams:
+                for inst_id in self.grams.get(gram, ()):
+                    counts[inst_id] = counts.get(inst_id, 0) + 1
+            for inst_id, shared in counts.items():
+                if inst_id in matches:
+                    continue
+                score = shared / len(query_grams)
+                if score >= SEARCH_FUZZY_MIN_SCORE:
+                    matches[inst_id] = (2, score)
+
+        turnover = instrument_universe.turnover
+        ranked = sorted(
+            matches.items(),
+            key=lambda entry: (entry[1][0], -entry[1][1], -turnover.get(entry[0], 0), entry[0])
+        )
+        kinds = ('exact', 'prefix', 'fuzzy')
+        return [(inst_id, kinds[tier], round(score, 3)) for inst_id, (tier, score) in ranked[:limit]]
+
+    def get_stats(self):
+        with self.lock:
+            return {'instruments': len(self.terms), 'keys': len(self.sorted_keys), 'trigrams': len(self.grams)}
+
+symbol_index = SymbolSearchIndex()
+
+def search_instruments(query, limit=SEARCH_DEFAULT_LIMIT, timeframe=None):
+    """搜索产品并附带实时行数据，尚未收到数据的产品只返回基本信息"""
+    results = []
+    for inst_id, match, score in symbol_index.search(query, limit):
+        item = price_store.get(inst_id)
+        if item:
+            row = build_table_row(inst_id, item, get_item_change_rate(item, timeframe))
+        else:
+            row = {
+                'inst_id': inst_id,
+                'inst_type': get_inst_type(inst_id),
+                'trade_path': get_inst_spec(inst_id).trade_path,
+                'display_id': format_inst_id(inst_id)
+            }
+        row.update({'match': match, 'score': score})
+        results.append(row)
+    return results
+
+class InstrumentUniverse:
+    """根据instruments频道的推送增量调整监控的产品集合
+
+    新上线的产品在有空余槽位时加入，只订阅它自己的K线和持仓量频道；
+    下线/暂停的产品取消订阅并释放缓存。其他连接和数据保持不变。
+    """
+
+    def __init__(self):
+        self.lock = None
+        self.added_count = 0
+        self.removed_count = 0
+        self.recent_changes = deque(maxlen=50)
+        self.turnover = {}  # 最近一次批量ticker的24h成交额（USDT）
+        self.last_rerank = None
+        self.rotation_count = 0
+
+    def on_instruments(self, items):
+        """在OKX事件循环中由持仓量回调调用"""
+        asyncio.get_event_loop().create_task(self.apply(items))
+
+    async def apply(self, items):
+        global total_products
+
+        # 订阅/取消订阅需要按顺序执行，避免并发推送导致状态错乱
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            current = set(inst_ids)
+            delisted = [item["instId"] for item in items
+                        if item.get("state") != "live" and item.get("instId") in current]
+
+            if delisted:
+                await self.remove_instruments(delisted)
+
+            listed = [item["instId"] for item in items
+                      if item.get("instId") not in current
+                      and get_inst_type(item.get("instId", "")) in ENABLED_INSTRUMENT_TYPES
+                      and get_inst_spec(item["instId"]).accepts(item)]
+            listed = self._fit_slots(listed)
+            if listed:
+                await self.add_instruments(listed)
+
+            total_products = len(inst_ids)
+
+    def _fit_slots(self, candidates):
+        """按每种产品类型的剩余槽位截取候选产品"""
+        free_slots = {
+            spec.name: spec.max_products - len([i for i in inst_ids if get_inst_type(i) == spec.name])
+            for spec in enabled_instrument_specs()
+        }
+        fitted = []
+        for inst_id in candidates:
+            inst_type = get_inst_type(inst_id)
+            if free_slots.get(inst_type, 0) > 0:
+                fitted.append(inst_id)
+                free_slots[inst_type] -= 1
+        return fitted
+
+    async def rotate(self, add_ids, remove_ids):
+        """流动性轮换：先释放被替换的产品，再订阅新入选的产品"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        
+        async with self.lock:
+            global total_products
+            remove_ids = [inst_id for inst_id in remove_ids if inst_id in inst_ids]
+            if remove_ids:
+                await self.remove_instruments(remove_ids, reason='rotation')
+            add_ids = self._fit_slots([inst_id for inst_id in add_ids if inst_id not in inst_ids])
+            if add_ids:
+                await self.add_instruments(add_ids, reason='rotation')
+            self.rotation_count += len(remove_ids)
+            total_products = len(inst_ids)
+    
+    async def add_instruments(self, new_ids, reason='listing'):
+        """增量订阅产品，reason为'listing'（新产品上线）或'rotation'（流动性轮换入选）"""
+        if reason == 'rotation':
+            print(f"流动性轮换入选，增量订阅: {new_ids}")
+        else:
+            print(f"新产品上线，增量订阅: {new_ids}")
+        inst_ids.extend(new_ids)
+        symbol_index.add(new_ids)
+
+        kline_args = [get_inst_spec(inst_id).candle_args(inst_id) for inst_id in new_ids]
+        oi_args = [args for args in (get_inst_spec(inst_id).oi_args(inst_id) for inst_id in new_ids) if args]
+        if DEMAND_DRIVEN_SUBSCRIPTIONS:
+            demand_manager.mark_hot(new_ids)  # 新上线产品先保持高频，无人查看时再降级
+        await subscribe_feed(connection_manager_kline, kline_feed, kline_args)
+        if oi_args:
+            await subscribe_feed(connection_manager_oi, oi_feed, oi_args)
+
+        # 优先更新新产品的成交量，并补齐历史持仓量和多周期聚合
+        volume_update_queue.extendleft(new_ids)
+        if main_event_loop and main_event_loop.is_running():
+            for inst_id in new_ids:
+                if get_inst_spec(inst_id).has_open_interest:
+                    asyncio.run_coroutine_threadsafe(update_oi_history(inst_id), main_event_loop)
+            asyncio.run_coroutine_threadsafe(seed_candle_aggregates(), main_event_loop)
+
+        if reason == 'rotation':
+            self._record('rotated_in', new_ids)
+        else:
+            self.added_count += len(new_ids)
+            self._record('listed', new_ids)
+
+    async def remove_instruments(self, removed_ids, reason='listing'):
+        """取消订阅并释放产品，reason为'listing'（产品下线）或'rotation'（流动性轮换移出）"""
+        if reason == 'rotation':
+            print(f"流动性轮换移出，取消订阅: {removed_ids}")
+        else:
+            print(f"产品下线，取消订阅: {removed_ids}")
+        for inst_id in removed_ids:
+            if inst_id in inst_ids:
+                inst_ids.remove(inst_id)
+
+        hot_ids = demand_manager.subscribed_ids(removed_ids)
+        kline_args = [get_inst_spec(inst_id).candle_args(inst_id) for inst_id in hot_ids]
+        oi_args = [args for args in (get_inst_spec(inst_id).oi_args(inst_id) for inst_id in hot_ids) if args]
+        if kline_args:
+            await unsubscribe_feed(connection_manager_kline, kline_feed, kline_args)
+        if oi_args:
+            await unsubscribe_feed(connection_manager_oi, oi_feed, oi_args)
+
+        for inst_id in removed_ids:
+            release_instrument(inst_id)
+
+        if reason == 'rotation':
+            self._record('rotated_out', removed_ids)
+        else:
+            self.removed_count += len(removed_ids)
+            self._record('delisted', removed_ids)
+
+    def _record(self, change, changed_ids):
+        self.recent_changes.append({
+            'change': change,
+            'inst_ids': changed_ids,
+            'timestamp': datetime.now().isoformat()
+        })
+        if main_event_loop and main_event_loop.is_running():
+            asyncio.run_coroutine_threadsafe(broadcast_volume_stats(), main_event_loop)
+
+    def get_stats(self):
+        return {
+            'mode': UNIVERSE_SELECTION_MODE,
+            'total': len(inst_ids),
+            'added': self.added_count,
+            'removed': self.removed_count,
+            'rotations': self.rotation_count,
+            'last_rerank': self.last_rerank,
+            'recent_changes': list(self.recent_changes)
+        }
+
+instrument_universe = InstrumentUniverse()
+
+async def subscribe_feed(manager, feed, args):
+    """在主连接（及热备连接）上增量订阅，需在OKX事件循环中调用"""
+    if manager.is_connected() and manager.callback:
+        await manager.subscribe(args, manager.callback)
+    if REDUNDANT_FEEDS_ENABLED:
+        await feed.add_args(args)
+
+async def unsubscribe_feed(manager, feed, args):
+    """在主连接（及热备连接）上取消订阅，需在OKX事件循环中调用"""
+    if manager.is_connected():
+        await manager.unsubscribe(args)
+    if REDUNDANT_FEEDS_ENABLED:
+        await feed.remove_args(args)
+
+class DemandManager:
+    """按需订阅管理器
+
+    所有客户端当前周期涨/跌幅榜前N名和搜索、自选的产品并集为需求集合，只有需求集合内的
+    产品保留K线/持仓量高频订阅（热产品），其余产品（冷产品）取消订阅，改为每种产品类型一次
+    批量ticker和持仓量REST请求低频刷新。冷产品刷新后如进入榜单前N名，下一轮会被重新升级。
+    """
+
+    def __init__(self):
+        self.hot = set()
+        self.last_wanted = {}  # {inst_id: 最近一次在需求集合中的时间}
+        self.initialized = False  # 首轮调整前所有产品均视为热产品
+        self.lock = None
+        self.promoted_count = 0
+        self.demoted_count = 0
+        self.cold_refresh_count = 0
+        self.last_reconcile = None
+        self.last_cold_refresh = None
+
+    def is_hot(self, inst_id):
+        return not DEMAND_DRIVEN_SUBSCRIPTIONS or not self.initialized or inst_id in self.hot
+
+    def subscribed_ids(self, candidates=None):
+        """返回候选产品（默认全部监控产品）中需要高频订阅的产品"""
+        candidates = inst_ids if candidates is None else candidates
+        return [inst_id for inst_id in candidates if self.is_hot(inst_id)]
+
+    def mark_hot(self, new_ids):
+        now = time.time()
+        self.hot.update(new_ids)
+        for inst_id in new_ids:
+            self.last_wanted[inst_id] = now
+
+    def discard(self, inst_id):
+        self.hot.discard(inst_id)
+        self.last_wanted.pop(inst_id, None)
+
+    def compute_wanted(self):
+        """所有客户端视图中可见的产品并集"""
+        wanted = set()
+        views = {}
+        for ws in list(clients):
+            view = client_views.get(ws) or default_view()
+            views[view_key(view)] = view
+        for view in views.values():
+            tables = get_table_data(view=view)
+            for row in tables['gainers'][:DEMAND_TOP_N] + tables['losers'][:DEMAND_TOP_N]:
+                wanted.add(row['inst_id'])
+        for ws in list(clients):
+            wanted |= client_interest.get(ws, set())
+        return wanted & set(inst_ids)
+
+    async def reconcile(self):
+        """按需求集合升级/降级产品，在主事件循环中由调度器调用"""
+        if not DEMAND_DRIVEN_SUBSCRIPTIONS or not inst_ids:
+            return
+        if not (okx_event_loop and okx_event_loop.is_running()):
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            now = time.time()
+            if not self.initialized:
+                # 启动时全部产品已订阅，从全热状态开始
+                self.mark_hot(inst_ids)
+                self.initialized = True
+
+            wanted = self.compute_wanted()
+            for inst_id in wanted:
+                self.last_wanted[inst_id] = now
+
+            promote = [inst_id for inst_id in wanted if inst_id not in self.hot]
+            demote = [
+                inst_id for inst_id in self.hot
+                if inst_id not in wanted
+                and now - self.last_wanted.get(inst_id, 0) >= DEMAND_LINGER_SECONDS
+            ]
+            self.last_reconcile = datetime.now().isoformat()
+            if not promote and not demote:
+                return
+
+            print(f"按需订阅调整: 升级 {len(promote)} 个, 降级 {len(demote)} 个产品")
+            self.hot.difference_update(demote)
+            self.hot.update(promote)
+            future = asyncio.run_coroutine_threadsafe(self._apply(promote, demote), okx_event_loop)
+            await asyncio.wrap_future(future)
+            self.promoted_count += len(promote)
+            self.demoted_count += len(demote)
+
+            # 冷产品的聚合只用ticker近似维护，升级后用历史K线重建各周期
+            if promote:
+                limit = candle_aggregator.seed_limit()
+                for inst_id in promote:
+                    candle_aggregator.begin_rebuild(inst_id)
+                results = await asyncio.gather(
+                    *(fetch_seed_candles(inst_id, limit) for inst_id in promote),
+                    return_exceptions=True
+                )
+                updates = []
+                for inst_id, candles in zip(promote, results):
+                    if isinstance(candles, Exception) or inst_id not in inst_ids:
+                        candle_aggregator.cancel_rebuild(inst_id)
+                        continue
+                    aggregates = candle_aggregator.seed(inst_id, candles)
+                    if aggregates:
+                        updates.append((inst_id, build_timeframe_update(aggregates)))
+                price_store.update_many(updates)
+
+    async def _apply(self, promote, demote):
+        """在OKX事件循环中执行订阅变更"""
+        if demote:
+            kline_args = [get_inst_spec(inst_id).candle_args(inst_id) for inst_id in demote]
+            oi_args = [args for args in (get_inst_spec(inst_id).oi_args(inst_id) for inst_id in demote) if args]
+            await unsubscribe_feed(connection_manager_kline, kline_feed, kline_args)
+            if oi_args:
+                await unsubscribe_feed(connection_manager_oi, oi_feed, oi_args)
+        if promote:
+            kline_args = [get_inst_spec(inst_id).candle_args(inst_id) for inst_id in promote]
+            oi_args = [args for args in (get_inst_spec(inst_id).oi_args(inst_id) for inst_id in promote) if args]
+            await subscribe_feed(connection_manager_kline, kline_feed, kline_args)
+            if oi_args:
+                await subscribe_feed(connection_manager_oi, oi_feed, oi_args)
+
+    async def refresh_cold(self):
+        """冷产品每种产品类型一次批量ticker和持仓量请求"""
+        if not DEMAND_DRIVEN_SUBSCRIPTIONS or not self.initialized:
+            return
+        cold = {inst_id for inst_id in inst_ids if inst_id not in self.hot}
+        if not cold:
+            return
+
+        market_api = connection_manager_kline.get_market_api()
+        public_api = connection_manager_oi.get_public_api()
+        updates = []
+        for spec in enabled_instrument_specs():
+            if not any(get_inst_type(inst_id) == spec.name for inst_id in cold):
+                continue
+
+            result = await rest_limiter.call(market_api.get_tickers, instType=spec.name)
+            if result and result.get("code") == "0" and result.get("data"):
+                apply_bulk_tickers(result["data"], ranking=False)
+                for ticker in result["data"]:
+                    inst_id = ticker.get("instId")
+                    if inst_id not in cold or not ticker.get("last"):
+                        continue
+                    ts = int(ticker.get("ts") or time.time() * 1000)
+                    aggregates = candle_aggregator.update_price(inst_id, float(ticker["last"]), ts)
+                    if aggregates:
+                        updates.append((inst_id, build_timeframe_update(aggregates)))
+            else:
+                print(f"{spec.label}冷产品ticker刷新失败: {result.get('msg') if result else 'No response'}")
+
+            if spec.has_open_interest:
+                result = await rest_limiter.call(public_api.get_open_interest, instType=spec.name)
+                if result and result.get("code") == "0" and result.get("data"):
+                    for item in result["data"]:
+                        if item.get("instId") in cold:
+                            apply_open_interest(item["instId"], float(item.get("oiCcy", 0)))
+
+        price_store.update_many(updates)
+        self.cold_refresh_count += 1
+        self.last_cold_refresh = datetime.now().isoformat()
+
+    def get_stats(self):
+        return {
+            'enabled': DEMAND_DRIVEN_SUBSCRIPTIONS,
+            'hot': len(self.subscribed_ids()),
+            'cold': len(inst_ids) - len(self.subscribed_ids()),
+            'promoted': self.promoted_count,
+            'demoted': self.demoted_count,
+            'cold_refreshes': self.cold_refresh_count,
+            'last_reconcile': self.last_reconcile,
+            'last_cold_refresh': self.last_cold_refresh
+        }
+
+demand_manager = DemandManager()
+
+def apply_bulk_tickers(tickers, ranking=True):
+    """用一次批量ticker结果记录成交额排名，并顺带刷新已监控产品的24h成交量"""
+    turnover = {}
+    now = time.time()
+    for ticker in tickers:
+        inst_id = ticker.get("instId")
+        volume_24h = calculate_24h_volume_usdt(ticker)
+        turnover[inst_id] = volume_24h
+        if inst_id in volume_24h_data or inst_id in price_store.data:
+            volume_24h_data[inst_id] = {
+                'volume_24h': volume_24h,
+                'volume_24h_formatted': format_volume_cn(volume_24h),
+                'last_update': now
+            }
+            volume_last_update[inst_id] = now
+    instrument_universe.turnover.update(turnover)
+    if ranking:
+        instrument_universe.last_rerank = datetime.now().isoformat()
+    return turnover
+
+def select_instruments(spec):
+    """使用AccountAPI获取某一类型的live产品，并按配置的选择方式截取到该类型的上限（同步调用）"""
+    accountAPI = connection_manager_kline.get_account_api()
+    result = accountAPI.get_instruments(instType=spec.name)
+    
+    if not (result and result.get("code") == "0"):
+        return spec.main_pairs[:spec.max_products]
+    
+    # 只获取状态为live的产品
+    all_products = [item["instId"] for item in result["data"] if spec.accepts(item)]
+    
+    ranked = None
+    if UNIVERSE_SELECTION_MODE == "liquidity":
+        ranked = rank_instruments_by_turnover(spec, all_products)
+    
+    if ranked:
+        # 按24h成交额选择流动性最好的产品
+        selected = ranked[:spec.max_products]
+        if selected:
+            print(f"{spec.label}按24h成交额选择产品，入选门槛: {format_volume_cn(instrument_universe.turnover.get(selected[-1], 0))}")
+        return selected
+    
+    selected = [pair for pair in spec.main_pairs if pair in all_products]
+    remaining_slots = spec.max_products - len(selected)
+    for product in all_products:
+        if product not in selected and remaining_slots > 0:
+            selected.append(product)
+            remaining_slots -= 1
+    return selected
+
+def rank_instruments_by_turnover(spec, live_ids):
+    """批量获取ticker，按24h成交额从高到低排列live产品（同步调用），失败返回None"""
+    try:
+        api = connection_manager_kline.get_market_api()
+        result = api.get_tickers(instType=spec.name)
+        if not (result and result.get("code") == "0" and result.get("data")):
+            print(f"批量获取ticker失败: {result.get('msg') if result else 'No response'}")
+            return None
+        turnover = apply_bulk_tickers(result["data"])
+        return sorted(live_ids, key=lambda inst_id: turnover.get(inst_id, 0), reverse=True)
+    except Exception as e:
+        print(f"按成交额排名产品失败: {e}")
+        return None
+
+async def rerank_universe():
+    """定期按24h成交额重新排名，每种产品类型只在边缘替换少量产品"""
+    if UNIVERSE_SELECTION_MODE != "liquidity" or not inst_ids:
+        return
+    
+    api = connection_manager_kline.get_market_api()
+    add_ids, remove_ids = [], []
+    for spec in enabled_instrument_specs():
+        result = await rest_limiter.call(api.get_tickers, instType=spec.name)
+        if not (result and result.get("code") == "0" and result.get("data")):
+            print(f"{spec.label}重新排名时获取ticker失败: {result.get('msg') if result else 'No response'}")
+            continue
+        
+        turnover = apply_bulk_tickers(result["data"])
+        current = {inst_id for inst_id in inst_ids if get_inst_type(inst_id) == spec.name}
+        # 榜外候选从强到弱，榜内产品从弱到强
+        candidates = sorted(
+            (i for i in turnover if i not in current and spec.accepts_inst_id(i)),
+            key=turnover.get, reverse=True
+        )
+        weakest = sorted(current, key=lambda inst_id: turnover.get(inst_id, 0))
+        
+        added, removed = [], []
+        free_slots = spec.max_products - len(current)
+        for candidate in candidates:
+            if len(added) >= UNIVERSE_MAX_ROTATIONS:
+                break
+            if free_slots > 0:
+                added.append(candidate)
+                free_slots -= 1
+                continue
+            if len(removed) >= len(weakest):
+                break
+            victim = weakest[len(removed)]
+            if turnover[candidate] <= turnover.get(victim, 0) * (1 + UNIVERSE_ROTATION_MARGIN):
+                break
+            added.append(candidate)
+            removed.append(victim)
+        add_ids.extend(added)
+        remove_ids.extend(removed)
+    
+    if not add_ids:
+        return
+    
+    print(f"流动性轮换: 新增 {add_ids}, 移除 {remove_ids}")
+    if okx_event_loop and okx_event_loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(
+            instrument_universe.rotate(add_ids, remove_ids),
+            okx_event_loop
+        )
+        await asyncio.wrap_future(future)
+
+async def okx_kline_handler():
+    global main_event_loop, total_products, inst_ids, reconnect_attempts, ws_connection_active, kline_gap_start
+    
+    print("OKX K线WebSocket处理器启动...")
+    
+    def make_kline_callback(manager):
+        """为指定连接创建回调，热备冗余模式下主备连接各自维护心跳并共享去重"""
+        def kline_callback(message):
+            try:
+                # 更新心跳时间，pong等控制消息无需继续处理
+                if manager.on_message(message):
+                    return
+                
+                if isinstance(message, str):
+                    data = json.loads(message)
+                else:
+                    data = message
+                
+                if "event" in data and data["event"] == "subscribe":
+                    return
+                
+                # 热备冗余模式下丢弃另一条连接已送达的重复消息
+                if REDUNDANT_FEEDS_ENABLED and not kline_feed.accept(manager, data):
+                    return
+                
+                if "data" in data and "arg" in data:
+                    arg_data = data["arg"]
+                    if "channel" in arg_data and arg_data["channel"] == BASE_CANDLE_CHANNEL:
+                        inst_id = arg_data["instId"]
+                        kline_data = data["data"]
+                        
+                        # 已下线的产品在取消订阅生效前可能还有推送
+                        if kline_data and len(kline_data) > 0 and inst_id in inst_ids:
+                            latest_kline = kline_data[0]
+                            
+                            if len(latest_kline) >= 8:  # 确保有足够的字段
+                                # 基础K线增量聚合为多个周期，主周期写入原有的涨跌幅/1h成交量字段
+                                aggregates = candle_aggregator.update(inst_id, latest_kline)
+                                price_store.update(inst_id, build_timeframe_update(aggregates))
+                                
+                                last_received_time[inst_id] = time.time()
+                                
+                                try:
+                                    if main_event_loop and main_event_loop.is_running():
+                                        if broadcast_queue.qsize() < 50:
+                                            asyncio.run_coroutine_threadsafe(
+                                                broadcast_queue.put({
+                                                    'type': 'data_update',
+                                                    'inst_id': inst_id
+                                                }),
+                                                main_event_loop
+                                            )
+                                except:
+                                    pass
+            
+            except Exception as e:
+                print(f"处理K线消息时出错: {e}")
+        
+        return kline_callback
+    
+    kline_callback = make_kline_callback(connection_manager_kline)
+    
+    async def connect_and_subscribe():
+        global reconnect_attempts, inst_ids, total_products, ws_connection_active, kline_gap_start, handoff_state
+        
+        # 平滑重启接管的首次连接沿用旧进程的产品列表和聚合状态，不重新请求REST
+        taken_over = handoff_state is not None
+        handoff_state = None
+        
+        try:
+            # 确保之前的连接已断开
+            await connection_manager_kline.disconnect()
+            
+            # 等待一小段时间
+            await asyncio.sleep(1)
+            
+            if not taken_over:
+                # 按启用的产品类型分别选择产品，共用同一组连接
+                selected = []
+                for spec in enabled_instrument_specs():
+                    selected.extend(select_instruments(spec))
+                inst_ids = selected
+        except Exception as e:
+            print(f"获取产品列表失败: {e}")
+            inst_ids = [pair for spec in enabled_instrument_specs() for pair in spec.main_pairs[:min(10, spec.max_products)]]
+        
+        total_products = len(inst_ids)
+        symbol_index.rebuild(inst_ids)
+        print(f"选择监控 {total_products} 个产品")
+        
+        if await connection_manager_kline.connect():
+            ws_connection_active = True
+            
+            # 启动连续成交量更新任务
+            if main_event_loop and main_event_loop.is_running():
+                asyncio.run_coroutine_threadsafe(
+                    continuous_volume_updater(),
+                    main_event_loop
+                )
+            
+            # 初始更新历史持仓量数据
+            if main_event_loop and main_event_loop.is_running() and not taken_over:
+                asyncio.run_coroutine_threadsafe(
+                    batch_update_oi_history(),
+                    main_event_loop
+                )
+            
+            # 用历史基础K线初始化多周期聚合
+            if main_event_loop and main_event_loop.is_running() and not taken_over:
+                asyncio.run_coroutine_threadsafe(
+                    seed_candle_aggregates(),
+                    main_event_loop
+                )
+            
+            # 订阅开始后收到的推送都是实时数据，之前的缺口需要补取
+            resume_time = time.time()
+            
+            # 断线重连后立即补取缺失的K线，不等所有批次订阅完成；补取期间的实时推送会在合并后重放
+            if kline_gap_start is not None:
+                if main_event_loop and main_event_loop.is_running():
+                    asyncio.run_coroutine_threadsafe(
+                        recover_kline_gap(kline_gap_start, resume_time),
+                        main_event_loop
+                    )
+                kline_gap_start = None
+            
+            # 分批订阅K线数据
+            kline_batch_size = 10
+            hot_ids = demand_manager.subscribed_ids()  # 按需订阅模式下只订阅热产品
+            kline_batches = [
+                [get_inst_spec(inst_id).candle_args(inst_id) for inst_id in hot_ids[i:i+kline_batch_size]]
+                for i in range(0, len(hot_ids), kline_batch_size)
+            ]
+            for batch_index, args in enumerate(kline_batches):
+                if await connection_manager_kline.subscribe(args, kline_callback):
+                    await asyncio.sleep(0.5)
                 else:
-                    print(f"K线批次 {i//kline_batch_size + 1} 订阅失败")
+                    print(f"K线批次 {batch_index + 1} 订阅失败")
                     break
             
             print("K线订阅完成，等待初始数据...")
+            
+            # 热备冗余模式下启动或更新热备连接
+            if REDUNDANT_FEEDS_ENABLED:
+                kline_feed.ensure_standby(kline_batches, make_kline_callback(connection_manager_kline_standby))
+            
             await asyncio.sleep(3)
             
             initial_received = price_store.count()
@@ -898,48 +3215,17 @@ async def okx_kline_handler():
             if await connect_and_subscribe():
                 print("OKX K线WebSocket连接成功")
                 
-                last_data_time = time.time()
-                last_oi_update_hour = -1  # 记录上次更新历史持仓量的小时
-                last_oi_update_time = 0  # 记录上次更新历史持仓量的时间
-                
+                # 连接存活只由ConnectionManager的ping/pong心跳判定：静默PING_IDLE_INTERVAL秒发送ping，
+                # PONG_TIMEOUT秒内没有任何消息即断开，这里只等待连接断开
                 while running and connection_manager_kline.is_connected():
                     await asyncio.sleep(1)
-                    
-                    current_time = time.time()
-                    
-                    # 检查心跳是否超时
-                    if current_time - connection_manager_kline.last_heartbeat > 60:
-                        print(f"心跳超时，最后心跳时间 {current_time - connection_manager_kline.last_heartbeat:.1f}秒前，重新连接")
-                        break
-                    
-                    if current_time - last_data_time > 90:
-                        print("长时间没有收到K线数据，可能连接已断开")
-                        break
-                    
-                    # 整点后30秒更新历史持仓量逻辑
-                    now = datetime.now()
-                    current_hour = now.hour
-                    current_minute = now.minute
-                    current_second = now.second
-                    
-                    # 在整点后的第30秒开始更新历史持仓量
-                    if current_minute == 0 and current_second == 30 and current_hour != last_oi_update_hour:
-                        print(f"整点{current_hour}:00:30，开始更新历史持仓量数据...")
-                        last_oi_update_hour = current_hour
-                        last_oi_update_time = current_time
-                        
-                        # 触发历史持仓量更新
-                        if main_event_loop and main_event_loop.is_running():
-                            asyncio.run_coroutine_threadsafe(
-                                batch_update_oi_history(),
-                                main_event_loop
-                            )
-                    
-                    if price_store.count() > 0:
-                        last_data_time = current_time
                 
                 print("OKX K线WebSocket连接断开")
                 ws_connection_active = False
+                # 热备连接仍在送达数据时没有缺口，无需补数据
+                if not (REDUNDANT_FEEDS_ENABLED and kline_feed.standby_alive()):
+                    kline_gap_start = connection_manager_kline.last_heartbeat
+                    candle_aggregator.begin_gap(demand_manager.subscribed_ids())
                 
                 if main_event_loop and main_event_loop.is_running():
                     asyncio.run_coroutine_threadsafe(broadcast_connection_status(), main_event_loop)
@@ -970,51 +3256,47 @@ async def okx_kline_handler():
     print("OKX K线WebSocket处理器停止")
 
 async def okx_oi_handler():
-    global ws_oi_connection_active, oi_reconnect_attempts
+    global ws_oi_connection_active, oi_reconnect_attempts, oi_gap_start
     
     print("OKX 持仓量WebSocket处理器启动...")
     
-    def oi_callback(message):
-        try:
-            # 更新心跳时间
-            connection_manager_oi.last_heartbeat = time.time()
-            
-            if isinstance(message, str):
-                data = json.loads(message)
-            else:
-                data = message
-            
-            if "event" in data and data["event"] == "subscribe":
-                return
-            
-            if "data" in data and "arg" in data:
-                arg_data = data["arg"]
-                if "channel" in arg_data and arg_data["channel"] == "open-interest":
-                    oi_data_list = data["data"]
+    def make_oi_callback(manager):
+        """为指定连接创建回调，热备冗余模式下主备连接各自维护心跳并共享去重"""
+        def oi_callback(message):
+            try:
+                # 更新心跳时间，pong等控制消息无需继续处理
+                if manager.on_message(message):
+                    return
+                
+                if isinstance(message, str):
+                    data = json.loads(message)
+                else:
+                    data = message
+                
+                if "event" in data and data["event"] == "subscribe":
+                    return
+                
+                # 热备冗余模式下丢弃另一条连接已送达的重复消息
+                if REDUNDANT_FEEDS_ENABLED and not oi_feed.accept(manager, data):
+                    return
+                
+                if "data" in data and "arg" in data:
+                    arg_data = data["arg"]
+                    if arg_data.get("channel") == "instruments":
+                        # 产品上线/下线，增量调整订阅
+                        if manager is connection_manager_oi:
+                            instrument_universe.on_instruments(data["data"])
+                        return
                     
-                    if oi_data_list and len(oi_data_list) > 0:
-                        for item in oi_data_list:
-                            inst_id = item.get("instId")
-                            if inst_id and inst_id in inst_ids:  # 只处理我们监控的产品
-                                # 更新实时持仓量数据
-                                oi_ccy = float(item.get("oiCcy", 0))
-                                oi_data[inst_id] = {
-                                    'oi_ccy': oi_ccy,
-                                    'timestamp': time.time()
-                                }
-                                
-                                # 如果有历史数据，计算变化率
-                                if inst_id in oi_history_data:
-                                    history_oi = oi_history_data[inst_id].get('oi_ccy', 0)
-                                    if history_oi > 0:
-                                        oi_change_rate = calculate_oi_change_rate(oi_ccy, history_oi)
-                                        
-                                        # 更新数据存储
-                                        price_store.update(inst_id, {
-                                            'oi_ccy': oi_ccy,
-                                            'oi_change_rate': oi_change_rate
-                                        })
-                                        
+                    if "channel" in arg_data and arg_data["channel"] == "open-interest":
+                        oi_data_list = data["data"]
+                        
+                        if oi_data_list and len(oi_data_list) > 0:
+                            for item in oi_data_list:
+                                inst_id = item.get("instId")
+                                if inst_id and inst_id in inst_ids:  # 只处理我们监控的产品
+                                    # 更新实时持仓量数据，有历史数据时计算变化率
+                                    if apply_open_interest(inst_id, float(item.get("oiCcy", 0))):
                                         # 触发广播更新
                                         try:
                                             if main_event_loop and main_event_loop.is_running():
@@ -1028,12 +3310,16 @@ async def okx_oi_handler():
                                                     )
                                         except:
                                             pass
+            
+            except Exception as e:
+                print(f"处理持仓量消息时出错: {e}")
         
-        except Exception as e:
-            print(f"处理持仓量消息时出错: {e}")
+        return oi_callback
+    
+    oi_callback = make_oi_callback(connection_manager_oi)
     
     async def connect_and_subscribe_oi():
-        global ws_oi_connection_active, oi_reconnect_attempts
+        global ws_oi_connection_active, oi_reconnect_attempts, oi_gap_start
         
         if not inst_ids:
             print("等待产品列表获取...")
@@ -1045,20 +3331,45 @@ async def okx_oi_handler():
         if await connection_manager_oi.connect():
             ws_oi_connection_active = True
             
+            resume_time = time.time()
+            
             # 分批订阅持仓量数据
             oi_batch_size = 5
-            for i in range(0, len(inst_ids), oi_batch_size):
-                batch = inst_ids[i:i+oi_batch_size]
-                args = [{"channel": "open-interest", "instId": inst_id} for inst_id in batch]
-                
+            # 现货没有持仓量，只订阅支持持仓量的产品类型
+            oi_inst_ids = [inst_id for inst_id in demand_manager.subscribed_ids()
+                           if get_inst_spec(inst_id).has_open_interest]
+            oi_batches = [
+                [get_inst_spec(inst_id).oi_args(inst_id) for inst_id in oi_inst_ids[i:i+oi_batch_size]]
+                for i in range(0, len(oi_inst_ids), oi_batch_size)
+            ]
+            for batch_index, args in enumerate(oi_batches):
                 if await connection_manager_oi.subscribe(args, oi_callback):
                     await asyncio.sleep(0.5)
                 else:
-                    print(f"持仓量批次 {i//oi_batch_size + 1} 订阅失败")
+                    print(f"持仓量批次 {batch_index + 1} 订阅失败")
                     break
             
             print("持仓量订阅完成")
             
+            # 订阅产品上线/下线推送，动态调整监控的产品集合
+            await connection_manager_oi.subscribe(
+                [{"channel": "instruments", "instType": spec.name} for spec in enabled_instrument_specs()],
+                oi_callback
+            )
+            
+            # 热备冗余模式下启动或更新热备连接
+            if REDUNDANT_FEEDS_ENABLED:
+                oi_feed.ensure_standby(oi_batches, make_oi_callback(connection_manager_oi_standby))
+            
+            # 断线重连后补取缺失的持仓量
+            if oi_gap_start is not None:
+                if main_event_loop and main_event_loop.is_running():
+                    asyncio.run_coroutine_threadsafe(
+                        recover_oi_gap(oi_gap_start, resume_time),
+                        main_event_loop
+                    )
+                oi_gap_start = None
+            
             if main_event_loop and main_event_loop.is_running():
                 asyncio.run_coroutine_threadsafe(broadcast_connection_status(), main_event_loop)
             
@@ -1073,28 +3384,14 @@ async def okx_oi_handler():
             if await connect_and_subscribe_oi():
                 print("OKX 持仓量WebSocket连接成功")
                 
-                last_oi_data_time = time.time()
-                
+                # 与K线连接相同，存活判定交给ping/pong心跳，这里只等待连接断开
                 while running and connection_manager_oi.is_connected():
                     await asyncio.sleep(1)
-                    
-                    current_time = time.time()
-                    
-                    # 检查心跳是否超时
-                    if current_time - connection_manager_oi.last_heartbeat > 90:
-                        print(f"持仓量心跳超时，最后心跳时间 {current_time - connection_manager_oi.last_heartbeat:.1f}秒前，重新连接")
-                        break
-                    
-                    if current_time - last_oi_data_time > 120:  # 持仓量更新较慢，延长判断时间
-                        print("长时间没有收到持仓量数据，可能连接已断开")
-                        break
-                    
-                    # 更新最后数据时间
-                    if oi_data:
-                        last_oi_data_time = current_time
                 
                 print("OKX 持仓量WebSocket连接断开")
                 ws_oi_connection_active = False
+                if not (REDUNDANT_FEEDS_ENABLED and oi_feed.standby_alive()):
+                    oi_gap_start = connection_manager_oi.last_heartbeat
                 
                 if main_event_loop and main_event_loop.is_running():
                     asyncio.run_coroutine_threadsafe(broadcast_connection_status(), main_event_loop)
@@ -1137,6 +3434,9 @@ async def restart_websocket_connections():
     # 关闭现有连接
     await connection_manager_kline.disconnect()
     await connection_manager_oi.disconnect()
+    if REDUNDANT_FEEDS_ENABLED:
+        await connection_manager_kline_standby.disconnect()
+        await connection_manager_oi_standby.disconnect()
     
     # 清空订阅列表
     connection_manager_kline.subscription_args = []
@@ -1144,11 +3444,13 @@ async def restart_websocket_connections():
     
     # 清空数据缓存
     price_store.clear()
+    alert_engine.reset()
     volume_24h_data.clear()
     volume_last_update.clear()
     oi_data.clear()
     oi_history_data.clear()
     oi_last_update.clear()
+    candle_aggregator.clear()
     
     print("WebSocket连接重启完成")
     
@@ -1196,19 +3498,26 @@ async def okx_websocket_handler():
         try:
             await connection_manager_kline.disconnect()
             await connection_manager_oi.disconnect()
+            await kline_feed.stop()
+            await oi_feed.stop()
         except Exception as e:
             print(f"关闭连接时出错: {e}")
         
         print("OKX WebSocket总处理器停止")
 
-def get_statistics():
+def get_statistics(timeframe=None, inst_type=None):
+    """统计指定周期的涨跌分布，指定inst_type时只统计该产品类型分区"""
     try:
-        data = price_store.get_all()
+        data = price_store.get_all(inst_type)
         collected = len(data)
+        if inst_type is None:
+            total = total_products
+        else:
+            total = len([inst_id for inst_id in inst_ids if get_inst_type(inst_id) == inst_type])
         
         if collected == 0:
             return {
-                'total': total_products,
+                'total': total,
                 'collected': 0,
                 'avg_change': 0,
                 'up_count': 0,
@@ -1216,7 +3525,7 @@ def get_statistics():
                 'avg_oi_change': 0
             }
         
-        changes = [item['change_rate'] for item in data.values()]
+        changes = [get_item_change_rate(item, timeframe) for item in data.values()]
         avg_change = sum(changes) / collected
         up_count = len([c for c in changes if c > 0])
         down_count = len([c for c in changes if c < 0])
@@ -1226,7 +3535,7 @@ def get_statistics():
         avg_oi_change = sum(oi_changes) / len(oi_changes) if oi_changes else 0
         
         return {
-            'total': total_products,
+            'total': total,
             'collected': collected,
             'avg_change': avg_change,
             'up_count': up_count,
@@ -1243,137 +3552,560 @@ def get_statistics():
             'avg_oi_change': 0
         }
 
-def get_table_data():
+def get_item_change_rate(item, timeframe=None):
+    """获取指定周期的涨跌幅，主周期使用原有的change_rate字段"""
+    if not timeframe or timeframe == PRIMARY_TIMEFRAME:
+        return item.get('change_rate', 0)
+    return item.get('tf_change_rates', {}).get(timeframe, 0)
+
+def build_table_row(inst_id, item, change_rate):
+    """构建表格行数据"""
+    return {
+        'inst_id': inst_id,
+        'inst_type': item.get('inst_type') or get_inst_type(inst_id),
+        'trade_path': get_inst_spec(inst_id).trade_path,
+        'display_id': format_inst_id(inst_id),
+        'change_rate': change_rate,
+        'tf_change_rates': item.get('tf_change_rates', {}),
+        'close_price': item['close_price'],
+        'volume_24h': item.get('volume_24h', 0),
+        'volume_24h_formatted': item.get('volume_24h_formatted', '--'),
+        'volume_1h': item.get('volume_1h', 0),
+        'volume_1h_formatted': item.get('volume_1h_formatted', '--'),
+        'volume_freshness': item.get('volume_freshness', 0),
+        'oi_ccy': item.get('oi_ccy', 0),
+        'oi_ccy_formatted': item.get('oi_ccy_formatted', '--'),
+        'oi_change_rate': item.get('oi_change_rate', 0),
+        'oi_history_ccy': item.get('oi_history_ccy', 0),
+        'oi_history_ccy_formatted': item.get('oi_history_ccy_formatted', '--'),
+        'timestamp': datetime.fromtimestamp(item['timestamp']).strftime("%H:%M:%S")
+    }
+
+def default_view():
+    """未订阅视图的客户端使用的默认视图，与原有的涨跌幅榜一致"""
+    return {
+        'timeframe': PRIMARY_TIMEFRAME,
+        'inst_type': None,
+        'search': '',
+        'watchlist': (),
+        'limit': DEFAULT_TABLE_SIZE,
+        'offset': 0,
+        'losers_offset': None,  # None表示跌幅榜与涨幅榜使用同一偏移
+        'sort': 'change_rate',
+        'order': 'desc'
+    }
+
+def normalize_view(fields, base=None):
+    """在base视图上合并客户端提交的字段并校验，非法字段抛出ValueError"""
+    view = dict(base or default_view())
+    
+    if fields.get('timeframe') is not None:
+        if fields['timeframe'] not in AGG_TIMEFRAMES:
+            raise ValueError(f"不支持的周期: {fields['timeframe']}")
+        view['timeframe'] = fields['timeframe']
+    
+    if 'inst_type' in fields:
+        inst_type = fields['inst_type'] or None
+        if inst_type and inst_type not in ENABLED_INSTRUMENT_TYPES:
+            raise ValueError(f"未启用的产品类型: {inst_type}")
+        view['inst_type'] = inst_type
+    
+    if 'search' in fields:
+        view['search'] = str(fields['search'] or '').strip().upper()
+    
+    if 'watchlist' in fields:
+        watchlist = fields['watchlist'] or []
+        if isinstance(watchlist, str):
+            watchlist = [s for s in watchlist.split(',') if s]
+        if len(watchlist) > MAX_WATCHLIST_SIZE:
+            raise ValueError(f"自选列表最多 {MAX_WATCHLIST_SIZE} 个产品")
+        view['watchlist'] = tuple(sorted({str(s).strip().upper() for s in watchlist}))
+    
+    if fields.get('limit') is not None:
+        try:
+            limit = int(fields['limit'])
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的榜单大小: {fields['limit']}")
+        view['limit'] = max(1, min(limit, MAX_TABLE_SIZE))
+    
+    if fields.get('offset') is not None:
+        try:
+            view['offset'] = max(0, int(fields['offset']))
+        except (TypeError, ValueError):
+            raise ValueError(f"无效的分页偏移: {fields['offset']}")
+    
+    # 虚拟滚动时两个榜单各自滚动，跌幅榜可单独指定偏移
+    if 'losers_offset' in fields:
+        if fields['losers_offset'] in (None, ''):
+            view['losers_offset'] = None
+        else:
+            try:
+                view['losers_offset'] = max(0, int(fields['losers_offset']))
+            except (TypeError, ValueError):
+                raise ValueError(f"无效的分页偏移: {fields['losers_offset']}")
+    
+    if fields.get('sort') is not None:
+        if fields['sort'] not in VIEW_SORT_KEYS:
+            raise ValueError(f"不支持的排序字段: {fields['sort']}")
+        view['sort'] = fields['sort']
+    
+    if fields.get('order') is not None:
+        if fields['order'] not in ('desc', 'asc'):
+            raise ValueError(f"无效的排序方向: {fields['order']}")
+        view['order'] = fields['order']
+    
+    return view
+
+def view_key(view):
+    """视图的可哈希键，相同键的客户端共享同一份计算结果"""
+    return (view['timeframe'], view['inst_type'], view['search'], view['watchlist'],
+            view['limit'], view['offset'], view['losers_offset'], view['sort'], view['order'])
+
+def view_matches(inst_id, view):
+    if view['watchlist'] and inst_id not in view['watchlist']:
+        return False
+    if view['search'] and view['search'] not in inst_id and view['search'] not in format_inst_id(inst_id).upper():
+        return False
+    return True
+
+def get_table_data(timeframe=None, inst_type=None, view=None):
+    """按视图从有序索引中分页取出涨幅榜和跌幅榜
+
+    默认按主周期涨跌幅排序，各取前50名；视图可指定周期、产品类型、搜索关键字、自选列表、
+    行数、偏移和排序字段。排序基于覆盖全部产品的索引，涨跌幅排序时跌幅榜按跌幅从大到小，
+    其他字段两个榜单按相同方向排序。只为当前页的产品构建表格行。
+    """
+    if view is None:
+        view = normalize_view({'timeframe': timeframe, 'inst_type': inst_type})
+    timeframe = view['timeframe']
+    offset, limit = view['offset'], view['limit']
+    losers_offset = offset if view['losers_offset'] is None else view['losers_offset']
+    empty = {'gainers': [], 'losers': [], 'timeframe': timeframe,
+             'offset': offset, 'losers_offset': losers_offset, 'limit': limit,
+             'gainers_total': 0, 'losers_total': 0}
+    try:
+        change_index = index_name('change_rate', timeframe)
+        sort_index = index_name(view['sort'], timeframe)
+        descending = view['order'] == 'desc'
+        matches = (lambda inst_id: view_matches(inst_id, view)) if view['search'] else None
+        candidates = view['watchlist'] or None
+        
+        gainers, gainers_total = price_store.rank_page(
+            change_index, sort_index, view['inst_type'], 1, descending, offset, limit, matches, candidates)
+        # 涨跌幅排序时跌幅榜方向相反，跌得最多的排在最前
+        losers_descending = not descending if view['sort'] == 'change_rate' else descending
+        losers, losers_total = price_store.rank_page(
+            change_index, sort_index, view['inst_type'], -1, losers_descending, losers_offset, limit,
+            matches, candidates)
+        
+        def build_page(page):
+            return [build_table_row(inst_id, item, get_item_change_rate(item, timeframe)) for inst_id, item in page]
+        
+        return {
+            'gainers': build_page(gainers),
+            'losers': build_page(losers),
+            'timeframe': timeframe,
+            'offset': offset,
+            'losers_offset': losers_offset,
+            'limit': limit,
+            'gainers_total': gainers_total,
+            'losers_total': losers_total
+        }
+    except:
+        return empty
+
+def get_memory_stats():
+    import psutil
+    import os
+    
     try:
-        data = price_store.get_all()
-        
-        if not data:
-            return {'gainers': [], 'losers': []}
-        
-        gainers = []
-        for inst_id, item in data.items():
-            if item['change_rate'] > 0:
-                gainers.append({
-                    'inst_id': inst_id,
-                    'display_id': format_inst_id(inst_id),
-                    'change_rate': item['change_rate'],
-                    'close_price': item['close_price'],
-                    'volume_24h': item.get('volume_24h', 0),
-                    'volume_24h_formatted': item.get('volume_24h_formatted', '--'),
-                    'volume_1h': item.get('volume_1h', 0),
-                    'volume_1h_formatted': item.get('volume_1h_formatted', '--'),
-                    'volume_freshness': item.get('volume_freshness', 0),
-                    'oi_ccy': item.get('oi_ccy', 0),
-                    'oi_ccy_formatted': item.get('oi_ccy_formatted', '--'),
-                    'oi_change_rate': item.get('oi_change_rate', 0),
-                    'oi_history_ccy_formatted': item.get('oi_history_ccy_formatted', '--'),
-                    'timestamp': datetime.fromtimestamp(item['timestamp']).strftime("%H:%M:%S")
-                })
-        
-        losers = []
-        for inst_id, item in data.items():
-            if item['change_rate'] < 0:
-                losers.append({
-                    'inst_id': inst_id,
-                    'display_id': format_inst_id(inst_id),
-                    'change_rate': item['change_rate'],
-                    'close_price': item['close_price'],
-                    'volume_24h': item.get('volume_24h', 0),
-                    'volume_24h_formatted': item.get('volume_24h_formatted', '--'),
-                    'volume_1h': item.get('volume_1h', 0),
-                    'volume_1h_formatted': item.get('volume_1h_formatted', '--'),
-                    'volume_freshness': item.get('volume_freshness', 0),
-                    'oi_ccy': item.get('oi_ccy', 0),
-                    'oi_ccy_formatted': item.get('oi_ccy_formatted', '--'),
-                    'oi_change_rate': item.get('oi_change_rate', 0),
-                    'oi_history_ccy_formatted': item.get('oi_history_ccy_formatted', '--'),
-                    'timestamp': datetime.fromtimestamp(item['timestamp']).strftime("%H:%M:%S")
-                })
-        
-        gainers.sort(key=lambda x: x['change_rate'], reverse=True)
-        losers.sort(key=lambda x: x['change_rate'])
+        process = psutil.Process(os.getpid())
+        memory_info = process.memory_info()
+        
+        memory_mb = memory_info.rss / 1024 / 1024
         
         return {
-            'gainers': gainers[:50],
-            'losers': losers[:50]
+            'memory_usage': memory_mb,
+            'process_memory': round(memory_mb, 1),
+            'collected_data': price_store.count(),
+            'subscribed': total_products,
+            'clients': len(clients),
+            'volume_cache': len(volume_24h_data),
+            'oi_cache': len(oi_data),
+            'oi_history_cache': len(oi_history_data),
+            'universe': instrument_universe.get_stats(),
+            'startup_backfill': dict(startup_backfill),
+            'response_cache': data_response_cache.get_stats(),
+            'broadcast': broadcast_hub.get_stats(),
+            'state_bus': state_bus_client.get_stats() if state_bus_client is not None else None,
+            'cluster': cluster_node.get_stats() if cluster_node is not None else None,
+            'alerts': alert_engine.get_stats(),
+            'partitions': price_store.partition_counts()
         }
     except:
-        return {'gainers': [], 'losers': []}
+        return {
+            'memory_usage': 0,
+            'process_memory': 0,
+            'collected_data': price_store.count(),
+            'subscribed': total_products,
+            'clients': len(clients),
+            'volume_cache': len(volume_24h_data),
+            'oi_cache': len(oi_data),
+            'oi_history_cache': len(oi_history_data)
+        }
+
+def build_full_update(view=None, stats=None):
+    """构建指定视图的full_update消息，stats可由调用方按周期和产品类型共享"""
+    view = view or default_view()
+    return {
+        'type': 'full_update',
+        'timestamp': datetime.now().isoformat(),
+        'stats': stats if stats is not None else get_statistics(view['timeframe'], view['inst_type']),
+        'tables': get_table_data(view=view),
+        'timeframes': AGG_TIMEFRAMES,
+        'view': {**view, 'watchlist': list(view['watchlist'])}
+    }
+
+def build_full_update_message(view=None, stats=None):
+    """构建full_update消息（JSON字符串）"""
+    return json.dumps(build_full_update(view, stats))
+
+def pack_table_rows(rows):
+    """把行数据转为按MSGPACK_ROW_COLUMNS排列的列数组，时间转为当天秒数，多周期涨跌幅按AGG_TIMEFRAMES排列"""
+    columns = []
+    for column in MSGPACK_ROW_COLUMNS:
+        if column == 'timestamp':
+            values = []
+            for row in rows:
+                hour, minute, second = (int(part) for part in row['timestamp'].split(':'))
+                values.append(hour * 3600 + minute * 60 + second)
+        elif column == 'tf_change_rates':
+            values = [[row['tf_change_rates'].get(tf, 0) for tf in AGG_TIMEFRAMES] for row in rows]
+        else:
+            values = [row.get(column, 0) for row in rows]
+        columns.append(values)
+    return columns
+
+def pack_full_update(update):
+    """按固定结构把full_update编码为MessagePack
+
+    [格式版本, 'full_update', 时间戳毫秒, 统计数组, 周期列表, 当前周期, 涨幅榜列数组, 跌幅榜列数组,
+     [offset, limit, 涨幅总数, 跌幅总数, 跌幅榜offset], 视图, 广播序号, 广播通道]
+    """
+    tables = update['tables']
+    frame = [
+        1,
+        'full_update',
+        int(time.time() * 1000),
+        [update['stats'].get(field, 0) for field in MSGPACK_STATS_FIELDS],
+        update['timeframes'],
+        tables['timeframe'],
+        pack_table_rows(tables['gainers']),
+        pack_table_rows(tables['losers']),
+        [tables.get('offset', 0), tables.get('limit', 0),
+         tables.get('gainers_total', 0), tables.get('losers_total', 0),
+         tables.get('losers_offset', tables.get('offset', 0))],
+        update['view'],
+        update.get('seq'),
+        update.get('stream')
+    ]
+    return msgpack.packb(frame)
+
+def pack_update_delta(delta):
+    """按固定结构把增量编码为MessagePack，变化的行与快照一样按列编码
+
+    [格式版本, 'delta', 时间戳毫秒, 统计数组, 周期列表, 当前周期, 涨幅榜变化行列数组, 跌幅榜变化行列数组,
+     涨幅榜新顺序或None, 跌幅榜新顺序或None, [offset, limit, 涨幅总数, 跌幅总数, 跌幅榜offset], 广播序号, 基准序号]
+    """
+    tables = delta['tables']
+    frame = [
+        1,
+        'delta',
+        int(time.time() * 1000),
+        [delta['stats'].get(field, 0) for field in MSGPACK_STATS_FIELDS],
+        AGG_TIMEFRAMES,
+        tables['timeframe'],
+        pack_table_rows(list(tables['gainers']['rows'].values())),
+        pack_table_rows(list(tables['losers']['rows'].values())),
+        tables['gainers']['order'],
+        tables['losers']['order'],
+        [tables.get('offset', 0), tables.get('limit', 0),
+         tables.get('gainers_total', 0), tables.get('losers_total', 0),
+         tables.get('losers_offset', tables.get('offset', 0))],
+        delta['seq'],
+        delta['base']
+    ]
+    return msgpack.packb(frame)
+
+def encode_update_delta(delta, wire='json'):
+    """按客户端协商的格式编码增量，json返回str，msgpack返回bytes"""
+    if wire == 'msgpack':
+        return pack_update_delta(delta)
+    return json.dumps(delta)
+
+def encode_full_update(update, wire='json'):
+    """按客户端协商的格式编码，json返回str，msgpack返回bytes"""
+    if wire == 'msgpack':
+        return pack_full_update(update)
+    return json.dumps(update)
+
+async def send_frame(ws, frame):
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_str(frame)
+
+async def send_full_update(ws, view=None):
+    wire = client_wire_formats.get(ws, 'json')
+    channel = broadcast_hub.channels.get(view_key(view or default_view()))
+    if channel is not None and channel.snapshot is not None:
+        # 视图已有广播通道时复用本节拍已编码的快照，重连高峰时不逐个重建
+        await send_frame(ws, channel.frame(wire))
+        client_stream_positions[ws] = (channel.id, channel.seq)
+    else:
+        await send_frame(ws, encode_full_update(build_full_update(view), wire))
+        client_stream_positions.pop(ws, None)  # 不带序号的快照之后下一节拍发送完整快照
+
+def build_update_delta(previous, update):
+    """比较同一视图前后两次full_update，生成只包含变化行的增量
+
+    每个榜单给出新的inst_id顺序（顺序未变时为None）和变化或新增的行，客户端用旧行和变化行
+    按顺序重建榜单；统计和分页等小字段每次都完整带上。
+    """
+    tables = {key: value for key, value in update['tables'].items() if key not in ('gainers', 'losers')}
+    for name in ('gainers', 'losers'):
+        old_rows = {row['inst_id']: row for row in previous['tables'].get(name, [])}
+        rows = update['tables'].get(name, [])
+        order = [row['inst_id'] for row in rows]
+        tables[name] = {
+            'order': None if order == list(old_rows) else order,
+            'rows': {row['inst_id']: row for row in rows if old_rows.get(row['inst_id']) != row}
+        }
+    return {
+        'type': 'delta',
+        'seq': update['seq'],
+        'base': previous['seq'],
+        'timestamp': update['timestamp'],
+        'stats': update['stats'],
+        'tables': tables
+    }
+
+def format_sse_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.split('\n'))
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+class StreamSubscriber:
+    """一个SSE连接的发送队列，synced为False时下一个节拍先发送快照"""
+    
+    def __init__(self, synced=False):
+        self.queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self.synced = synced
+        self.resyncs = 0
+    
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # 消费者跟不上时丢弃积压的增量，改发一次最新快照
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.synced = False
+            self.resyncs += 1
+    
+    def close(self):
+        """结束该SSE连接"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class ViewChannel:
+    """一个视图的广播通道
+
+    每个广播节拍构建一次快照，按需为各种格式编码一次，并与上一快照比较生成增量。增量连同预编码的
+    SSE事件保存在有界的重放缓冲区中，断线的订阅者凭最后收到的序号只补发缺失的增量。
+    """
+    
+    def __init__(self, view, epoch):
+        self.view = view
+        self.key = view_key(view)
+        # 事件ID带上进程和视图标识，其他视图或重启前的ID不会被误当作可续传
+        self.id = f"{epoch}{zlib.crc32(repr(self.key).encode('utf-8')):08x}"
+        self.snapshot = None
+        self.frames = {}
+        self.history = deque(maxlen=BROADCAST_REPLAY_SIZE)  # (seq, 基准seq, JSON文本, SSE事件, 增量)
+        self.streams = set()
+        self.last_active = time.time()
+    
+    @property
+    def seq(self):
+        return self.snapshot['seq'] if self.snapshot else 0
+    
+    def event_id(self, seq):
+        return f"{self.id}:{seq}"
+    
+    def publish(self, seq, update):
+        update['seq'] = seq
+        update['stream'] = self.id
+        if self.snapshot is not None:
+            delta = build_update_delta(self.snapshot, update)
+            text = json.dumps(delta)
+            self.history.append((seq, self.snapshot['seq'], text, format_sse_event('delta', text, self.event_id(seq)), delta))
+        else:
+            self.history.clear()
+        self.snapshot = update
+        self.frames = {}
+        
+        for subscriber in list(self.streams):
+            if subscriber.synced and self.history and self.history[-1][0] == seq:
+                subscriber.push(self.history[-1][3])
+            else:
+                subscriber.synced = True
+                subscriber.push(self.frame('sse'))
+    
+    def frame(self, wire):
+        """当前快照的编码结果，同一节拍内每种格式只编码一次"""
+        if wire not in self.frames:
+            if wire == 'sse':
+                self.frames[wire] = format_sse_event('snapshot', json.dumps(self.snapshot), self.event_id(self.seq))
+            else:
+                self.frames[wire] = encode_full_update(self.snapshot, wire)
+        return self.frames[wire]
+    
+    def delta_frame(self, entry, wire):
+        """重放缓冲区中一个增量按客户端格式的编码结果，最新一个增量每种格式只编码一次"""
+        if wire == 'json':
+            return entry[2]
+        if entry[0] != self.seq:
+            return encode_update_delta(entry[4], wire)
+        key = ('delta', wire)
+        if key not in self.frames:
+            self.frames[key] = encode_update_delta(entry[4], wire)
+        return self.frames[key]
+    
+    def live_frame(self, position, wire):
+        """广播给/ws客户端的下一帧：客户端停在本通道上一节拍时发送最新增量，否则发送当前快照
+
+        大部分行都变化时增量可能比快照还大，此时同样发送快照。
+        """
+        snapshot = self.frame(wire)
+        if self.history and self.history[-1][0] == self.seq and position == (self.id, self.history[-1][1]):
+            delta = self.delta_frame(self.history[-1], wire)
+            if len(delta) < len(snapshot):
+                return delta
+        return snapshot
+    
+    def replay(self, since):
+        """返回序号since之后的增量列表；since无法续传（过旧或未知）时返回None"""
+        if since is None or self.snapshot is None or since > self.seq:
+            return None
+        if since == self.seq:
+            return []
+        if not self.history or since < self.history[0][1]:
+            return None
+        return [entry for entry in self.history if entry[0] > since]
+    
+    def parse_event_id(self, event_id):
+        channel_id, _, seq = (event_id or '').partition(':')
+        if channel_id != self.id:
+            return None
+        try:
+            return int(seq)
+        except ValueError:
+            return None
 
-def get_memory_stats():
-    import psutil
-    import os
+class BroadcastHub:
+    """按视图管理广播通道，广播工作者每个节拍调用一次publish"""
     
-    try:
-        process = psutil.Process(os.getpid())
-        memory_info = process.memory_info()
-        
-        memory_mb = memory_info.rss / 1024 / 1024
+    def __init__(self):
+        self.epoch = f"{random.getrandbits(32):08x}"
+        self.channels = {}
+        self.channels_by_id = {}
+        self.seq = 0
+        self.resumes = {'replayed': 0, 'snapshot': 0, 'failed': 0}
+    
+    def channel(self, view):
+        key = view_key(view)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = ViewChannel(view, self.epoch)
+            self.channels_by_id[channel.id] = channel
+        channel.last_active = time.time()
+        return channel
+    
+    def find(self, event_id):
+        """按"通道:序号"形式的续传标识查找通道，通道已过期或来自其他进程时返回None"""
+        return self.channels_by_id.get((event_id or '').partition(':')[0])
+    
+    def publish(self, views):
+        """推进一个广播节拍：为views和仍在保留期内的通道构建快照和增量，并推送给SSE订阅者"""
+        self.seq += 1
+        now = time.time()
+        for view in views:
+            self.channel(view)
         
+        stats_by_view = {}  # 同一周期和产品类型的通道共享统计
+        for key, channel in list(self.channels.items()):
+            if channel.streams:
+                channel.last_active = now
+            elif now - channel.last_active > BROADCAST_CHANNEL_TTL:
+                del self.channels[key]
+                self.channels_by_id.pop(channel.id, None)
+                continue
+            stats_key = (channel.view['timeframe'], channel.view['inst_type'])
+            if stats_key not in stats_by_view:
+                stats_by_view[stats_key] = get_statistics(*stats_key)
+            channel.publish(self.seq, build_full_update(channel.view, stats_by_view[stats_key]))
+    
+    def get_stats(self):
         return {
-            'memory_usage': memory_mb,
-            'process_memory': round(memory_mb, 1),
-            'collected_data': price_store.count(),
-            'subscribed': total_products,
-            'clients': len(clients),
-            'volume_cache': len(volume_24h_data),
-            'oi_cache': len(oi_data),
-            'oi_history_cache': len(oi_history_data)
-        }
-    except:
-        return {
-            'memory_usage': 0,
-            'process_memory': 0,
-            'collected_data': price_store.count(),
-            'subscribed': total_products,
-            'clients': len(clients),
-            'volume_cache': len(volume_24h_data),
-            'oi_cache': len(oi_data),
-            'oi_history_cache': len(oi_history_data)
+            'seq': self.seq,
+            'channels': len(self.channels),
+            'streams': sum(len(channel.streams) for channel in self.channels.values()),
+            'replay_entries': sum(len(channel.history) for channel in self.channels.values()),
+            'resumes': dict(self.resumes)
         }
 
+broadcast_hub = BroadcastHub()
+
 async def broadcast_worker():
     last_broadcast_time = 0
     broadcast_interval = 1  # 保持1秒更新频率
-    last_connection_status_time = 0
-    connection_status_interval = 5
-    last_volume_stats_time = 0
-    volume_stats_interval = 10
     
     while running:
         try:
             current_time = time.time()
             
-            if not clients:
+            if not clients and not broadcast_hub.channels:
                 await asyncio.sleep(1)
                 continue
             
-            if current_time - last_connection_status_time >= connection_status_interval:
-                await broadcast_connection_status()
-                last_connection_status_time = current_time
-            
-            if current_time - last_volume_stats_time >= volume_stats_interval:
-                await broadcast_volume_stats()
-                last_volume_stats_time = current_time
+            # 启动回填完成前不广播不完整的榜单
+            if not startup_table_ready():
+                await asyncio.sleep(0.1)
+                continue
             
             # 使用更高效的数据获取方式
             if current_time - last_broadcast_time >= broadcast_interval:
-                stats = get_statistics()
-                tables = get_table_data()
+                # 按客户端订阅的视图分组，相同视图由同一广播通道计算和编码一次，SSE订阅者共用
+                view_groups = {}
+                for ws in list(clients):
+                    view = client_views.get(ws) or default_view()
+                    view_groups.setdefault(view_key(view), (view, []))[1].append(ws)
                 
-                broadcast_msg = json.dumps({
-                    'type': 'full_update',
-                    'timestamp': datetime.now().isoformat(),
-                    'stats': stats,
-                    'tables': tables
-                })
+                broadcast_hub.publish([view for view, _ in view_groups.values()])
                 
                 disconnected_clients = []
-                for ws in list(clients):
-                    try:
-                        await ws.send_str(broadcast_msg)
-                    except:
-                        disconnected_clients.append(ws)
+                for view, group in view_groups.values():
+                    channel = broadcast_hub.channel(view)
+                    for ws in group:
+                        try:
+                            wire = client_wire_formats.get(ws, 'json')
+                            await send_frame(ws, channel.live_frame(client_stream_positions.get(ws), wire))
+                            client_stream_positions[ws] = (channel.id, channel.seq)
+                        except:
+                            disconnected_clients.append(ws)
                 
                 for ws in disconnected_clients:
                     clients.discard(ws)
@@ -1397,34 +4129,69 @@ async def broadcast_worker():
             print(f"广播工作者出错: {e}")
             await asyncio.sleep(1)
 
+async def resume_ws_session(ws, token):
+    """按客户端最后收到的广播标识恢复会话
+
+    恢复该通道的视图，补发缓冲区中缺失的增量；客户端已落后于重放缓冲区时只发送一次当前快照。
+    通道已过期或来自重启前的进程时返回False，由调用方按新连接处理。
+    """
+    channel = broadcast_hub.find(token)
+    if channel is None or channel.snapshot is None:
+        broadcast_hub.resumes['failed'] += 1
+        await ws.send_str(json.dumps({'type': 'session', 'resumed': False, 'replayed': 0, 'snapshot': False}))
+        return False
+    
+    client_views[ws] = channel.view
+    wire = client_wire_formats.get(ws, 'json')
+    backlog = channel.replay(channel.parse_event_id(token))
+    if backlog is None:
+        frames = [channel.frame(wire)]
+        broadcast_hub.resumes['snapshot'] += 1
+    else:
+        # 增量按连接协商的格式编码，与快照和实时广播一致
+        frames = [channel.delta_frame(entry, wire) for entry in backlog]
+        broadcast_hub.resumes['replayed'] += 1
+    
+    await ws.send_str(json.dumps({
+        'type': 'session',
+        'resumed': True,
+        'seq': channel.seq,
+        'replayed': len(backlog or []),
+        'snapshot': backlog is None
+    }))
+    for frame in frames:
+        await send_frame(ws, frame)
+    client_stream_positions[ws] = (channel.id, channel.seq)
+    return True
+
 async def websocket_handler(request):
-    ws = web.WebSocketResponse()
+    protocols = (WS_MSGPACK_PROTOCOL,) if WS_MSGPACK_ENABLED and msgpack is not None else ()
+    ws = web.WebSocketResponse(compress=WS_COMPRESSION, protocols=protocols)
     await ws.prepare(request)
     
-    clients.add(ws)
-    client_count = len(clients)
+    # 客户端在子协议中请求且服务端支持时使用MessagePack，否则保持JSON
+    client_wire_formats[ws] = 'msgpack' if ws.ws_protocol == WS_MSGPACK_PROTOCOL else 'json'
     
     try:
-        stats = get_statistics()
-        tables = get_table_data()
-        
-        await ws.send_str(json.dumps({
-            'type': 'full_update',
-            'timestamp': datetime.now().isoformat(),
-            'stats': stats,
-            'tables': tables
-        }))
-        
-        await ws.send_str(json.dumps({
-            'type': 'okx_connection_status',
-            'status': 'connected' if connection_manager_kline.is_connected() else 'disconnected',
-            'oi_status': 'connected' if connection_manager_oi.is_connected() else 'disconnected',
-            'timestamp': datetime.now().isoformat(),
-            'reconnect_count': reconnect_attempts,
-            'oi_reconnect_count': oi_reconnect_attempts
-        }))
-        
-        await broadcast_volume_stats()
+        # 断线重连的客户端带上最后收到的广播标识，只补发缺失的增量
+        resumed = False
+        if request.query.get('resume'):
+            resumed = await resume_ws_session(ws, request.query['resume'])
+        
+        # 补发完成后再加入广播，避免新快照插在补发的增量之间
+        clients.add(ws)
+        client_count = len(clients)
+        
+        # 启动回填期间由广播工作者在整表就绪后推送首个快照
+        if not resumed and startup_table_ready():
+            await send_full_update(ws)
+        
+        await ws.send_str(json.dumps(build_connection_status()))
+        
+        # 只发给新连接，重连高峰时不向所有客户端重复广播
+        await ws.send_str(build_volume_stats_message())
+        if ALERTS_ENABLED:
+            await ws.send_str(build_alert_history_message())
         
         async for msg in ws:
             if msg.type == web.WSMsgType.TEXT:
@@ -1432,27 +4199,59 @@ async def websocket_handler(request):
                     data = json.loads(msg.data)
                     
                     if data.get('type') == 'get_data':
-                        stats = get_statistics()
-                        tables = get_table_data()
-                        
+                        await send_full_update(ws, client_views.get(ws))
+                    
+                    elif data.get('type') in ('set_timeframe', 'subscribe_view'):
+                        # set_timeframe只修改周期；subscribe_view可同时修改过滤、自选、行数和排序，未提交的字段保持不变
+                        fields = data if data['type'] == 'subscribe_view' else {'timeframe': data.get('timeframe')}
+                        try:
+                            view = normalize_view(fields, client_views.get(ws))
+                        except ValueError as e:
+                            await ws.send_str(json.dumps({
+                                'type': 'command_response',
+                                'success': False,
+                                'message': str(e)
+                            }))
+                        else:
+                            client_views[ws] = view
+                            await send_full_update(ws, view)
+                    
+                    elif data.get('type') == 'search':
+                        try:
+                            limit = max(1, min(int(data.get('limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+                        except (TypeError, ValueError):
+                            limit = SEARCH_DEFAULT_LIMIT
+                        view = client_views.get(ws) or default_view()
                         await ws.send_str(json.dumps({
-                            'type': 'full_update',
-                            'timestamp': datetime.now().isoformat(),
-                            'stats': stats,
-                            'tables': tables
+                            'type': 'search_results',
+                            'request_id': data.get('request_id'),
+                            'query': data.get('query', ''),
+                            'results': search_instruments(data.get('query'), limit, view['timeframe'])
                         }))
                     
+                    elif data.get('type') == 'set_interest':
+                        # 榜单之外关注的产品：显式列表或搜索关键字，按需订阅模式下保持高频
+                        interest = {inst_id for inst_id in data.get('symbols') or [] if inst_id in inst_ids}
+                        search = str(data.get('search') or '').strip().upper()
+                        if search:
+                            interest.update(inst_id for inst_id in inst_ids if search in inst_id)
+                        client_interest[ws] = interest
+                    
                     elif data.get('type') == 'command':
                         command = data.get('command')
                         
-                        if command == 'clear':
-                            price_store.clear()
-                            last_received_time.clear()
-                            volume_24h_data.clear()
-                            volume_last_update.clear()
-                            oi_data.clear()
-                            oi_history_data.clear()
-                            oi_last_update.clear()
+                        source = replica_source()
+                        if source is not None and command in STATE_BUS_COMMANDS:
+                            # Web工作进程和集群跟随者没有采集数据，命令转发给采集进程/领导者执行
+                            forwarded = await source.send_command(command)
+                            await ws.send_str(json.dumps({
+                                'type': 'command_response',
+                                'success': forwarded,
+                                'message': f'已转发到采集进程: {command}' if forwarded else '采集进程未连接'
+                            }))
+                        
+                        elif command == 'clear':
+                            clear_collected_data()
                             await ws.send_str(json.dumps({
                                 'type': 'command_response',
                                 'success': True,
@@ -1526,6 +4325,10 @@ async def websocket_handler(request):
     
     finally:
         clients.discard(ws)
+        client_views.pop(ws, None)
+        client_interest.pop(ws, None)
+        client_wire_formats.pop(ws, None)
+        client_stream_positions.pop(ws, None)
     
     return ws
 
@@ -1555,6 +4358,10 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         .positive { color: var(--success); }
         .negative { color: var(--danger); }
         .tables-grid { display: grid; grid-template-columns: repeat(auto-fit, minmax(600px, 1fr)); gap: 15px; margin: 15px 0; }
+        .alerts-panel { background: white; padding: 10px 15px; border-radius: 6px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); font-size: 12px; }
+        .alerts-panel ul { list-style: none; margin: 5px 0 0; padding: 0; max-height: 120px; overflow-y: auto; }
+        .alerts-panel li { padding: 3px 0; border-bottom: 1px solid #eee; }
+        .alerts-panel li.fresh { background: #fff8e1; }
         .table-container { background: white; padding: 15px; border-radius: 6px; box-shadow: 0 1px 3px rgba(0,0,0,0.1); overflow: hidden; }
         table { width: 100%; border-collapse: collapse; font-size: 13px; }
         th, td { padding: 8px 10px; text-align: left; border-bottom: 1px solid #eee; }
@@ -1583,6 +4390,8 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         .clickable-row { 
             cursor: pointer; 
         }
+        .virtual-table td { white-space: nowrap; }
+        .virtual-spacer td { padding: 0; border: none; }
         .connection-status {
             font-size: 12px;
             padding: 3px 8px;
@@ -1669,6 +4478,12 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             <div class="update-time">
                 最后更新: <span id="last-update">--:--:--</span>
                 <span id="volume-update-info" style="margin-left: 10px; font-size: 11px;"></span>
+                <span style="margin-left: 10px; font-size: 12px;">
+                    涨跌周期:
+                    <select id="timeframe-select" onchange="setTimeframe(this.value)">
+                        <option value="1H" selected>1H</option>
+                    </select>
+                </span>
             </div>
         </div>
         
@@ -1705,6 +4520,11 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             </div>
         </div>
         
+        <div class="alerts-panel" id="alerts-panel" style="display: none;">
+            <div style="font-weight: 600;">告警 <span id="alert-count" style="color: var(--gray); font-weight: normal;"></span></div>
+            <ul id="alert-list"></ul>
+        </div>
+        
         <div class="tables-grid">
             <div class="table-container">
                 <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">
@@ -1713,13 +4533,13 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                         <input type="text" id="search-gainers" placeholder="搜索..." style="width: 100%;">
                     </div>
                 </div>
-                <div style="max-height: 400px; overflow-y: auto;">
+                <div id="gainers-scroll" style="max-height: 400px; overflow-y: auto;">
                     <table class="compact-table">
                         <thead>
                             <tr>
                                 <th>#</th>
                                 <th>产品</th>
-                                <th>涨跌</th>
+                                <th>涨跌(<span class="timeframe-label">1H</span>)</th>
                                 <th>价格</th>
                                 <th class="sortable-header sort-none" data-sort="volume24h" data-table="gainers">24h成交量<div class="sort-indicator"></div></th>
                                 <th class="sortable-header sort-none" data-sort="volume1h" data-table="gainers">1h成交量<div class="sort-indicator"></div></th>
@@ -1741,13 +4561,13 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                         <input type="text" id="search-losers" placeholder="搜索..." style="width: 100%;">
                     </div>
                 </div>
-                <div style="max-height: 400px; overflow-y: auto;">
+                <div id="losers-scroll" style="max-height: 400px; overflow-y: auto;">
                     <table class="compact-table">
                         <thead>
                             <tr>
                                 <th>#</th>
                                 <th>产品</th>
-                                <th>涨跌</th>
+                                <th>涨跌(<span class="timeframe-label">1H</span>)</th>
                                 <th>价格</th>
                                 <th class="sortable-header sort-none" data-sort="volume24h" data-table="losers">24h成交量<div class="sort-indicator"></div></th>
                                 <th class="sortable-header sort-none" data-sort="volume1h" data-table="losers">1h成交量<div class="sort-indicator"></div></th>
@@ -1774,6 +4594,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             <button onclick="sendCommand('update_volumes')" style="background: var(--success); color: white;">强制更新成交量</button>
             <button onclick="sendCommand('update_oi_history')" style="background: var(--success); color: white;">更新持仓量历史</button>
             <button onclick="resetAllSorting()" style="background: var(--warning); color: white;">重置排序</button>
+            <button id="virtual-toggle" onclick="toggleVirtualMode()" style="background: var(--primary); color: white;">全部产品</button>
             <div style="flex-grow: 1;"></div>
             <div style="font-size: 12px; color: var(--gray);">
                 <span id="queue-size">队列: 0</span> | 
@@ -1787,9 +4608,13 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         </div>
     </div>
     
+    <script src="/static/dashboard-worker.js"></script>
     <script>
         let ws = null;
+        let dataWorker = null;  // 解码/排序Worker，不可用时为null并在主线程处理
         let reconnectTimer = null;
+        let currentView = {};  // 已提交给服务器的视图字段，重连后恢复
+        let resumeToken = null;  // 最后收到的广播标识（通道:序号），重连时据此续传
         let memoryMonitorVisible = false;
         let lastUpdateTime = 0;
         let updateQueue = [];
@@ -1799,36 +4624,59 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         const BATCH_UPDATE_INTERVAL = 50; // 50ms更新一次，而不是立即更新
         
         // 排序状态 - 修复排序逻辑
+        // 表头排序字段对应的服务器索引字段
+        const SERVER_SORT_KEYS = {volume24h: 'volume_24h', volume1h: 'volume_1h', oiChange: 'oi_change_rate'};
+        
+        // 行数据由服务器按排序字段排名后按序渲染，这里只记录表头状态
         let sortStates = {
             gainers: {
                 currentSort: null,  // null: 无排序, volume24h: 按24h成交量, volume1h: 按1h成交量, oiChange: 按持仓量变化
-                sortDirection: 'none', // 'none': 无排序, 'asc': 升序, 'desc': 降序
-                data: [],
-                originalOrder: []    // 原始涨跌幅排序顺序
+                sortDirection: 'none' // 'none': 无排序, 'asc': 升序, 'desc': 降序
             },
             losers: {
                 currentSort: null,
-                sortDirection: 'none',
-                data: [],
-                originalOrder: []
+                sortDirection: 'none'
             }
         };
         
-        // 性能监控
+        // 虚拟滚动：只渲染可视区域及少量预渲染行，服务端按滚动位置推送对应的行窗口
+        const DEFAULT_TABLE_ROWS = 50;       // 与服务端DEFAULT_TABLE_SIZE一致
+        const VIRTUAL_PAGE_SIZE = 120;       // 每个榜单向服务器订阅的窗口行数，不超过MAX_TABLE_SIZE
+        const VIRTUAL_OVERSCAN = 8;          // 可视区域上下额外渲染的行数
+        const VIRTUAL_REFETCH_MARGIN = 20;   // 可视区域距窗口边缘少于该行数时请求新窗口
+        const VIRTUAL_DEFAULT_ROW_HEIGHT = 31;
+        const VIRTUAL_OFFSET_FIELDS = {gainers: 'offset', losers: 'losers_offset'};
+        let virtualMode = false;
+        let virtualRowHeight = 0;  // 首次渲染后按实际行高测量
+        const virtualStates = {
+            gainers: {rows: [], offset: 0, total: 0, requested: 0, frame: 0},
+            losers: {rows: [], offset: 0, total: 0, requested: 0, frame: 0}
+        };
+        
+        // 性能监控：worker为解码+过滤+排序耗时，render为DOM更新耗时
         let performanceStats = {
+            mode: 'worker',
             totalUpdates: 0,
             lastRenderTime: 0,
-            avgRenderTime: 0
+            avgRenderTime: 0,
+            workerUpdates: 0,
+            lastDecodeTime: 0,
+            lastPrepareTime: 0,
+            lastWorkerTime: 0,
+            avgWorkerTime: 0,
+            lastLatency: 0  // 收到消息到Worker结果返回主线程的耗时
         };
         
         function updateOKXConnectionStatus(data) {
             const klineElement = document.getElementById('okx-kline-status');
             const oiElement = document.getElementById('okx-oi-status');
             
-            klineElement.textContent = data.status === 'connected' ? 'K线已连接' : 'K线断开';
+            const formatRtt = (liveness) => (liveness && liveness.rtt_ms !== null && liveness.rtt_ms !== undefined) ? ` (${liveness.rtt_ms}ms)` : '';
+            
+            klineElement.textContent = data.status === 'connected' ? 'K线已连接' + formatRtt(data.kline_liveness) : 'K线断开';
             klineElement.className = 'connection-status ' + data.status;
             
-            oiElement.textContent = data.oi_status === 'connected' ? '持仓量已连接' : '持仓量断开';
+            oiElement.textContent = data.oi_status === 'connected' ? '持仓量已连接' + formatRtt(data.oi_liveness) : '持仓量断开';
             oiElement.className = 'connection-status ' + data.oi_status;
             
             if (data.reconnect_count !== undefined) {
@@ -1843,14 +4691,21 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             if (ws && ws.readyState === WebSocket.OPEN) return;
             
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${protocol}//${window.location.host}/ws`;
+            const resume = resumeToken ? `?resume=${encodeURIComponent(resumeToken)}` : '';
+            const wsUrl = `${protocol}//${window.location.host}/ws${resume}`;
             
-            ws = new WebSocket(wsUrl);
+            // 页面地址带 ?wire=msgpack 时请求二进制格式，服务端不支持时自动回退为JSON
+            const wantMsgpack = new URLSearchParams(window.location.search).get('wire') === 'msgpack';
+            ws = wantMsgpack ? new WebSocket(wsUrl, [MSGPACK_PROTOCOL]) : new WebSocket(wsUrl);
+            ws.binaryType = 'arraybuffer';
             
             ws.onopen = () => {
                 console.log('WebSocket连接已建立');
                 updateStatus('connected');
-                ws.send(JSON.stringify({type: 'get_data'}));
+                // 带续传标识时等待服务端的session消息，续传失败再重新请求数据
+                if (!resumeToken) {
+                    requestFullData();
+                }
                 if (reconnectTimer) {
                     clearTimeout(reconnectTimer);
                     reconnectTimer = null;
@@ -1858,45 +4713,18 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             };
             
             ws.onmessage = (event) => {
-                try {
-                    const data = JSON.parse(event.data);
-                    
-                    switch(data.type) {
-                        case 'full_update':
-                            // 使用队列批量处理，避免频繁更新导致的卡顿
-                            queueUpdate(() => {
-                                updateStats(data.stats);
-                                updateTablesWithSort(data.tables);
-                                document.getElementById('last-update').textContent = formatTime(new Date());
-                            });
-                            break;
-                        case 'memory_stats':
-                            updateMemoryStats(data);
-                            break;
-                        case 'queue_stats':
-                            document.getElementById('queue-size').textContent = `队列: ${data.size}`;
-                            break;
-                        case 'command_response':
-                            showNotification(data.message, data.success ? 'success' : 'error');
-                            break;
-                        case 'okx_connection_status':
-                            updateOKXConnectionStatus(data);
-                            break;
-                        case 'volume_update_stats':
-                            updateVolumeStats(data);
-                            break;
-                    }
-                    
-                } catch (error) {
-                    console.error('处理消息时出错:', error);
-                }
+                // 解码交给Worker，二进制帧直接转移所有权，不做拷贝
+                const transfer = typeof event.data === 'string' ? [] : [event.data];
+                postToWorker({cmd: 'frame', data: event.data, received: performance.now()}, transfer);
             };
             
-            ws.onclose = () => {
+            ws.onclose = (event) => {
                 console.log('WebSocket连接已关闭');
                 updateStatus('disconnected');
                 if (!reconnectTimer) {
-                    reconnectTimer = setTimeout(initWebSocket, 3000);
+                    // 1012: 服务端平滑重启，新进程已在服务，短暂随机延迟后立即重连
+                    const delay = event.code === 1012 ? 200 + Math.random() * 800 : 3000;
+                    reconnectTimer = setTimeout(initWebSocket, delay);
                 }
             };
             
@@ -1906,6 +4734,161 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             };
         }
         
+        function requestFullData() {
+            ws.send(JSON.stringify({type: 'get_data'}));
+            // 重连后恢复之前订阅的视图（周期、搜索等）
+            if (Object.keys(currentView).length > 0) {
+                subscribeView({});
+            }
+        }
+        
+        function initDataWorker() {
+            if (typeof Worker === 'undefined') {
+                performanceStats.mode = 'main-thread';
+                return;
+            }
+            try {
+                dataWorker = new Worker('/static/dashboard-worker.js');
+            } catch (error) {
+                console.warn('无法创建Worker，改为主线程处理:', error);
+                performanceStats.mode = 'main-thread';
+                return;
+            }
+            dataWorker.onmessage = (event) => handleWorkerReply(event.data);
+            dataWorker.onerror = (error) => {
+                // 脚本加载失败等情况下退回主线程，后续消息照常处理
+                console.warn('Worker出错，改为主线程处理:', error.message);
+                dataWorker.terminate();
+                dataWorker = null;
+                performanceStats.mode = 'main-thread';
+            };
+        }
+        
+        function postToWorker(message, transfer) {
+            if (dataWorker) {
+                dataWorker.postMessage(message, transfer || []);
+                return;
+            }
+            try {
+                const reply = handleWorkerMessage(message);
+                if (reply) handleWorkerReply(reply);
+            } catch (error) {
+                console.error('处理消息时出错:', error);
+            }
+        }
+        
+        function recordWorkerTiming(reply) {
+            const workerTime = reply.timing.decode + reply.timing.prepare;
+            performanceStats.workerUpdates++;
+            performanceStats.lastDecodeTime = reply.timing.decode;
+            performanceStats.lastPrepareTime = reply.timing.prepare;
+            performanceStats.lastWorkerTime = workerTime;
+            performanceStats.avgWorkerTime =
+                (performanceStats.avgWorkerTime * (performanceStats.workerUpdates - 1) + workerTime) / performanceStats.workerUpdates;
+            if (reply.received !== undefined) {
+                performanceStats.lastLatency = performance.now() - reply.received;
+            }
+        }
+        
+        function handleWorkerReply(reply) {
+            try {
+                switch(reply.type) {
+                    case 'full_update':
+                        recordWorkerTiming(reply);
+                        // 只有广播通道发出的快照带序号；其他快照之后的断线按新连接处理
+                        resumeToken = reply.data.seq ? `${reply.data.stream}:${reply.data.seq}` : null;
+                        // 使用队列批量处理，避免频繁更新导致的卡顿
+                        queueUpdate(() => {
+                            const data = reply.data;
+                            updateTimeframeOptions(data.timeframes, data.tables.timeframe);
+                            updateStats(data.stats);
+                            renderTables(data.tables);
+                            document.getElementById('last-update').textContent = formatTime(new Date());
+                        });
+                        break;
+                    case 'tables':
+                        recordWorkerTiming(reply);
+                        queueUpdate(() => renderTables(reply.tables));
+                        break;
+                    case 'message':
+                        handleServerMessage(reply.data);
+                        break;
+                    case 'resync':
+                        // 补发的增量与本地快照接不上，改为请求完整快照
+                        resumeToken = null;
+                        if (ws && ws.readyState === WebSocket.OPEN) {
+                            ws.send(JSON.stringify({type: 'get_data'}));
+                        }
+                        break;
+                    case 'error':
+                        console.error('处理消息时出错:', reply.message);
+                        break;
+                }
+            } catch (error) {
+                console.error('处理消息时出错:', error);
+            }
+        }
+        
+        function handleServerMessage(data) {
+            switch(data.type) {
+                case 'session':
+                    if (data.resumed) {
+                        console.log(`会话已续传: 补发${data.replayed}个增量${data.snapshot ? '，已落后于重放缓冲区，重新发送快照' : ''}`);
+                    } else {
+                        resumeToken = null;
+                        requestFullData();
+                    }
+                    break;
+                case 'memory_stats':
+                    updateMemoryStats(data);
+                    break;
+                case 'queue_stats':
+                    document.getElementById('queue-size').textContent = `队列: ${data.size}`;
+                    break;
+                case 'command_response':
+                    showNotification(data.message, data.success ? 'success' : 'error');
+                    break;
+                case 'okx_connection_status':
+                    updateOKXConnectionStatus(data);
+                    break;
+                case 'volume_update_stats':
+                    updateVolumeStats(data);
+                    break;
+                case 'alert_history':
+                    renderAlerts(data.alerts, false);
+                    break;
+                case 'alert':
+                    renderAlerts([data.alert], true);
+                    showNotification(`${data.alert.inst_id} ${data.alert.rule}`, 'alert');
+                    break;
+            }
+        }
+        
+        // 告警列表：最新的在最上面，重连时用服务端的最近告警整体替换
+        const MAX_ALERTS_SHOWN = 50;
+        let alertTotal = 0;
+        
+        function renderAlerts(alerts, fresh) {
+            const list = document.getElementById('alert-list');
+            if (!fresh) {
+                list.textContent = '';
+                alertTotal = 0;
+            }
+            for (const alert of alerts) {
+                const item = document.createElement('li');
+                const values = Object.entries(alert.values).map(([field, value]) => `${field}=${value}`).join(' ');
+                item.textContent = `${alert.timestamp.slice(11, 19)}  ${alert.inst_id}  ${alert.rule}  (${values})`;
+                if (fresh) item.className = 'fresh';
+                list.insertBefore(item, list.firstChild);
+                alertTotal++;
+            }
+            while (list.children.length > MAX_ALERTS_SHOWN) {
+                list.removeChild(list.lastChild);
+            }
+            document.getElementById('alert-count').textContent = alertTotal ? `(${alertTotal})` : '';
+            document.getElementById('alerts-panel').style.display = alertTotal ? 'block' : 'none';
+        }
+        
         // 批量更新队列
         function queueUpdate(callback) {
             updateQueue.push(callback);
@@ -1951,6 +4934,36 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             isProcessingUpdate = false;
         }
         
+        function updateTimeframeOptions(timeframes, current) {
+            const select = document.getElementById('timeframe-select');
+            if (timeframes && select.options.length !== timeframes.length) {
+                select.innerHTML = timeframes.map(tf => `<option value="${tf}">${tf}</option>`).join('');
+            }
+            if (current) {
+                select.value = current;
+                document.querySelectorAll('.timeframe-label').forEach(el => el.textContent = current);
+            }
+        }
+        
+        function subscribeView(fields) {
+            // 只提交变化的字段，服务器在当前视图上合并
+            Object.assign(currentView, fields);
+            resumeToken = null;  // 视图变化后旧通道的序号不再适用
+            if (ws && ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({type: 'subscribe_view', ...currentView}));
+            }
+        }
+        
+        function setTimeframe(timeframe) {
+            subscribeView({timeframe: timeframe});
+        }
+        
+        function formatTimeframeRates(rates) {
+            return Object.entries(rates || {})
+                .map(([tf, rate]) => `${tf}: ${rate >= 0 ? '+' : ''}${rate.toFixed(2)}%`)
+                .join(', ');
+        }
+        
         function updateStatus(status) {
             const dot = document.getElementById('status-dot');
             const text = document.getElementById('status-text');
@@ -2007,200 +5020,299 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             }
         }
         
-        function parseVolumeValue(volumeStr) {
-            // 解析中文单位成交量字符串为数字
-            if (volumeStr === '--' || volumeStr === '' || volumeStr === undefined) {
-                return -1; // 特殊值，表示没有数据，始终排在末尾
-            }
+        function renderTables(tables) {
+            // 行已由Worker过滤并排序，这里只更新DOM
+            const startTime = performance.now();
             
-            try {
-                if (volumeStr.includes('亿')) {
-                    return parseFloat(volumeStr.replace('亿', '')) * 100000000;
-                } else if (volumeStr.includes('万')) {
-                    return parseFloat(volumeStr.replace('万', '')) * 10000;
-                } else if (volumeStr.includes('千')) {
-                    return parseFloat(volumeStr.replace('千', '')) * 1000;
+            ['gainers', 'losers'].forEach(type => {
+                const rows = tables[type] || [];
+                if (virtualMode) {
+                    const state = virtualStates[type];
+                    state.rows = rows;
+                    state.offset = (type === 'losers' ? tables.losers_offset : tables.offset) || 0;
+                    state.total = tables[`${type}_total`] || 0;
+                    renderVirtualTable(type);
                 } else {
-                    return parseFloat(volumeStr);
+                    updateTable(type, rows);
                 }
-            } catch (e) {
-                return -1;
-            }
+                document.getElementById(`${type}-count`).textContent =
+                    virtualMode ? virtualStates[type].total : rows.length;
+            });
+            
+            const endTime = performance.now();
+            console.log(`表格更新耗时: ${(endTime - startTime).toFixed(2)}ms`);
         }
         
-        function sortData(data, sortKey, sortDirection) {
-            if (!data || data.length === 0) return data;
+        function renderVirtualTable(type) {
+            const container = document.getElementById(`${type}-scroll`);
+            const state = virtualStates[type];
+            const rowHeight = virtualRowHeight || VIRTUAL_DEFAULT_ROW_HEIGHT;
+            const first = Math.min(Math.floor(container.scrollTop / rowHeight), state.total);
+            const visible = Math.ceil(container.clientHeight / rowHeight) + 1;
             
-            // 对数据进行排序，-1表示没有数据，始终排在末尾
-            return [...data].sort((a, b) => {
-                let aValue, bValue;
-                
-                if (sortKey === 'volume24h') {
-                    aValue = parseVolumeValue(a.volume_24h_formatted);
-                    bValue = parseVolumeValue(b.volume_24h_formatted);
-                } else if (sortKey === 'volume1h') {
-                    aValue = parseVolumeValue(a.volume_1h_formatted);
-                    bValue = parseVolumeValue(b.volume_1h_formatted);
-                } else if (sortKey === 'oiChange') {
-                    aValue = a.oi_change_rate || 0;
-                    bValue = b.oi_change_rate || 0;
-                } else {
-                    return 0; // 不排序
-                }
-                
-                // 如果两个都没有数据，保持原顺序
-                if (aValue === -1 && bValue === -1) return 0;
-                
-                // 如果一个有数据，一个没有，有数据的排在前面（无论升序降序）
-                if (aValue === -1) return 1; // a没有数据，b有数据，b应该排在前面
-                if (bValue === -1) return -1; // b没有数据，a有数据，a应该排在前面
-                
-                // 两个都有数据，按数值排序
-                if (sortDirection === 'asc') {
-                    return aValue - bValue; // 从小到大
-                } else {
-                    return bValue - aValue; // 从大到小
-                }
+            // 可视区域与已收到窗口的交集，其余部分用占位行撑开滚动高度
+            const start = Math.max(first - VIRTUAL_OVERSCAN, state.offset, 0);
+            const end = Math.min(first + visible + VIRTUAL_OVERSCAN, state.offset + state.rows.length, state.total);
+            const rows = end > start ? state.rows.slice(start - state.offset, end - state.offset) : [];
+            const top = rows.length ? start : first;
+            const bottom = rows.length ? end : first;
+            updateTable(type, rows, {
+                rankBase: top,
+                padTop: top * rowHeight,
+                padBottom: (state.total - bottom) * rowHeight
             });
+            
+            if (!virtualRowHeight && rows.length) {
+                const row = document.querySelector(`#${type}-body tr.clickable-row`);
+                if (row && row.offsetHeight) virtualRowHeight = row.offsetHeight;
+            }
+            ensureVirtualWindow(type, first, visible);
         }
         
-        function updateTablesWithSort(tables) {
-            const startTime = performance.now();
+        function ensureVirtualWindow(type, first, visible) {
+            // 可视区域接近已订阅窗口边缘时，订阅以可视区域为中心的新窗口
+            const state = virtualStates[type];
+            const windowEnd = state.requested + VIRTUAL_PAGE_SIZE;
+            const nearTop = state.requested > 0 && first < state.requested + VIRTUAL_REFETCH_MARGIN;
+            const nearBottom = windowEnd < state.total && first + visible > windowEnd - VIRTUAL_REFETCH_MARGIN;
+            if (!nearTop && !nearBottom) return;
             
-            // 保存原始数据
-            if (tables.gainers) {
-                const originalData = [...tables.gainers];
-                sortStates.gainers.data = originalData;
-                
-                // 如果是第一次或重置排序，保存原始顺序
-                if (!sortStates.gainers.currentSort) {
-                    sortStates.gainers.originalOrder = originalData;
-                }
+            const centered = first - Math.floor((VIRTUAL_PAGE_SIZE - visible) / 2);
+            const offset = Math.max(0, Math.min(centered, state.total - VIRTUAL_PAGE_SIZE));
+            if (offset !== state.requested) {
+                state.requested = offset;
+                subscribeView({[VIRTUAL_OFFSET_FIELDS[type]]: offset});
             }
-            
-            if (tables.losers) {
-                const originalData = [...tables.losers];
-                sortStates.losers.data = originalData;
-                
-                if (!sortStates.losers.currentSort) {
-                    sortStates.losers.originalOrder = originalData;
+        }
+        
+        function onVirtualScroll(type) {
+            const state = virtualStates[type];
+            if (!virtualMode || state.frame) return;
+            state.frame = requestAnimationFrame(() => {
+                state.frame = 0;
+                renderVirtualTable(type);
+            });
+        }
+        
+        function resetVirtualScroll() {
+            // 排序或搜索变化后回到顶部，返回需要随视图一起提交的偏移字段
+            if (!virtualMode) return {offset: 0};
+            ['gainers', 'losers'].forEach(type => {
+                virtualStates[type].requested = 0;
+                document.getElementById(`${type}-scroll`).scrollTop = 0;
+            });
+            return {offset: 0, losers_offset: 0};
+        }
+        
+        function toggleVirtualMode() {
+            virtualMode = !virtualMode;
+            ['gainers', 'losers'].forEach(type => {
+                Object.assign(virtualStates[type], {rows: [], offset: 0, total: 0, requested: 0});
+                document.getElementById(`${type}-scroll`).scrollTop = 0;
+                document.getElementById(`${type}-body`).closest('table').classList.toggle('virtual-table', virtualMode);
+                // 虚拟滚动时行号即排名，不能再在本地过滤；退出时恢复为搜索框中的关键字
+                const input = document.getElementById(`search-${type}`);
+                postToWorker({cmd: 'filter', table: type, text: virtualMode || !input ? '' : input.value});
+            });
+            document.getElementById('virtual-toggle').textContent = virtualMode ? `前${DEFAULT_TABLE_ROWS}名` : '全部产品';
+            subscribeView(virtualMode
+                ? {limit: VIRTUAL_PAGE_SIZE, offset: 0, losers_offset: 0}
+                : {limit: DEFAULT_TABLE_ROWS, offset: 0, losers_offset: null});
+        }
+        
+        function initVirtualScroll() {
+            ['gainers', 'losers'].forEach(type => {
+                const container = document.getElementById(`${type}-scroll`);
+                if (container) {
+                    container.addEventListener('scroll', () => onVirtualScroll(type), {passive: true});
                 }
+            });
+        }
+        
+        // 按inst_id复用的行缓存：{row, cells, values}
+        const rowCache = {
+            gainers: new Map(),
+            losers: new Map()
+        };
+        
+        // 行渲染预算（约一帧）
+        const ROW_RENDER_BUDGET_MS = 16;
+        
+        function createRow() {
+            const row = document.createElement('tr');
+            row.className = 'clickable-row';
+            const cells = [];
+            for (let i = 0; i < 8; i++) {
+                cells.push(row.appendChild(document.createElement('td')));
             }
+            const name = document.createElement('span');
+            name.className = 'product-name';
+            cells[1].appendChild(name);
+            cells[2].style.fontWeight = 'bold';
+            cells[5].className = 'volume-cell';
+            return {row, cells, name, values: {}};
+        }
+        
+        // 只在值变化时写DOM，避免无谓的样式重算
+        function patchRow(entry, item, rank) {
+            const values = entry.values;
+            const cells = entry.cells;
+            const set = (key, value, apply) => {
+                if (values[key] !== value) {
+                    values[key] = value;
+                    apply(value);
+                }
+            };
             
-            // 应用当前排序状态
-            applyCurrentSort('gainers');
-            applyCurrentSort('losers');
+            const changeRate = item.change_rate || 0;
+            const isPositive = changeRate >= 0;
+            const volumeFreshness = item.volume_freshness || 0;
+            const oiChange = item.oi_change_rate || 0;
             
-            document.getElementById('gainers-count').textContent = (tables.gainers || []).length;
-            document.getElementById('losers-count').textContent = (tables.losers || []).length;
+            // 生成OKX交易链接
+            const instId = item.inst_id || '';
+            const okxUrl = instId
+                ? `https://www.okx.com/zh-hans/${item.trade_path || 'trade-swap'}/${instId.toLowerCase()}`
+                : '';
+            set('url', okxUrl, v => { entry.row.dataset.url = v; });
             
-            const endTime = performance.now();
-            console.log(`表格更新耗时: ${(endTime - startTime).toFixed(2)}ms`);
-        }
-        
-        function applyCurrentSort(tableType) {
-            const state = sortStates[tableType];
-            let dataToDisplay;
+            set('rank', rank, v => { cells[0].textContent = v; });
+            set('name', item.display_id || instId, v => { entry.name.textContent = v; });
+            set('changeColor', isPositive ? '#27ae60' : '#e74c3c', v => { cells[2].style.color = v; });
+            set('change', `${isPositive ? '+' : ''}${changeRate.toFixed(2)}%`, v => { cells[2].textContent = v; });
+            set('changeTitle', formatTimeframeRates(item.tf_change_rates), v => { cells[2].title = v; });
+            set('price', formatNumber(item.close_price || 0), v => { cells[3].textContent = v; });
             
-            // 如果没有排序，使用原始涨跌幅排序
-            if (!state.currentSort) {
-                dataToDisplay = state.originalOrder.length > 0 ? [...state.originalOrder] : [...state.data];
-            } else {
-                // 应用成交量排序
-                dataToDisplay = sortData([...state.data], state.currentSort, state.sortDirection);
+            // 根据数据新鲜度决定颜色
+            let volume24hClass = 'volume-cell';
+            let volume24hTitle = '';
+            if (volumeFreshness === 1) {
+                volume24hClass += ' volume-updated';
+                volume24hTitle = '24h成交量数据已更新';
+            } else if (volumeFreshness === -1) {
+                volume24hClass += ' volume-stale';
+                volume24hTitle = '24h成交量数据已过期';
             }
+            set('volume24hClass', volume24hClass, v => { cells[4].className = v; });
+            set('volume24hTitle', volume24hTitle, v => { cells[4].title = v; });
+            set('volume24h', item.volume_24h_formatted || '--', v => { cells[4].textContent = v; });
+            set('volume1h', item.volume_1h_formatted || '--', v => { cells[5].textContent = v; });
             
-            // 使用DocumentFragment批量更新DOM
-            updateTable(tableType, dataToDisplay);
+            // 持仓量变化样式
+            let oiChangeClass = 'oi-change-neutral';
+            let oiChangeSign = '';
+            if (oiChange > 0) {
+                oiChangeClass = 'oi-change-positive';
+                oiChangeSign = '+';
+            } else if (oiChange < 0) {
+                oiChangeClass = 'oi-change-negative';
+            }
+            set('oiClass', oiChangeClass, v => { cells[6].className = v; });
+            set('oi', `${oiChangeSign}${oiChange.toFixed(2)}%`, v => { cells[6].textContent = v; });
+            set('oiTitle', `实时: ${item.oi_ccy_formatted || '--'}, 1小时前: ${item.oi_history_ccy_formatted || '--'}`,
+                v => { cells[6].title = v; });
+            set('timestamp', item.timestamp || '--:--:--', v => { cells[7].textContent = v; });
+        }
+        
+        // 虚拟滚动的上下占位行，按表复用
+        const spacerRows = {
+            gainers: {},
+            losers: {}
+        };
+        
+        function spacerRow(type, position, height) {
+            let row = spacerRows[type][position];
+            if (!row) {
+                row = document.createElement('tr');
+                row.className = 'virtual-spacer';
+                const cell = row.appendChild(document.createElement('td'));
+                cell.colSpan = 8;
+                spacerRows[type][position] = row;
+            }
+            const value = `${height}px`;
+            if (row.firstChild.style.height !== value) row.firstChild.style.height = value;
+            return row;
         }
         
-        function updateTable(type, data) {
+        // layout仅在虚拟滚动时传入：{rankBase, padTop, padBottom}
+        function updateTable(type, data, layout) {
             const tbody = document.getElementById(`${type}-body`);
             if (!tbody) return;
+            const cache = rowCache[type];
+            const rankBase = layout ? layout.rankBase : 0;
             
-            if (data.length === 0) {
+            if (data.length === 0 && !(layout && layout.padTop + layout.padBottom > 0)) {
+                cache.clear();
                 tbody.innerHTML = '<tr><td colspan="8" class="loading">暂无数据</td></tr>';
                 return;
             }
             
-            // 使用DocumentFragment提高性能
-            const fragment = document.createDocumentFragment();
+            const startTime = performance.now();
+            const seen = new Set();
             
-            data.forEach((item, index) => {
-                const row = document.createElement('tr');
-                const isPositive = (item.change_rate || 0) >= 0;
-                const volumeFreshness = item.volume_freshness || 0;
-                const oiChange = item.oi_change_rate || 0;
-                
-                // 生成OKX交易链接
-                const instId = item.inst_id || '';
-                let okxUrl = '';
-                if (instId) {
-                    const formattedInstId = instId.toLowerCase();
-                    okxUrl = `https://www.okx.com/zh-hans/trade-swap/${formattedInstId}`;
-                }
-                
-                // 根据数据新鲜度决定颜色
-                let volume24hClass = 'volume-cell';
-                let volume24hTitle = '';
-                if (volumeFreshness === 1) {
-                    volume24hClass += ' volume-updated';
-                    volume24hTitle = '24h成交量数据已更新';
-                } else if (volumeFreshness === -1) {
-                    volume24hClass += ' volume-stale';
-                    volume24hTitle = '24h成交量数据已过期';
-                }
-                
-                // 持仓量变化样式
-                let oiChangeClass = 'oi-change-neutral';
-                let oiChangeSign = '';
-                if (oiChange > 0) {
-                    oiChangeClass = 'oi-change-positive';
-                    oiChangeSign = '+';
-                } else if (oiChange < 0) {
-                    oiChangeClass = 'oi-change-negative';
+            // 按顺序走一遍DOM游标：已在正确位置的行不移动，只有顺序变化的行才insertBefore
+            let cursor = tbody.firstChild;
+            const place = (node) => {
+                if (node === cursor) {
+                    cursor = cursor.nextSibling;
+                } else {
+                    tbody.insertBefore(node, cursor);
                 }
+            };
+            
+            if (layout && layout.padTop > 0) place(spacerRow(type, 'top', layout.padTop));
+            data.forEach((item, index) => {
+                const key = item.inst_id || `#${index}`;
+                if (seen.has(key)) return;
+                seen.add(key);
                 
-                row.innerHTML = `
-                    <td>${index + 1}</td>
-                    <td>
-                        <span class="product-name">${item.display_id || item.inst_id || ''}</span>
-                    </td>
-                    <td style="color: ${isPositive ? '#27ae60' : '#e74c3c'}; font-weight: bold;">
-                        ${isPositive ? '+' : ''}${(item.change_rate || 0).toFixed(2)}%
-                    </td>
-                    <td>${formatNumber(item.close_price || 0)}</td>
-                    <td class="${volume24hClass}" title="${volume24hTitle}">${item.volume_24h_formatted || '--'}</td>
-                    <td class="volume-cell">${item.volume_1h_formatted || '--'}</td>
-                    <td class="${oiChangeClass}" title="实时: ${item.oi_ccy_formatted || '--'}, 1小时前: ${item.oi_history_ccy_formatted || '--'}">
-                        ${oiChangeSign}${(oiChange || 0).toFixed(2)}%
-                    </td>
-                    <td>${item.timestamp || '--:--:--'}</td>
-                `;
-                
-                row.className = 'clickable-row';
-                
-                if (okxUrl) {
-                    row.addEventListener('click', function(e) {
-                        if (e.target.tagName === 'INPUT' || e.target.tagName === 'BUTTON' || 
-                            e.target.tagName === 'SELECT' || e.target.tagName === 'TEXTAREA') {
-                            return;
-                        }
-                        window.open(okxUrl, '_blank');
-                    });
+                let entry = cache.get(key);
+                if (!entry) {
+                    entry = createRow();
+                    cache.set(key, entry);
                 }
-                
-                fragment.appendChild(row);
+                patchRow(entry, item, rankBase + index + 1);
+                place(entry.row);
             });
+            if (layout && layout.padBottom > 0) place(spacerRow(type, 'bottom', layout.padBottom));
+            
+            // 移除剩余的行（包括"加载中/暂无数据"占位行）
+            while (cursor) {
+                const next = cursor.nextSibling;
+                tbody.removeChild(cursor);
+                cursor = next;
+            }
+            for (const key of cache.keys()) {
+                if (!seen.has(key)) cache.delete(key);
+            }
             
-            // 一次性更新DOM
-            tbody.innerHTML = '';
-            tbody.appendChild(fragment);
+            const renderTime = performance.now() - startTime;
+            if (renderTime > ROW_RENDER_BUDGET_MS) {
+                console.warn(`${type}表格渲染超出帧预算: ${renderTime.toFixed(2)}ms (${data.length}行)`);
+            }
             
             // 更新排序指示器
             updateSortIndicators(type);
         }
         
+        // 每个tbody只挂一个委托点击处理器，行的链接存放在data-url中
+        function initRowClicks() {
+            ['gainers', 'losers'].forEach(type => {
+                const tbody = document.getElementById(`${type}-body`);
+                if (!tbody) return;
+                tbody.addEventListener('click', function(e) {
+                    const tag = e.target.tagName;
+                    if (tag === 'INPUT' || tag === 'BUTTON' || tag === 'SELECT' || tag === 'TEXTAREA') {
+                        return;
+                    }
+                    const row = e.target.closest('tr.clickable-row');
+                    if (row && row.dataset.url) {
+                        window.open(row.dataset.url, '_blank');
+                    }
+                });
+            });
+        }
+        
         function handleSortClick(tableType, sortKey) {
             const state = sortStates[tableType];
             
@@ -2222,8 +5334,15 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 state.sortDirection = 'desc';
             }
             
-            // 应用排序
-            applyCurrentSort(tableType);
+            // 服务器按排序字段在全部产品中排名，两个榜单共用同一排序
+            const otherType = tableType === 'gainers' ? 'losers' : 'gainers';
+            sortStates[otherType].currentSort = state.currentSort;
+            sortStates[otherType].sortDirection = state.sortDirection;
+            subscribeView({
+                sort: state.currentSort ? SERVER_SORT_KEYS[state.currentSort] : 'change_rate',
+                order: state.sortDirection === 'asc' ? 'asc' : 'desc',
+                ...resetVirtualScroll()
+            });
         }
         
         function updateSortIndicators(tableType) {
@@ -2253,8 +5372,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             sortStates.losers.sortDirection = 'none';
             
             // 应用重置
-            applyCurrentSort('gainers');
-            applyCurrentSort('losers');
+            subscribeView({sort: 'change_rate', order: 'desc', ...resetVirtualScroll()});
             
             showNotification('排序已重置', 'success');
         }
@@ -2278,7 +5396,10 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 客户端连接: ${data.clients || 0} 个<br>
                 24h成交量缓存: ${data.volume_cache || 0} 个<br>
                 持仓量缓存: ${data.oi_cache || 0} 个<br>
-                历史持仓量缓存: ${data.oi_history_cache || 0} 个
+                历史持仓量缓存: ${data.oi_history_cache || 0} 个<br>
+                解码/排序(${performanceStats.mode}): ${performanceStats.lastWorkerTime.toFixed(2)} ms,
+                平均 ${performanceStats.avgWorkerTime.toFixed(2)} ms<br>
+                DOM渲染: ${performanceStats.lastRenderTime.toFixed(2)} ms, 平均 ${performanceStats.avgRenderTime.toFixed(2)} ms
             `;
         }
         
@@ -2314,7 +5435,7 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 top: 20px;
                 right: 20px;
                 padding: 10px 15px;
-                background: ${type === 'success' ? '#27ae60' : '#e74c3c'};
+                background: ${type === 'success' ? '#27ae60' : type === 'alert' ? '#f39c12' : '#e74c3c'};
                 color: white;
                 border-radius: 4px;
                 z-index: 1000;
@@ -2358,22 +5479,12 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
                 const input = document.getElementById(`search-${type}`);
                 if (input) {
                     input.addEventListener('input', debounce((e) => {
-                        const searchText = e.target.value.toLowerCase();
-                        const rows = document.querySelectorAll(`#${type}-body tr`);
-                        
-                        rows.forEach(row => {
-                            const cells = row.getElementsByTagName('td');
-                            let match = false;
-                            
-                            for (let cell of cells) {
-                                if (cell.textContent.toLowerCase().includes(searchText)) {
-                                    match = true;
-                                    break;
-                                }
-                            }
-                            
-                            row.style.display = match ? '' : 'none';
-                        });
+                        // 服务器按搜索关键字过滤整个产品集合，而不只是当前显示的行
+                        subscribeView({search: e.target.value.trim(), ...resetVirtualScroll()});
+                        // 服务器结果到达前，先由Worker过滤当前已有的行；虚拟滚动时行号即排名，不在本地过滤
+                        if (!virtualMode) {
+                            postToWorker({cmd: 'filter', table: type, text: e.target.value});
+                        }
                     }, 300));
                 }
             });
@@ -2407,9 +5518,12 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
         }
         
         document.addEventListener('DOMContentLoaded', () => {
+            initDataWorker();
             initWebSocket();
             initSearch();
             initSorting();
+            initRowClicks();
+            initVirtualScroll();
             
             // 减少轮询频率，避免卡顿
             setInterval(() => {
@@ -2421,26 +5535,599 @@ HTML_TEMPLATE = '''<!DOCTYPE html>
             }, 3000); // 从1秒改为3秒
         });
         
-        window.addEventListener('beforeunload', () => {
-            if (ws && ws.readyState === WebSocket.OPEN) {
-                ws.close();
-            }
-        });
-    </script>
-</body>
-</html>'''
+        window.addEventListener('beforeunload', () => {
+            if (ws && ws.readyState === WebSocket.OPEN) {
+                ws.close();
+            }
+        });
+    </script>
+</body>
+</html>'''
+
+DASHBOARD_WORKER_SCRIPT = '''// 仪表盘数据处理：解码、过滤和排序在Web Worker中进行，主线程只负责更新DOM。
+// 页面也以普通脚本加载同一文件，浏览器不支持Worker时在主线程调用handleWorkerMessage。
+
+// MessagePack子协议，需与服务端WS_MSGPACK_PROTOCOL/MSGPACK_ROW_COLUMNS保持一致
+const MSGPACK_PROTOCOL = 'okx-monitor.msgpack.v1';
+const MSGPACK_ROW_COLUMNS = ['inst_id', 'display_id', 'inst_type', 'change_rate', 'close_price',
+    'volume_24h', 'volume_1h', 'volume_freshness', 'oi_ccy', 'oi_change_rate', 'oi_history_ccy',
+    'timestamp', 'tf_change_rates'];
+const MSGPACK_STATS_FIELDS = ['total', 'collected', 'avg_change', 'up_count', 'down_count', 'avg_oi_change'];
+const textDecoder = new TextDecoder();
+
+function decodeMsgpack(buffer) {
+    // 只实现服务端会用到的MessagePack类型
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let offset = 0;
+
+    function readStr(length) {
+        const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    }
+    function readArray(length) {
+        const value = new Array(length);
+        for (let i = 0; i < length; i++) value[i] = read();
+        return value;
+    }
+    function readMap(length) {
+        const value = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            value[key] = read();
+        }
+        return value;
+    }
+    function read() {
+        const type = bytes[offset++];
+        if (type <= 0x7f) return type;
+        if (type >= 0xe0) return type - 0x100;
+        if ((type & 0xe0) === 0xa0) return readStr(type & 0x1f);
+        if ((type & 0xf0) === 0x90) return readArray(type & 0x0f);
+        if ((type & 0xf0) === 0x80) return readMap(type & 0x0f);
+        let value;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+            case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+            case 0xcc: return bytes[offset++];
+            case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+            case 0xce: value = view.getUint32(offset); offset += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+            case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+            case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+            case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+            case 0xd9: return readStr(bytes[offset++]);
+            case 0xda: value = view.getUint16(offset); offset += 2; return readStr(value);
+            case 0xdb: value = view.getUint32(offset); offset += 4; return readStr(value);
+            case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+            case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+            case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+            case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+            default: throw new Error(`不支持的MessagePack类型: 0x${type.toString(16)}`);
+        }
+    }
+    return read();
+}
+
+function formatVolumeCn(volume) {
+    // 与服务端format_volume_cn一致
+    if (!volume) return '0';
+    if (volume >= 100000000) return `${(volume / 100000000).toFixed(2)}亿`;
+    if (volume >= 10000) return `${(volume / 10000).toFixed(2)}万`;
+    if (volume >= 1000) return `${(volume / 1000).toFixed(1)}千`;
+    return volume.toFixed(0);
+}
+
+function unpackRows(columns, timeframes) {
+    const col = {};
+    MSGPACK_ROW_COLUMNS.forEach((name, i) => col[name] = columns[i]);
+    return col.inst_id.map((instId, i) => {
+        const seconds = col.timestamp[i];
+        const rates = {};
+        timeframes.forEach((tf, j) => rates[tf] = col.tf_change_rates[i][j]);
+        return {
+            inst_id: instId,
+            display_id: col.display_id[i],
+            inst_type: col.inst_type[i],
+            trade_path: `trade-${(col.inst_type[i] || 'SWAP').toLowerCase()}`,
+            change_rate: col.change_rate[i],
+            tf_change_rates: rates,
+            close_price: col.close_price[i],
+            volume_24h: col.volume_24h[i],
+            volume_24h_formatted: col.volume_24h[i] ? formatVolumeCn(col.volume_24h[i]) : '--',
+            volume_1h: col.volume_1h[i],
+            volume_1h_formatted: formatVolumeCn(col.volume_1h[i]),
+            volume_freshness: col.volume_freshness[i],
+            oi_ccy: col.oi_ccy[i],
+            oi_ccy_formatted: formatVolumeCn(col.oi_ccy[i]),
+            oi_change_rate: col.oi_change_rate[i],
+            oi_history_ccy: col.oi_history_ccy[i],
+            oi_history_ccy_formatted: formatVolumeCn(col.oi_history_ccy[i]),
+            timestamp: [Math.floor(seconds / 3600), Math.floor(seconds / 60) % 60, seconds % 60]
+                .map(part => String(part).padStart(2, '0')).join(':')
+        };
+    });
+}
+
+function unpackFullUpdate(frame) {
+    // 与服务端pack_full_update的结构对应，还原为JSON格式的full_update消息
+    const [version, type, timestampMs, stats, timeframes, timeframe, gainers, losers, paging, view, seq, stream] = frame;
+    if (version !== 1 || type !== 'full_update') {
+        throw new Error(`未知的二进制消息: ${type} v${version}`);
+    }
+    const statsObject = {};
+    MSGPACK_STATS_FIELDS.forEach((name, i) => statsObject[name] = stats[i]);
+    return {
+        type: type,
+        timestamp: new Date(timestampMs).toISOString(),
+        stats: statsObject,
+        timeframes: timeframes,
+        view: view,
+        seq: seq,
+        stream: stream,
+        tables: {
+            timeframe: timeframe,
+            gainers: unpackRows(gainers, timeframes),
+            losers: unpackRows(losers, timeframes),
+            offset: paging[0],
+            limit: paging[1],
+            gainers_total: paging[2],
+            losers_total: paging[3],
+            losers_offset: paging.length > 4 ? paging[4] : paging[0]
+        }
+    };
+}
+
+function unpackDelta(frame) {
+    // 与服务端pack_update_delta的结构对应，还原为JSON格式的增量消息
+    const [version, type, timestampMs, stats, timeframes, timeframe, gainers, losers,
+           gainersOrder, losersOrder, paging, seq, base] = frame;
+    if (version !== 1 || type !== 'delta') {
+        throw new Error(`未知的二进制消息: ${type} v${version}`);
+    }
+    const statsObject = {};
+    MSGPACK_STATS_FIELDS.forEach((name, i) => statsObject[name] = stats[i]);
+    const rowsById = columns => Object.fromEntries(unpackRows(columns, timeframes).map(row => [row.inst_id, row]));
+    return {
+        type: type,
+        seq: seq,
+        base: base,
+        timestamp: new Date(timestampMs).toISOString(),
+        stats: statsObject,
+        tables: {
+            timeframe: timeframe,
+            gainers: {order: gainersOrder, rows: rowsById(gainers)},
+            losers: {order: losersOrder, rows: rowsById(losers)},
+            offset: paging[0],
+            limit: paging[1],
+            gainers_total: paging[2],
+            losers_total: paging[3],
+            losers_offset: paging[4]
+        }
+    };
+}
+
+// Worker持有最近一次full_update，过滤变化时直接重新计算，无需等待下一帧；
+// 断线续传补发的增量也在此基础上应用
+const workerState = {
+    update: null,
+    filters: {gainers: '', losers: ''}
+};
+
+function decodeFrame(data) {
+    if (typeof data === 'string') return JSON.parse(data);
+    const frame = decodeMsgpack(data);
+    return frame[1] === 'delta' ? unpackDelta(frame) : unpackFullUpdate(frame);
+}
+
+function filterRows(rows, text) {
+    if (!text) return rows;
+    return rows.filter(row => (row.display_id || row.inst_id || '').toLowerCase().includes(text)
+        || (row.inst_id || '').toLowerCase().includes(text));
+}
+
+function prepareTable(type) {
+    // 行顺序即服务器在全部产品中的排名，不在本地重新排序，虚拟滚动的行号才与排名一致
+    return filterRows(workerState.update.tables[type] || [], workerState.filters[type]);
+}
+
+function prepareTables() {
+    // 保留分页信息（offset、总数等），虚拟滚动需要据此定位行
+    return {
+        ...workerState.update.tables,
+        gainers: prepareTable('gainers'),
+        losers: prepareTable('losers')
+    };
+}
+
+function applyDelta(update, delta) {
+    // 按增量给出的顺序重建榜单，变化的行取增量中的新行，其余沿用上一快照
+    const tables = {...update.tables, ...delta.tables};
+    for (const name of ['gainers', 'losers']) {
+        const change = delta.tables[name];
+        const previous = new Map(update.tables[name].map(row => [row.inst_id, row]));
+        const order = change.order || update.tables[name].map(row => row.inst_id);
+        tables[name] = order.map(instId => change.rows[instId] || previous.get(instId));
+        if (tables[name].includes(undefined)) return null;
+    }
+    return {...update, seq: delta.seq, timestamp: delta.timestamp, stats: delta.stats, tables: tables};
+}
+
+function handleWorkerMessage(message) {
+    const startTime = performance.now();
+    
+    if (message.cmd === 'frame') {
+        let data = decodeFrame(message.data);
+        if (data.type === 'delta') {
+            // 增量必须紧接在已有快照之后，否则请求重新同步
+            const base = workerState.update;
+            data = base && base.seq === data.base ? applyDelta(base, data) : null;
+            if (!data) {
+                workerState.update = null;
+                return {type: 'resync', received: message.received};
+            }
+        } else if (data.type !== 'full_update') {
+            return {type: 'message', data: data, received: message.received};
+        }
+        const decodeTime = performance.now() - startTime;
+        workerState.update = data;
+        return {
+            type: 'full_update',
+            data: {...data, tables: prepareTables()},
+            received: message.received,
+            timing: {decode: decodeTime, prepare: performance.now() - startTime - decodeTime}
+        };
+    }
+    
+    if (message.cmd === 'filter') {
+        workerState.filters[message.table] = (message.text || '').trim().toLowerCase();
+    } else {
+        return null;
+    }
+    if (!workerState.update) return null;
+    return {
+        type: 'tables',
+        tables: prepareTables(),
+        timing: {decode: 0, prepare: performance.now() - startTime}
+    };
+}
+
+if (typeof WorkerGlobalScope !== 'undefined' && self instanceof WorkerGlobalScope) {
+    self.onmessage = (event) => {
+        try {
+            const reply = handleWorkerMessage(event.data);
+            if (reply) self.postMessage(reply);
+        } catch (error) {
+            self.postMessage({type: 'error', message: String(error)});
+        }
+    };
+}
+'''
+
+def choose_encoding(accept_encoding):
+    """按Accept-Encoding选择压缩方式，优先br，其次gzip，q=0表示拒绝"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0
+        if name:
+            accepted[name.lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return 'identity'
+
+def compress_body(body, encoding, gzip_level=HTTP_GZIP_LEVEL, brotli_quality=HTTP_BROTLI_QUALITY):
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return body
+
+class PrecompressedAsset:
+    """启动时按最高压缩级别预先压缩的静态资源，带ETag和缓存头"""
+    
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.variants = {'identity': body, 'gzip': compress_body(body, 'gzip', gzip_level=9)}
+        if brotli is not None:
+            self.variants['br'] = compress_body(body, 'br', brotli_quality=11)
+        self.etag = f'"{zlib.crc32(body):x}"'
+    
+    def respond(self, request):
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        headers = {
+            'ETag': encoded_etag(self.etag, encoding),
+            'Cache-Control': f'public, max-age={STATIC_MAX_AGE}',
+            'Vary': 'Accept-Encoding'
+        }
+        if etag_matches(request.headers.get('If-None-Match'), self.etag):
+            return web.Response(status=304, headers=headers)
+        
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=self.variants[encoding], content_type=self.content_type,
+                            charset='utf-8', headers=headers)
+
+index_asset = None  # 首次请求时创建，避免导入模块时压缩
+worker_asset = None
 
 async def handle_index(request):
-    return web.Response(text=HTML_TEMPLATE, content_type='text/html')
+    global index_asset
+    if index_asset is None:
+        index_asset = PrecompressedAsset(HTML_TEMPLATE.encode('utf-8'), 'text/html')
+    return index_asset.respond(request)
+
+async def handle_worker_script(request):
+    global worker_asset
+    if worker_asset is None:
+        worker_asset = PrecompressedAsset(DASHBOARD_WORKER_SCRIPT.encode('utf-8'), 'application/javascript')
+    return worker_asset.respond(request)
+
+class DataTick:
+    """把存储版本折算为数据节拍
+
+    行情推送每秒会修改存储数百次，逐次版本化会让缓存几乎不命中。节拍最多每interval秒
+    前进一次，且只有存储确实变化时才前进；存储不变时节拍不变，轮询可以得到304。
+    """
+    
+    def __init__(self, interval=RESPONSE_CACHE_TICK):
+        self.interval = interval
+        self.tick = 0
+        self.version = None
+        self.advanced_at = 0
+    
+    def current(self):
+        version = price_store.version
+        now = time.monotonic()
+        if version != self.version and now - self.advanced_at >= self.interval:
+            self.tick += 1
+            self.version = version
+            self.advanced_at = now
+        return self.tick
+
+class ResponseCache:
+    """按(视图, 节拍)缓存已编码的响应体
+
+    缓存未命中时在线程池中计算，计算期间到达的相同请求等待同一个future，
+    N个并发轮询只计算一次。
+    """
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # {key: (tick, body, etag, {encoding: 压缩后的body})}
+        self.inflight = {}  # {(key, tick): Future}
+        self.instance = f"{int(time.time()):x}"  # 区分进程重启前后的ETag
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+    
+    def etag_for(self, key, tick):
+        return f'"{self.instance}-{tick}-{zlib.crc32(repr(key).encode()):x}"'
+    
+    async def get(self, key, tick, build):
+        """返回(body, etag)，build为生成响应字节串的同步函数"""
+        entry = self.entries.get(key)
+        if entry and entry[0] == tick:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+        
+        flight = self.inflight.get((key, tick))
+        if flight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(flight)
+        
+        self.misses += 1
+        flight = asyncio.get_running_loop().create_future()
+        self.inflight[(key, tick)] = flight
+        try:
+            body = await asyncio.get_running_loop().run_in_executor(None, build)
+            result = (body, self.etag_for(key, tick))
+            self.entries[key] = (tick, *result, {})
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            flight.set_result(result)
+            return result
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # 没有等待者时避免未取回异常的警告
+            raise
+        finally:
+            if not flight.done():
+                flight.cancel()  # 计算被取消时让等待者一起结束
+            self.inflight.pop((key, tick), None)
+    
+    def encoded(self, key, etag, body, encoding):
+        """返回body的压缩版本，同一节拍内每种压缩方式只压缩一次"""
+        if encoding == 'identity':
+            return body
+        entry = self.entries.get(key)
+        variants = entry[3] if entry and entry[2] == etag else {}
+        if encoding not in variants:
+            variants[encoding] = compress_body(body, encoding)
+        return variants[encoding]
+    
+    def get_stats(self):
+        total = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': round((self.hits + self.coalesced) / total * 100, 1) if total else 0
+        }
+
+data_tick = DataTick()
+data_response_cache = ResponseCache()
+
+def build_data_response(view):
+    """生成/api/data响应体（JSON字节串）"""
+    return json.dumps({
+        'timestamp': datetime.now().isoformat(),
+        'stats': get_statistics(view['timeframe'], view['inst_type']),
+        'tables': get_table_data(view=view)
+    }).encode()
+
+def encoded_etag(etag, encoding):
+    """同一资源的不同编码是不同的表示，强ETag需要区分：压缩版本在标签后加 -编码 后缀"""
+    if encoding == 'identity':
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def strip_etag_encoding(tag):
+    """去掉弱标记和编码后缀，还原为基础ETag"""
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for encoding in ('gzip', 'br'):
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return f'{tag[:-len(suffix)]}"'
+    return tag
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match中任一标签（忽略编码后缀）与基础ETag相同即视为未变化"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(strip_etag_encoding(tag) == etag for tag in candidates)
 
 async def handle_data(request):
-    stats = get_statistics()
-    tables = get_table_data()
+    try:
+        view = normalize_view(dict(request.query))
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    
+    body, etag = await data_response_cache.get(
+        view_key(view), data_tick.current(), functools.partial(build_data_response, view)
+    )
+    encoding = 'identity'
+    if HTTP_COMPRESSION and len(body) >= HTTP_COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    headers = {'ETag': encoded_etag(etag, encoding), 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    
+    # 数据未变化的轮询只返回304
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return web.Response(status=304, headers=headers)
+    
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    
+    return web.Response(body=data_response_cache.encoded(view_key(view), etag, body, encoding),
+                        content_type='application/json', headers=headers)
+
+async def handle_stream(request):
+    """只读的SSE数据流：先发送快照，之后每个广播节拍发送一个增量
+
+    断线重连时EventSource自动带上Last-Event-ID（也可用last_event_id参数），仍在重放缓冲区内的
+    只补发缺失的增量，否则重新发送快照。视图参数与/api/data相同。
+    """
+    fields = {key: value for key, value in request.query.items() if key != 'last_event_id'}
+    try:
+        view = normalize_view(fields)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    
+    channel = broadcast_hub.channel(view)
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    backlog = channel.replay(channel.parse_event_id(last_event_id))
+    if backlog is not None:
+        events = [entry[3] for entry in backlog]
+    elif channel.snapshot is not None:
+        events = [channel.frame('sse')]
+    else:
+        events = []  # 通道尚未发布，首个节拍会发送快照
+    
+    # 计算积压和加入订阅之间没有await，不会漏掉或重复节拍
+    subscriber = StreamSubscriber(synced=bool(events) or backlog is not None)
+    channel.streams.add(subscriber)
+    try:
+        await response.write(f"retry: {STREAM_RETRY_MS}\n\n".encode('utf-8'))
+        for event in events:
+            await response.write(event)
+        
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                event = b": ping\n\n"
+            if event is None:
+                break
+            await response.write(event)
+    except (ConnectionResetError, ConnectionError):
+        pass
+    finally:
+        channel.streams.discard(subscriber)
+        channel.last_active = time.time()
+    return response
+
+async def handle_search(request):
+    query = request.query.get('q', '')
+    try:
+        limit = max(1, min(int(request.query.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT))
+    except ValueError:
+        return web.json_response({'error': f"无效的结果数: {request.query.get('limit')}"}, status=400)
+    timeframe = request.query.get('timeframe')
+    if timeframe and timeframe not in AGG_TIMEFRAMES:
+        return web.json_response({'error': f'不支持的周期: {timeframe}'}, status=400)
     
+    start = time.perf_counter()
+    results = search_instruments(query, limit, timeframe)
+    return web.json_response({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - start) * 1000, 3),
+        'index': symbol_index.get_stats()
+    })
+
+async def handle_feed_stats(request):
     return web.json_response({
         'timestamp': datetime.now().isoformat(),
-        'stats': stats,
-        'tables': tables
+        'redundant': REDUNDANT_FEEDS_ENABLED,
+        'kline': kline_feed.get_stats(),
+        'oi': oi_feed.get_stats(),
+        'demand': demand_manager.get_stats()
+    })
+
+async def handle_alerts(request):
+    try:
+        limit = max(1, min(int(request.query.get('limit') or ALERT_HISTORY_SEND), ALERT_HISTORY_SIZE))
+    except ValueError:
+        limit = ALERT_HISTORY_SEND
+    return web.json_response({
+        'timestamp': datetime.now().isoformat(),
+        'enabled': ALERTS_ENABLED,
+        'rules': [{'id': rule['id'], 'name': rule['name'], 'cooldown': rule['cooldown'],
+                   'conditions': [{key: condition[key] for key in ('field', 'op', 'value', 'hysteresis')}
+                                  for condition in rule['conditions']]}
+                  for rule in list(alert_engine.rules.values())],
+        'stats': alert_engine.get_stats(),
+        'alerts': alert_engine.recent(limit)
+    })
+
+async def handle_scheduler_stats(request):
+    return web.json_response({
+        'timestamp': datetime.now().isoformat(),
+        **scheduler.get_stats()
     })
 
 async def handle_memory_stats(request):
@@ -2451,22 +6138,788 @@ async def handle_memory_stats(request):
         **memory_stats
     })
 
+def memory_check():
+    memory_stats = get_memory_stats()
+    if memory_stats['memory_usage'] > 200:
+        print(f"内存使用警告: {memory_stats['memory_usage']:.1f} MB")
+        gc.collect()
+
+async def scheduled_oi_history_update():
+    """整点后30秒更新历史持仓量基准"""
+    if not connection_manager_kline.is_connected():
+        print("K线连接未建立，跳过本次历史持仓量更新")
+        return
+    print("整点后30秒，开始更新历史持仓量数据...")
+    await batch_update_oi_history()
+
+async def sync_exchange_clock():
+    await asyncio.get_event_loop().run_in_executor(None, scheduler.sync_clock)
+
+async def scheduled_volume_refresh():
+    """补充更新超过5分钟未刷新的24h成交量（连续更新器的兜底）"""
+    if connection_manager_kline.is_connected():
+        await batch_update_volumes()
+
+def clear_collected_data():
+    price_store.clear()
+    alert_engine.reset()
+    last_received_time.clear()
+    volume_24h_data.clear()
+    volume_last_update.clear()
+    oi_data.clear()
+    oi_history_data.clear()
+    oi_last_update.clear()
+    candle_aggregator.clear()
+
+async def run_data_command(command):
+    """在采集进程中执行Web工作进程转发来的命令"""
+    if command == 'clear':
+        clear_collected_data()
+    elif command == 'update_volumes':
+        asyncio.create_task(batch_update_volumes())
+    elif command == 'update_oi_history':
+        asyncio.create_task(batch_update_oi_history())
+    elif command == 'restart':
+        asyncio.create_task(restart_websocket_connections())
+
+def encode_bus_frame(message):
+    """总线消息：4字节长度前缀 + MessagePack（未安装时为JSON）"""
+    payload = msgpack.packb(message) if msgpack is not None else json.dumps(message).encode('utf-8')
+    return len(payload).to_bytes(4, 'big') + payload
+
+async def read_bus_payload(reader):
+    """读取一条总线消息的原始字节（不含长度前缀），消息代理转发时无需解码再编码"""
+    length = int.from_bytes(await reader.readexactly(4), 'big')
+    if length > STATE_BUS_MAX_FRAME:
+        raise ValueError(f"总线消息过大: {length} 字节")
+    return await reader.readexactly(length)
+
+def decode_bus_payload(payload):
+    return msgpack.unpackb(payload) if msgpack is not None else json.loads(payload)
+
+async def read_bus_frame(reader):
+    return decode_bus_payload(await read_bus_payload(reader))
+
+def build_state_message(seq, items=None, removed=(), with_inst_ids=False):
+    """构建状态消息：items为None时是全量快照，否则是只含变化产品的增量"""
+    message = {
+        'type': 'snapshot' if items is None else 'delta',
+        'seq': seq,
+        'items': price_store.get_all() if items is None else items,
+        'removed': list(removed),
+        'status': {
+            'total_products': total_products,
+            'connection': build_connection_status(),
+            'volume': {key: value for key, value in build_volume_stats().items() if key in ('updated', 'total')}
+        }
+    }
+    if items is None or with_inst_ids:
+        message['inst_ids'] = list(inst_ids)
+    return message
+
+def apply_state_message(message):
+    """副本一侧：把状态快照或增量应用到本地存储，返回消息中的状态字段"""
+    global total_products
+    if message['type'] == 'snapshot':
+        price_store.load_snapshot(message['items'])
+        if startup_backfill['completed_at'] is None:
+            startup_backfill['completed_at'] = time.time()
+    else:
+        price_store.apply_changes(message['items'], message['removed'])
+    if 'inst_ids' in message:
+        inst_ids[:] = message['inst_ids']
+        symbol_index.rebuild(inst_ids)
+    status = message.get('status') or {}
+    total_products = status.get('total_products', total_products)
+    return status
+
+class StateBusServer:
+    """采集进程一侧的状态总线
+
+    Web工作进程连接后先收到一份全量快照，之后每STATE_BUS_INTERVAL秒收到一次只包含变化产品的增量；
+    每条消息只编码一次后写给所有工作进程。工作进程可以反向发送命令，由采集进程执行。
+    """
+    
+    def __init__(self, path=STATE_BUS_PATH):
+        self.path = path
+        self.server = None
+        self.writers = set()
+        self.seq = 0
+        self.last_inst_ids = None
+        self.stats = {'published': 0, 'bytes': 0, 'dropped_slow': 0, 'commands': 0}
+    
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 上次运行残留的套接字文件
+        price_store.track_changes = True
+        self.server = await asyncio.start_unix_server(self._handle, path=self.path)
+        print(f"状态总线已启动: {self.path}")
+    
+    async def stop(self):
+        for writer in list(self.writers):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+    
+    async def _handle(self, reader, writer):
+        # 快照与加入writers之间没有await，之后的增量都基于这份快照
+        writer.write(encode_bus_frame(build_state_message(self.seq)))
+        self.writers.add(writer)
+        try:
+            while True:
+                message = await read_bus_frame(reader)
+                if message.get('type') == 'command' and message.get('command') in STATE_BUS_COMMANDS:
+                    self.stats['commands'] += 1
+                    await run_data_command(message['command'])
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+    
+    def publish(self):
+        """发布一次增量；存储被清空后改为发布全量快照"""
+        items, removed, reset = price_store.take_changes()
+        if not self.writers:
+            return
+        self.seq += 1
+        inst_ids_changed = inst_ids != self.last_inst_ids
+        self.last_inst_ids = list(inst_ids)
+        if reset:
+            message = build_state_message(self.seq)
+        else:
+            message = build_state_message(self.seq, items, removed, with_inst_ids=inst_ids_changed)
+        frame = encode_bus_frame(message)
+        
+        for writer in list(self.writers):
+            if writer.transport.get_write_buffer_size() > STATE_BUS_MAX_BUFFER:
+                # 跟不上的工作进程断开，重连后从快照开始
+                self.stats['dropped_slow'] += 1
+                self.writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+        self.stats['published'] += 1
+        self.stats['bytes'] += len(frame) * len(self.writers)
+    
+    async def publish_loop(self):
+        while running:
+            await asyncio.sleep(STATE_BUS_INTERVAL)
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"状态总线发布出错: {e}")
+    
+    def get_stats(self):
+        return {'role': 'ingestion', 'workers': len(self.writers), 'seq': self.seq, **self.stats}
+
+class StateBusClient:
+    """Web工作进程一侧：订阅采集进程的状态总线，维护本进程的price_store副本"""
+    
+    def __init__(self, path=STATE_BUS_PATH):
+        self.path = path
+        self.writer = None
+        self.status = {}
+        self.seq = 0
+        self.stats = {'snapshots': 0, 'deltas': 0, 'reconnects': 0, 'commands': 0}
+    
+    async def run(self):
+        while running:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+                while True:
+                    message = await read_bus_frame(reader)
+                    self.status = apply_state_message(message)
+                    self.seq = message['seq']
+                    self.stats['snapshots' if message['type'] == 'snapshot' else 'deltas'] += 1
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                if self.writer is not None:
+                    print(f"状态总线连接断开: {e}")
+            finally:
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+            self.stats['reconnects'] += 1
+            await asyncio.sleep(STATE_BUS_RECONNECT_DELAY)
+    
+    async def send_command(self, command):
+        if self.writer is None:
+            return False
+        self.writer.write(encode_bus_frame({'type': 'command', 'command': command}))
+        await self.writer.drain()
+        self.stats['commands'] += 1
+        return True
+    
+    def get_stats(self):
+        return {'role': 'web-worker', 'pid': os.getpid(), 'connected': self.writer is not None,
+                'seq': self.seq, **self.stats}
+
+class ClusterTransport:
+    """集群节点间的发布/订阅传输接口
+
+    实现需要保证同一主题内的消息按发布顺序送达、不回送给发布者本身。
+    新的传输（ZeroMQ、Redis等）实现这几个方法后注册到CLUSTER_TRANSPORTS即可。
+    """
+    
+    def __init__(self, address):
+        self.address = address
+        self.topics = set()
+    
+    @property
+    def connected(self):
+        raise NotImplementedError
+    
+    def subscribe(self, *topics):
+        """声明订阅的主题，在connect之前调用，每次重连后自动重新订阅"""
+        self.topics.update(topics)
+    
+    async def connect(self):
+        raise NotImplementedError
+    
+    async def publish(self, topic, message):
+        """发布消息，未连接时返回False"""
+        raise NotImplementedError
+    
+    async def receive(self):
+        """等待下一条订阅的消息，返回(主题, 消息)；连接断开时抛出异常"""
+        raise NotImplementedError
+    
+    async def close(self):
+        raise NotImplementedError
+
+class TcpBrokerTransport(ClusterTransport):
+    """通过ClusterBroker转发的TCP传输，帧格式与状态总线相同"""
+    
+    def __init__(self, address):
+        super().__init__(address)
+        host, _, port = address.rpartition(':')
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self.reader = None
+        self.writer = None
+    
+    @property
+    def connected(self):
+        return self.writer is not None
+    
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(encode_bus_frame({'op': 'subscribe', 'topics': sorted(self.topics)}))
+        await self.writer.drain()
+    
+    async def publish(self, topic, message):
+        if self.writer is None:
+            return False
+        self.writer.write(encode_bus_frame({'op': 'publish', 'topic': topic, 'message': message}))
+        await self.writer.drain()
+        return True
+    
+    async def receive(self):
+        frame = await read_bus_frame(self.reader)
+        return frame['topic'], frame['message']
+    
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+CLUSTER_TRANSPORTS = {
+    'tcp': TcpBrokerTransport,
+}
+
+class ClusterBroker:
+    """集群消息代理：按主题把发布者的消息转发给其他订阅者（类似ZeroMQ的XPUB/XSUB代理）
+
+    转发时直接复用发布者编码好的字节；积压超过STATE_BUS_MAX_BUFFER的订阅者被断开，
+    节点重连后向领导者请求快照。代理不保存状态，重启后节点重新订阅即可。
+    """
+    
+    def __init__(self, address=CLUSTER_BROKER_ADDRESS):
+        host, _, port = address.rpartition(':')
+        self.host = host or '0.0.0.0'
+        self.port = int(port)
+        self.server = None
+        self.subscribers = {}  # {主题: set(writer)}
+        self.stats = {'connections': 0, 'forwarded': 0, 'bytes': 0, 'dropped_slow': 0}
+    
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"集群消息代理已启动: {self.host}:{self.port}")
+    
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+    
+    async def _handle(self, reader, writer):
+        self.stats['connections'] += 1
+        topics = set()
+        try:
+            while True:
+                payload = await read_bus_payload(reader)
+                frame = decode_bus_payload(payload)
+                if frame.get('op') == 'subscribe':
+                    topics.update(frame.get('topics') or [])
+                    for topic in topics:
+                        self.subscribers.setdefault(topic, set()).add(writer)
+                elif frame.get('op') == 'publish':
+                    self.forward(frame.get('topic'), payload, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            for topic in topics:
+                self.subscribers.get(topic, set()).discard(writer)
+            writer.close()
+    
+    def forward(self, topic, payload, sender):
+        frame = len(payload).to_bytes(4, 'big') + payload
+        for writer in list(self.subscribers.get(topic, ())):
+            if writer is sender:
+                continue
+            if writer.transport.get_write_buffer_size() > STATE_BUS_MAX_BUFFER:
+                self.stats['dropped_slow'] += 1
+                for subscribers in self.subscribers.values():
+                    subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+            self.stats['forwarded'] += 1
+            self.stats['bytes'] += len(frame)
+    
+    def get_stats(self):
+        return {'topics': {topic: len(writers) for topic, writers in self.subscribers.items()}, **self.stats}
+
+def start_ingestion():
+    """在本进程启动OKX连接和采集任务，返回新注册的任务名"""
+    existing_jobs = set(scheduler.jobs)
+    register_ingestion_jobs()
+    asyncio.create_task(scheduler.start())
+    threading.Thread(target=run_okx_websocket, daemon=True).start()
+    return set(scheduler.jobs) - existing_jobs
+
+def stop_ingestion(job_names):
+    """停止OKX连接和采集任务，本进程之后只作为副本"""
+    for name in job_names:
+        scheduler.remove_job(name)
+    if okx_event_loop is not None and okx_handler_task is not None and not okx_event_loop.is_closed():
+        okx_event_loop.call_soon_threadsafe(okx_handler_task.cancel)
+
+class ClusterNode:
+    """集群节点：成员心跳、领导者选举和存储副本
+
+    所有节点通过传输的control主题交换心跳。没有存活的领导者时，存活节点中ID最小的一个以更高的任期当选，
+    启动OKX连接和采集任务，并在state主题上发布快照和只含变化产品的增量；其他节点把它们应用到本地price_store副本。
+    已有领导者时新加入的节点不抢占。网络分区恢复后出现多个领导者时，任期较高者（相同则ID较小者）保留领导权，
+    其余节点停止采集并重新同步。
+    """
+    
+    def __init__(self, node_id, transport):
+        self.node_id = node_id
+        self.transport = transport
+        self.transport.subscribe('state', 'control')
+        self.term = 0
+        self.leader_id = None
+        self.is_leader = False
+        self.peers = {}  # {节点ID: {'last_seen', 'term', 'leader'}}
+        self.seq = 0  # 领导者：已发布的序号；跟随者：已应用的序号
+        self.synced = False
+        self.connected_at = None
+        self.last_sync_request = 0
+        self.last_inst_ids = None
+        self.ingestion_jobs = set()
+        self.status = {}
+        self.stats = {'elections_won': 0, 'step_downs': 0, 'snapshots': 0, 'deltas': 0, 'published': 0,
+                      'sync_requests': 0, 'commands': 0, 'reconnects': 0}
+    
+    async def run(self):
+        loops = [asyncio.create_task(self.heartbeat_loop()), asyncio.create_task(self.publish_loop())]
+        try:
+            while running:
+                try:
+                    await self.transport.connect()
+                    self.connected_at = time.time()
+                    print(f"集群节点 {self.node_id} 已连接消息代理 {self.transport.address}")
+                    if not self.is_leader:
+                        await self.request_sync()
+                    while True:
+                        topic, message = await self.transport.receive()
+                        if topic == 'state':
+                            self.on_state(message)
+                        elif topic == 'control':
+                            await self.on_control(message)
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    if self.connected_at is not None:
+                        print(f"集群消息代理连接断开: {e}")
+                finally:
+                    await self.transport.close()
+                    self.connected_at = None
+                self.stats['reconnects'] += 1
+                await asyncio.sleep(CLUSTER_RECONNECT_DELAY)
+        finally:
+            for task in loops:
+                task.cancel()
+            if self.is_leader:
+                self.step_down()
+    
+    def observe_leader(self, node, term):
+        """处理其他节点的领导者声明，返回是否承认该领导者"""
+        if term < self.term:
+            return False
+        if term == self.term and self.leader_id is not None and node != self.leader_id and node > self.leader_id:
+            return False
+        if self.is_leader:
+            print(f"节点 {node} 以任期 {term} 担任领导者，本节点让出领导权")
+            self.step_down()
+        if node != self.leader_id or term != self.term:
+            self.synced = False
+        self.term = term
+        self.leader_id = node
+        return True
+    
+    def on_state(self, message):
+        if not self.observe_leader(message['node'], message['term']) or self.is_leader:
+            return
+        if message['type'] == 'snapshot':
+            if self.synced and message.get('target') not in (None, self.node_id):
+                return  # 其他节点请求的快照，已同步的节点继续应用增量
+            self.stats['snapshots'] += 1
+        elif not self.synced or message['seq'] != self.seq + 1:
+            # 丢失了增量（重连、被代理断开），从快照重新同步
+            self.synced = False
+            asyncio.create_task(self.request_sync())
+            return
+        else:
+            self.stats['deltas'] += 1
+        self.status = apply_state_message(message)
+        self.seq = message['seq']
+        self.synced = True
+    
+    async def on_control(self, message):
+        kind = message.get('type')
+        node = message.get('node')
+        if kind == 'heartbeat':
+            self.peers[node] = {'last_seen': time.time(), 'term': message['term'], 'leader': message['leader']}
+            if message['leader']:
+                self.observe_leader(node, message['term'])
+        elif kind == 'resign':
+            self.peers.pop(node, None)
+            if node == self.leader_id:
+                self.leader_id = None
+        elif not self.is_leader:
+            return
+        elif kind == 'sync_request':
+            self.stats['sync_requests'] += 1
+            await self.publish_snapshot(target=node)
+        elif kind == 'command' and message.get('command') in STATE_BUS_COMMANDS:
+            self.stats['commands'] += 1
+            await run_data_command(message['command'])
+    
+    async def request_sync(self):
+        if time.time() - self.last_sync_request < CLUSTER_HEARTBEAT_INTERVAL:
+            return
+        self.last_sync_request = time.time()
+        await self.transport.publish('control', {'type': 'sync_request', 'node': self.node_id})
+    
+    async def heartbeat_loop(self):
+        while running:
+            await asyncio.sleep(CLUSTER_HEARTBEAT_INTERVAL)
+            try:
+                if not self.transport.connected:
+                    continue  # 连不上代理时无法确认其他节点的状态，不发起选举
+                await self.transport.publish('control', {'type': 'heartbeat', 'node': self.node_id,
+                                                         'term': self.term, 'leader': self.is_leader})
+                self.check_leader()
+            except Exception as e:
+                print(f"集群心跳出错: {e}")
+    
+    def check_leader(self):
+        """领导者心跳超时后，存活节点中ID最小的节点当选"""
+        now = time.time()
+        for node in [node for node, peer in self.peers.items() if now - peer['last_seen'] > CLUSTER_LEADER_TIMEOUT * 10]:
+            del self.peers[node]
+        if self.is_leader or self.connected_at is None or now - self.connected_at < CLUSTER_LEADER_TIMEOUT:
+            return  # 刚连上时先等待一个超时周期，了解现有的领导者
+        alive = {node for node, peer in self.peers.items() if now - peer['last_seen'] < CLUSTER_LEADER_TIMEOUT}
+        if self.leader_id in alive:
+            return
+        if min(alive | {self.node_id}) == self.node_id:
+            self.become_leader(max([self.term] + [peer['term'] for peer in self.peers.values()]) + 1)
+    
+    def become_leader(self, term):
+        print(f"集群节点 {self.node_id} 当选领导者（任期 {term}），开始连接OKX")
+        self.term = term
+        self.leader_id = self.node_id
+        self.is_leader = True
+        self.stats['elections_won'] += 1
+        price_store.track_changes = True
+        price_store.take_changes()
+        self.ingestion_jobs = start_ingestion()
+        asyncio.create_task(self.publish_snapshot())
+    
+    def step_down(self):
+        self.is_leader = False
+        self.synced = False
+        self.stats['step_downs'] += 1
+        price_store.track_changes = False
+        stop_ingestion(self.ingestion_jobs)
+        self.ingestion_jobs = set()
+    
+    async def resign(self):
+        """正常退出时让出领导权，其他节点无需等待心跳超时即可重新选举"""
+        if self.is_leader and self.transport.connected:
+            await self.transport.publish('control', {'type': 'resign', 'node': self.node_id})
+    
+    async def publish_snapshot(self, target=None):
+        # 快照使用当前序号：之后的增量仍从seq + 1开始，未发布的变化会在下一个增量中重复写入，结果相同
+        message = build_state_message(self.seq)
+        message.update(node=self.node_id, term=self.term, target=target)
+        await self.transport.publish('state', message)
+    
+    async def publish_loop(self):
+        while running:
+            await asyncio.sleep(CLUSTER_PUBLISH_INTERVAL)
+            if not self.is_leader or not self.transport.connected:
+                continue
+            try:
+                items, removed, reset = price_store.take_changes()
+                inst_ids_changed = inst_ids != self.last_inst_ids
+                self.seq += 1
+                self.last_inst_ids = list(inst_ids)
+                if reset:
+                    message = build_state_message(self.seq)
+                else:
+                    message = build_state_message(self.seq, items, removed, with_inst_ids=inst_ids_changed)
+                message.update(node=self.node_id, term=self.term)
+                await self.transport.publish('state', message)
+                self.stats['published'] += 1
+            except Exception as e:
+                print(f"集群状态发布出错: {e}")
+    
+    async def send_command(self, command):
+        if self.leader_id is None:
+            return False
+        return await self.transport.publish('control', {'type': 'command', 'command': command, 'node': self.node_id})
+    
+    def get_stats(self):
+        now = time.time()
+        return {
+            'node_id': self.node_id,
+            'role': 'leader' if self.is_leader else 'follower',
+            'leader': self.leader_id,
+            'term': self.term,
+            'seq': self.seq,
+            'synced': self.synced or self.is_leader,
+            'connected': self.transport.connected,
+            'peers': {node: {'age': round(now - peer['last_seen'], 1), 'term': peer['term'], 'leader': peer['leader']}
+                      for node, peer in self.peers.items()},
+            **self.stats
+        }
+
+def build_handoff_state():
+    """平滑重启时交给新进程的内存状态：存储、产品列表、成交量/持仓量缓存和多周期聚合"""
+    with candle_aggregator.lock:
+        candles = copy.deepcopy(candle_aggregator.state)
+    return {
+        'items': price_store.get_all(),
+        'inst_ids': list(inst_ids),
+        'volume_24h_data': dict(volume_24h_data),
+        'volume_last_update': dict(volume_last_update),
+        'oi_data': dict(oi_data),
+        'oi_history_data': dict(oi_history_data),
+        'oi_last_update': dict(oi_last_update),
+        'last_received_time': dict(last_received_time),
+        'candles': candles,
+        'exported_at': time.time()
+    }
+
+def load_handoff_state(state):
+    global inst_ids, total_products, handoff_state
+    price_store.load_snapshot(state['items'])
+    inst_ids = list(state['inst_ids'])
+    total_products = len(inst_ids)
+    symbol_index.rebuild(inst_ids)
+    for cache, key in ((volume_24h_data, 'volume_24h_data'), (volume_last_update, 'volume_last_update'),
+                       (oi_data, 'oi_data'), (oi_history_data, 'oi_history_data'),
+                       (oi_last_update, 'oi_last_update'), (last_received_time, 'last_received_time')):
+        cache.clear()
+        cache.update(state[key])
+    with candle_aggregator.lock:
+        candle_aggregator.state = state['candles']
+    startup_backfill['completed_at'] = time.time()
+    handoff_state = state
+
+class HandoffServer:
+    """运行中的进程一侧：等待新进程接管
+
+    新进程连接后依次收到监听套接字（SCM_RIGHTS）和内存状态，此后两个进程共用监听端口。
+    新进程的OKX订阅收到实时数据后发回ready，本进程才停止接受新连接、分批关闭现有客户端并退出，
+    OKX连接直到退出时才关闭。新进程在ready之前退出时本进程继续正常服务。
+    """
+    
+    def __init__(self, path=HANDOFF_PATH):
+        self.path = path
+        self.sock = None
+        self.task = None
+        self.handed_off = False
+    
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # 上次运行残留的套接字文件，或已退出的旧进程留下的
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+        self.sock.setblocking(False)
+        self.task = asyncio.create_task(self.serve())
+        print(f"平滑重启交接服务已启动: {self.path}（python main.py --takeover）")
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.sock is not None:
+            self.sock.close()
+            # 已交接时套接字路径属于新进程，不能删除
+            if not self.handed_off and os.path.exists(self.path):
+                os.unlink(self.path)
+    
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        while running and not self.handed_off:
+            conn, _ = await loop.sock_accept(self.sock)
+            try:
+                await self.hand_over(conn)
+            except Exception as e:
+                # 任何交接失败都不能让交接服务退出，否则之后无法再平滑重启
+                conn.close()
+                print(f"平滑重启未完成，继续由本进程服务: {e}")
+    
+    async def hand_over(self, conn):
+        socket.send_fds(conn, [b'F'], [listen_socket.fileno()])
+        reader, writer = await asyncio.open_connection(sock=conn)
+        try:
+            writer.write(encode_bus_frame(build_handoff_state()))
+            await writer.drain()
+            print("已将监听端口和内存状态交给新进程，等待其完成OKX订阅...")
+            message = await read_bus_frame(reader)
+            if message.get('type') != 'ready':
+                raise ValueError(f"未知的交接消息: {message.get('type')}")
+        finally:
+            writer.close()
+        self.handed_off = True
+        print(f"新进程 (PID: {message.get('pid')}) 已就绪，停止接受新连接并在 {HANDOFF_DRAIN_SECONDS} 秒内关闭现有客户端")
+        # 与部署系统发送SIGTERM走同一条退出路径：停止监听、on_shutdown中分批关闭客户端、清理任务
+        os.kill(os.getpid(), signal.SIGTERM)
+
+def receive_handoff(path=HANDOFF_PATH):
+    """新进程一侧：从运行中的进程接收监听套接字和内存状态（启动时同步调用），返回(交接连接, 监听套接字, 状态)"""
+    def recv_exactly(size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("交接连接已关闭")
+            data.extend(chunk)
+        return bytes(data)
+    
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(HANDOFF_RECEIVE_TIMEOUT)  # 旧进程卡住时不能让新进程无限期阻塞在启动阶段
+    try:
+        conn.connect(path)
+        _, fds, _, _ = socket.recv_fds(conn, 1, 1)
+        if not fds:
+            raise ValueError("未收到监听套接字")
+        sock = socket.socket(fileno=fds[0])
+        length = int.from_bytes(recv_exactly(4), 'big')
+        if length > STATE_BUS_MAX_FRAME:
+            raise ValueError(f"交接状态过大: {length} 字节")
+        state = decode_bus_payload(recv_exactly(length))
+    except Exception:
+        conn.close()
+        raise
+    return conn, sock, state
+
+async def complete_takeover():
+    """新进程：OKX连接收到实时推送后通知旧进程退出，之后开始等待下一次平滑重启"""
+    global handoff_connection, handoff_server
+    started = time.time()
+    while running:
+        await asyncio.sleep(0.5)
+        if (connection_manager_kline.is_connected() and connection_manager_oi.is_connected()
+                and max(last_received_time.values(), default=0) > started):
+            break
+    loop = asyncio.get_running_loop()
+    handoff_connection.setblocking(False)
+    try:
+        await loop.sock_sendall(handoff_connection, encode_bus_frame({'type': 'ready', 'pid': os.getpid()}))
+        print(f"OKX订阅已就绪（接管后 {time.time() - started:.1f} 秒），通知旧进程退出")
+    except OSError as e:
+        print(f"通知旧进程失败（可能已退出）: {e}")
+    handoff_connection.close()
+    handoff_connection = None
+    handoff_server = HandoffServer(HANDOFF_PATH)
+    await handoff_server.start()
+
+async def drain_clients(app):
+    """平滑重启交接后分批关闭现有客户端；此时监听已停止，客户端重连会连到新进程"""
+    if handoff_server is None or not handoff_server.handed_off:
+        return
+    for channel in broadcast_hub.channels.values():
+        for subscriber in list(channel.streams):
+            subscriber.close()  # EventSource会自动重连
+    # 关闭前客户端照常收到广播，连接处理器退出时自行从clients中移除
+    pending = list(clients)
+    for ws in pending:
+        await ws.close(code=WSCloseCode.SERVICE_RESTART, message=b'handoff')
+        await asyncio.sleep(HANDOFF_DRAIN_SECONDS / len(pending))
+
+def register_ingestion_jobs():
+    """只在持有OKX连接的进程中运行的数据采集任务"""
+    scheduler.add_hourly_job('oi_history_baseline', scheduled_oi_history_update, minute=0, second=30)
+    scheduler.add_interval_job('volume_refresh', scheduled_volume_refresh, DATA_CLEANUP_INTERVAL)
+    scheduler.add_interval_job('memory_check', memory_check, MEMORY_CHECK_INTERVAL)
+    if UNIVERSE_SELECTION_MODE == "liquidity":
+        scheduler.add_interval_job('universe_rerank', rerank_universe, UNIVERSE_RERANK_INTERVAL)
+    if DEMAND_DRIVEN_SUBSCRIPTIONS:
+        scheduler.add_interval_job('demand_reconcile', demand_manager.reconcile, DEMAND_RECONCILE_INTERVAL)
+        scheduler.add_interval_job('demand_cold_refresh', demand_manager.refresh_cold, DEMAND_COLD_REFRESH_INTERVAL)
+    scheduler.add_interval_job('clock_sync', sync_exchange_clock, 600)
+
 async def start_background_tasks(app):
+    global handoff_server
     app['broadcast_worker'] = asyncio.create_task(broadcast_worker())
     
-    async def memory_check():
-        while running:
-            await asyncio.sleep(MEMORY_CHECK_INTERVAL)
-            
-            memory_stats = get_memory_stats()
-            if memory_stats['memory_usage'] > 200:
-                print(f"内存使用警告: {memory_stats['memory_usage']:.1f} MB")
-                gc.collect()
+    if listen_socket is not None and HANDOFF_ENABLED and cluster_node is None:
+        if handoff_connection is not None:
+            # 从旧进程接管：OKX订阅就绪后通知旧进程退出，再开始等待下一次平滑重启
+            app['takeover'] = asyncio.create_task(complete_takeover())
+        else:
+            handoff_server = HandoffServer(HANDOFF_PATH)
+            await handoff_server.start()
     
-    app['memory_check'] = asyncio.create_task(memory_check())
+    if state_bus_client is not None:
+        # Web工作进程：数据来自状态总线，不运行采集任务
+        app['state_bus'] = asyncio.create_task(state_bus_client.run())
+    elif cluster_node is not None:
+        # 集群节点：当选领导者后才启动采集任务
+        app['cluster'] = asyncio.create_task(cluster_node.run())
+    else:
+        register_ingestion_jobs()
+    scheduler.add_interval_job('connection_status_snapshot', broadcast_connection_status, 5)
+    scheduler.add_interval_job('volume_stats_snapshot', broadcast_volume_stats, 10)
+    if ALERTS_ENABLED:
+        scheduler.add_interval_job('alert_dispatch', broadcast_alerts, ALERT_DISPATCH_INTERVAL)
+    await scheduler.start()
 
 async def cleanup_background_tasks(app):
-    tasks = ['broadcast_worker', 'memory_check']
+    if cluster_node is not None:
+        await cluster_node.resign()
+    await scheduler.stop()
+    
+    if handoff_server is not None:
+        await handoff_server.stop()
+    
+    tasks = ['broadcast_worker', 'state_bus', 'cluster', 'takeover']
     for task_name in tasks:
         if task_name in app:
             app[task_name].cancel()
@@ -2492,28 +6945,89 @@ async def init_app():
     })
     
     app.router.add_get('/', handle_index)
+    app.router.add_get('/static/dashboard-worker.js', handle_worker_script)
     app.router.add_get('/ws', websocket_handler)
     app.router.add_get('/api/data', handle_data)
+    app.router.add_get('/api/search', handle_search)
+    app.router.add_get('/api/stream', handle_stream)
     app.router.add_get('/api/memory', handle_memory_stats)
+    app.router.add_get('/api/scheduler', handle_scheduler_stats)
+    app.router.add_get('/api/feeds', handle_feed_stats)
+    app.router.add_get('/api/alerts', handle_alerts)
     
     for route in list(app.router.routes()):
         cors.add(route)
     
     app.on_startup.append(start_background_tasks)
+    app.on_shutdown.append(drain_clients)
     app.on_cleanup.append(cleanup_background_tasks)
     
     return app
 
+def run_web_worker(index, port):
+    """Web工作进程入口：订阅状态总线，通过SO_REUSEPORT与其他工作进程共享监听端口
+
+    工作进程以spawn方式启动，会重新导入本模块，命令行覆盖的配置（如--port）需由父进程作为参数传入。
+    """
+    global state_bus_client
+    state_bus_client = StateBusClient(STATE_BUS_PATH)
+    print(f"Web工作进程 {index} 已启动 (PID: {os.getpid()})")
+    web.run_app(init_app(), host='0.0.0.0', port=port, reuse_port=True, access_log=None, print=None)
+
+async def run_ingestion_process():
+    """多进程模式的采集进程：运行采集任务并通过状态总线发布存储增量，不直接服务客户端"""
+    global main_event_loop, state_bus_server
+    main_event_loop = asyncio.get_running_loop()
+    state_bus_server = StateBusServer(STATE_BUS_PATH)
+    await state_bus_server.start()
+    register_ingestion_jobs()
+    await scheduler.start()
+    try:
+        await state_bus_server.publish_loop()
+    finally:
+        await scheduler.stop()
+        await state_bus_server.stop()
+
+def run_fanout(workers):
+    """启动workers个Web工作进程，当前进程作为采集进程运行到停止"""
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_web_worker, args=(index, WEB_PORT), daemon=True) for index in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(run_ingestion_process())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+
+async def run_cluster_broker(address):
+    broker = ClusterBroker(address)
+    await broker.start()
+    try:
+        while running:
+            await asyncio.sleep(60)
+            print(f"集群消息代理: {broker.get_stats()}")
+    finally:
+        await broker.stop()
+
 def run_okx_websocket():
     print("启动OKX WebSocket线程...")
     
+    global okx_event_loop, okx_handler_task
+    
     # 创建新的事件循环
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    okx_event_loop = loop
+    okx_handler_task = loop.create_task(okx_websocket_handler())
     
     try:
         # 运行WebSocket处理器
-        loop.run_until_complete(okx_websocket_handler())
+        loop.run_until_complete(okx_handler_task)
+    except asyncio.CancelledError:
+        print("OKX WebSocket处理器已停止")
     except Exception as e:
         print(f"OKX WebSocket线程错误: {e}")
         traceback.print_exc()
@@ -2586,11 +7100,116 @@ def check_existing_connections():
     
     return False
 
+def populate_benchmark_store(count, rng):
+    """为传输基准测试生成count个模拟产品"""
+    price_store.max_items = max(price_store.max_items, count)
+    inst_ids[:] = [f"BENCH{i}-USDT-SWAP" for i in range(count)]
+    for inst_id in inst_ids:
+        volume_24h = rng.uniform(1e5, 5e9)
+        volume_24h_data[inst_id] = {
+            'volume_24h': volume_24h,
+            'volume_24h_formatted': format_volume_cn(volume_24h),
+            'last_update': time.time()
+        }
+        oi_data[inst_id] = {'oi_ccy': rng.uniform(1e4, 1e8), 'timestamp': time.time()}
+        oi_history_data[inst_id] = {'oi_ccy': oi_data[inst_id]['oi_ccy'] * rng.uniform(0.9, 1.1)}
+        open_price = rng.uniform(0.001, 50000)
+        price_store.update(inst_id, {
+            'open_price': open_price,
+            'close_price': open_price,
+            'change_rate': 0,
+            'tf_change_rates': {tf: 0 for tf in AGG_TIMEFRAMES},
+            'volume_1h': volume_24h / 24,
+            'volume_1h_formatted': format_volume_cn(volume_24h / 24),
+            'timestamp': time.time()
+        })
+
+def step_benchmark_store(rng):
+    """模拟一秒内的行情变化"""
+    for inst_id, item in price_store.get_all().items():
+        close = item['close_price'] * (1 + rng.gauss(0, 0.002))
+        change_rate = calculate_change_rate(item['open_price'], close)
+        price_store.update(inst_id, {
+            'close_price': close,
+            'change_rate': change_rate,
+            'tf_change_rates': {tf: change_rate * rng.uniform(0.2, 1.5) for tf in AGG_TIMEFRAMES},
+            'timestamp': time.time()
+        })
+
+def benchmark_transport(instruments=300, seconds=60):
+    """估算单个客户端每分钟收到的字节数（每秒一帧full_update，或每秒轮询一次/api/data），比较压缩前后
+
+    /ws先按默认视图（每个榜单DEFAULT_TABLE_SIZE行）测量JSON帧，再按不限行数的全量视图（全部产品）
+    比较JSON和MessagePack的帧大小与编码耗时。
+    permessage-deflate按浏览器默认的上下文接管方式模拟：整个连接共用一个压缩流，每帧同步刷新后去掉尾部4字节。
+    """
+    rng = random.Random(42)
+    populate_benchmark_store(instruments, rng)
+    
+    totals = {}
+    cpu = {}
+    
+    def record(name, size, started=None):
+        totals[name] = totals.get(name, 0) + size
+        if started is not None:
+            cpu[name] = cpu.get(name, 0) + time.perf_counter() - started
+    
+    # 全量视图：绕过MAX_TABLE_SIZE上限，每个榜单返回全部产品，比较两种格式在大表下的差异
+    full_view = {**default_view(), 'limit': instruments}
+    full_rows = 0
+    default_deflater = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    deflaters = {'json': zlib.compressobj(wbits=-zlib.MAX_WBITS),
+                 'msgpack': zlib.compressobj(wbits=-zlib.MAX_WBITS)}
+    encoders = {'json': lambda update: json.dumps(update).encode()}
+    if msgpack is not None:
+        encoders['msgpack'] = pack_full_update
+    for _ in range(seconds):
+        step_benchmark_store(rng)
+        frame = build_full_update_message().encode()
+        record('ws json 默认视图', len(frame))
+        started = time.perf_counter()
+        compressed = default_deflater.compress(frame) + default_deflater.flush(zlib.Z_SYNC_FLUSH)
+        record('ws json 默认视图 + permessage-deflate', len(compressed) - 4, started)
+        
+        update = build_full_update(full_view)
+        full_rows = len(update['tables']['gainers']) + len(update['tables']['losers'])
+        for wire, encode in encoders.items():
+            started = time.perf_counter()
+            frame = encode(update)
+            record(f'ws {wire}', len(frame), started)
+            started = time.perf_counter()
+            compressed = deflaters[wire].compress(frame) + deflaters[wire].flush(zlib.Z_SYNC_FLUSH)
+            record(f'ws {wire} + permessage-deflate', len(compressed) - 4, started)
+        
+        body = build_data_response(default_view())
+        record('/api/data', len(body))
+        started = time.perf_counter()
+        record('/api/data gzip', len(compress_body(body, 'gzip')), started)
+        if brotli is not None:
+            started = time.perf_counter()
+            record('/api/data br', len(compress_body(body, 'br')), started)
+    
+    scale = 60 / seconds
+    print(f"传输基准: {instruments} 个产品, 模拟 {seconds} 秒, 每客户端每分钟字节数")
+    print(f"  全量视图每帧编码 {full_rows} 行（涨幅榜+跌幅榜，涨跌幅为0的产品不在榜单中）")
+    if msgpack is None:
+        print("  未安装msgpack，跳过MessagePack格式")
+    for name, size in totals.items():
+        per_frame_ms = cpu[name] / seconds * 1000 if name in cpu else 0
+        print(f"  {name:<32} {size / seconds / 1024:>8.1f} KB/帧 {size * scale / 1024:>10.1f} KB/分钟"
+              f"   编码/压缩耗时 {per_frame_ms:.2f} ms/帧")
+    
+    page = HTML_TEMPLATE.encode('utf-8')
+    asset = PrecompressedAsset(page, 'text/html')
+    sizes = ', '.join(f"{encoding}={len(body) / 1024:.1f}KB" for encoding, body in asset.variants.items())
+    print(f"  首页HTML（每次加载，304时为0）: {sizes}")
+    return totals
+
 def main():
-    global running
+    global running, cluster_node, listen_socket, handoff_connection
     
-    # 检查是否有相同的程序在运行
-    if check_existing_connections():
+    # 检查是否有相同的程序在运行（平滑重启接管时旧进程本来就在运行）
+    if not HANDOFF_TAKEOVER and check_existing_connections():
         answer = input("检测到可能有相同的程序在运行，是否继续? (y/n): ")
         if answer.lower() != 'y':
             print("程序退出")
@@ -2623,8 +7242,9 @@ def main():
     except Exception as e:
         print(f"清理残留连接时出错: {e}")
     
-    print("OKX SWAP 实时监控系统启动中...")
-    print(f"内存优化配置: 最大产品数={MAX_PRODUCTS}")
+    print(f"OKX {'/'.join(ENABLED_INSTRUMENT_TYPES)} 实时监控系统启动中...")
+    print(f"内存优化配置: 最大产品数={total_max_products()} "
+          f"({', '.join(f'{spec.name}={spec.max_products}' for spec in enabled_instrument_specs())})")
     print(f"重连配置: 延迟={RECONNECT_DELAY}秒, 最大尝试={MAX_RECONNECT_ATTEMPTS}")
     print(f"API频率控制: 请求间隔={API_RATE_LIMIT_DELAY}秒 (每0.3秒更新一个产品)")
     print("注意: 24h成交量数据采用连续更新模式，每0.3秒更新一个产品")
@@ -2634,21 +7254,53 @@ def main():
     print("      - 持仓量变化率显示在页面上")
     print("      - 两个独立的WebSocket连接: K线和持仓量")
     print("新增功能:")
-    print("      - 心跳保活机制，防止连接超时")
+    print(f"      - 心跳保活机制: 静默{PING_IDLE_INTERVAL}秒发送ping，{PONG_TIMEOUT}秒无pong即重连")
     print("      - 连接重启功能")
     print("      - 程序启动时自动清理残留连接")
-    print("      - 历史持仓量更新时间: 整点后30秒")
+    print("      - 历史持仓量更新时间: 整点后30秒（按交易所时间调度，错过自动补跑）")
+    print(f"      - 多周期涨跌幅: 订阅 {BASE_CANDLE_CHANNEL}，本地聚合为 {', '.join(AGG_TIMEFRAMES)}")
     print("使用账户API获取产品列表")
+    if UNIVERSE_SELECTION_MODE == "liquidity":
+        print(f"产品选择: 按24h成交额排名，每 {UNIVERSE_RERANK_INTERVAL} 秒重新排名并在边缘轮换")
+    if REDUNDANT_FEEDS_ENABLED:
+        print("热备冗余模式: 每个数据源两条连接，消息去重后先到先用")
+    
+    if HANDOFF_TAKEOVER and not CLUSTER_ENABLED:
+        try:
+            handoff_connection, listen_socket, state = receive_handoff(HANDOFF_PATH)
+            load_handoff_state(state)
+            print(f"已从运行中的进程接管监听端口和 {len(state['items'])} 个产品的状态"
+                  f"（状态导出于 {time.time() - state['exported_at']:.2f} 秒前）")
+        except Exception as e:
+            print(f"平滑重启接管失败，按正常方式启动: {e}")
+            # 交接连接关闭后旧进程继续服务；收到的监听套接字也一并关闭，不与旧进程共用端口
+            for sock in (handoff_connection, listen_socket):
+                if sock is not None:
+                    sock.close()
+            handoff_connection = listen_socket = None
     
-    ws_thread = threading.Thread(target=run_okx_websocket, daemon=True)
-    ws_thread.start()
+    if CLUSTER_ENABLED:
+        # 集群模式：OKX连接由当选的领导者节点启动
+        node_id = CLUSTER_NODE_ID or f"{os.uname().nodename}-{WEB_PORT}"
+        cluster_node = ClusterNode(node_id, CLUSTER_TRANSPORTS[CLUSTER_TRANSPORT](CLUSTER_BROKER_ADDRESS))
+        print(f"集群模式: 节点 {node_id}，消息代理 {CLUSTER_BROKER_ADDRESS}（{CLUSTER_TRANSPORT}）")
+    else:
+        ws_thread = threading.Thread(target=run_okx_websocket, daemon=True)
+        ws_thread.start()
     
     print("Web服务器启动中...")
-    print("访问地址: http://localhost:8080")
+    print(f"访问地址: http://localhost:{WEB_PORT}")
     print("按 Ctrl+C 停止程序")
     
     try:
-        web.run_app(init_app(), host='0.0.0.0', port=8080, access_log=None)
+        if WEB_WORKERS > 0 and not CLUSTER_ENABLED:
+            print(f"多进程模式: 1个采集进程 + {WEB_WORKERS}个Web工作进程，状态总线 {STATE_BUS_PATH}")
+            run_fanout(WEB_WORKERS)
+        else:
+            # 自己创建监听套接字，平滑重启时才能交给新进程
+            if listen_socket is None:
+                listen_socket = socket.create_server(('0.0.0.0', WEB_PORT))
+            web.run_app(init_app(), sock=listen_socket, access_log=None)
     except KeyboardInterrupt:
         print("程序被用户中断")
     except Exception as e:
@@ -2658,4 +7310,35 @@ def main():
         print("程序停止")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--benchmark-transport' in sys.argv:
+        # python main.py --benchmark-transport [产品数...]
+        counts = [int(arg) for arg in sys.argv[1:] if arg.isdigit()] or [300]
+        for count in counts:
+            price_store.clear()
+            benchmark_transport(count)
+    elif '--cluster-broker' in sys.argv:
+        # python main.py --cluster-broker [PORT]：只运行集群消息代理
+        ports = [arg for arg in sys.argv[1:] if arg.isdigit()]
+        address = f"0.0.0.0:{ports[0]}" if ports else CLUSTER_BROKER_ADDRESS
+        try:
+            asyncio.run(run_cluster_broker(address))
+        except KeyboardInterrupt:
+            print("集群消息代理已停止")
+    else:
+        if '--workers' in sys.argv:
+            # python main.py --workers N：N个Web工作进程共享端口，当前进程只负责采集
+            WEB_WORKERS = int(sys.argv[sys.argv.index('--workers') + 1])
+        if '--port' in sys.argv:
+            WEB_PORT = int(sys.argv[sys.argv.index('--port') + 1])
+        if '--cluster' in sys.argv:
+            # python main.py --cluster [HOST:PORT] [--node-id ID] [--port N]：作为集群节点运行
+            CLUSTER_ENABLED = True
+            position = sys.argv.index('--cluster') + 1
+            if position < len(sys.argv) and not sys.argv[position].startswith('--'):
+                CLUSTER_BROKER_ADDRESS = sys.argv[position]
+        if '--node-id' in sys.argv:
+            CLUSTER_NODE_ID = sys.argv[sys.argv.index('--node-id') + 1]
+        if '--takeover' in sys.argv:
+            # python main.py --takeover：部署新版本时启动，接管旧进程后旧进程自行退出
+            HANDOFF_TAKEOVER = True
+        main()
\ No newline at end of file